@@ -0,0 +1,52 @@
+"""Compares two benchmark results JSON files saved by run.py
+
+usage:
+    python -m benchmarks.compare benchmarks/results/<old>.json benchmarks/results/<new>.json [--threshold 1.1]
+
+exits with status 1 if a benchmark's min time or peak memory grew by more than threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def compare_results(old_results, new_results, threshold=1.1):
+    """Returns lines describing each benchmark present in both results, and whether any regressed"""
+    lines = []
+    regressed = False
+    for name, new in new_results["benchmarks"].items():
+        old = old_results["benchmarks"].get(name)
+        if old is None:
+            lines.append(f"{name}: new benchmark, min {new['min_s']*1000:.1f}ms")
+            continue
+        time_ratio = new["min_s"]/old["min_s"] if old["min_s"]>0 else float("inf")
+        memory_ratio = new["peak_memory_bytes"]/old["peak_memory_bytes"] if old["peak_memory_bytes"]>0 else float("inf")
+        flag = ""
+        if time_ratio>threshold or memory_ratio>threshold:
+            regressed = True
+            flag = "  REGRESSION"
+        lines.append(
+            f"{name}: time {old['min_s']*1000:.1f}ms -> {new['min_s']*1000:.1f}ms (x{time_ratio:.2f}), " +
+            f"peak memory {old['peak_memory_bytes']/1e6:.1f}MB -> {new['peak_memory_bytes']/1e6:.1f}MB (x{memory_ratio:.2f}){flag}"
+        )
+    return lines, regressed
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="compares two inception_fishing benchmark results")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=1.1, help="ratio above which a benchmark is a regression")
+    args = parser.parse_args(args)
+    with open(args.old, encoding="utf-8") as f:
+        old_results = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new_results = json.load(f)
+    if old_results.get("parameters")!=new_results.get("parameters"):
+        print(f"warning: different parameters\nold: {old_results.get('parameters')}\nnew: {new_results.get('parameters')}")
+    print(f"{old_results.get('commit')} -> {new_results.get('commit')}")
+    lines, regressed = compare_results(old_results, new_results, args.threshold)
+    print("\n".join(lines))
+    return 1 if regressed else 0
+
+if __name__=="__main__":
+    sys.exit(main())
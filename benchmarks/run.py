@@ -0,0 +1,394 @@
+"""Benchmark suite covering the import/export paths of inception_fishing
+
+Runs every registered benchmark on a synthetic corpus (see synthetic.py), measuring wall-clock time over
+several repetitions and peak memory (tracemalloc) over one extra repetition, and saves the results as JSON
+for comparison across commits (see compare.py).
+
+usage:
+    python -m benchmarks.run [--documents 200] [--text-length 5000] [--density 0.1] [--nesting 0.2]
+                             [--repeat 5] [--filter xmi] [--output benchmarks/results/<commit>.json]
+"""
+import argparse
+import atexit
+from datetime import datetime
+import gc
+import json
+from os import path, makedirs
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict
+import xml.etree.ElementTree as ET
+
+from inception_fishing import Corpus
+from inception_fishing.import_export import compressed_io, entity_fishing, inception, transport
+
+from .synthetic import synthetic_corpus
+
+BENCHMARKS:Dict[str, "Benchmark"] = dict()
+DEFAULT_RESULTS_FOLDER = path.join(path.dirname(__file__), "results")
+
+
+class Benchmark:
+    """A benchmark: setup(corpus) prepares an untimed state before each repetition, run(state) is timed
+
+    count: optional function state -> number of items processed by run(state), reported as items_per_s
+    """
+    def __init__(self, name, run:Callable, setup:Callable=None, requires=None, count:Callable=None):
+        self.name = name
+        self.run = run
+        self.setup = setup if setup is not None else (lambda corpus: corpus)
+        self.requires = requires
+        self.count = count
+
+    def is_available(self):
+        if self.requires is None:
+            return True
+        try:
+            __import__(self.requires)
+            return True
+        except ImportError:
+            return False
+
+    def measure(self, corpus:Corpus, repeat):
+        times = []
+        for _ in range(repeat):
+            state = self.setup(corpus)
+            gc.collect()
+            start = time.perf_counter()
+            self.run(state)
+            times.append(time.perf_counter()-start)
+        state = self.setup(corpus)
+        gc.collect()
+        tracemalloc.start()
+        self.run(state)
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result = {
+            "min_s": min(times),
+            "mean_s": sum(times)/len(times),
+            "max_s": max(times),
+            "repeat": repeat,
+            "peak_memory_bytes": peak_memory
+        }
+        if self.count is not None:
+            result["items"] = self.count(state)
+            result["items_per_s"] = result["items"]/result["min_s"] if result["min_s"]>0 else None
+        return result
+
+def benchmark(name, setup=None, requires=None, count=None):
+    """Registers the decorated function as the run of a Benchmark"""
+    def decorator(run):
+        BENCHMARKS[name] = Benchmark(name, run, setup, requires, count)
+        return run
+    return decorator
+
+def clone_corpus(corpus:Corpus):
+    return corpus.__deepcopy__()
+
+# Inception
+# ==============================================
+
+@benchmark("inception_xmi_write")
+def inception_xmi_write(corpus:Corpus):
+    for d in corpus.documents:
+        inception.document_to_xml_string(d, force_single_sentence=True)
+
+def inception_xmi_strings(corpus:Corpus):
+    """XMI strings with newlines escaped in sofaString, as in inception's own exports"""
+    xmi_strings = []
+    for d in corpus.documents:
+        xmi_string = inception.document_to_xml_string(d, force_single_sentence=True)
+        text_start = xmi_string.index('sofaString="')
+        text_end = xmi_string.index('"', text_start+len('sofaString="'))
+        xmi_strings.append((d.name, xmi_string[:text_start]+xmi_string[text_start:text_end].replace("\n", "&#10;")+xmi_string[text_end:]))
+    return xmi_strings
+
+@benchmark("inception_xmi_read", setup=inception_xmi_strings)
+def inception_xmi_read(xmi_strings):
+    for name, xmi_string in xmi_strings:
+        inception.document_from_string(name, xmi_string, named_entity_tag_name="type3:NamedEntity")
+
+# entity-fishing
+# ==============================================
+
+@benchmark("entity_fishing_xml_write")
+def entity_fishing_xml_write(corpus:Corpus):
+    ET.tostring(entity_fishing.corpus_to_xml_tag(corpus, include_grobid_tag=True), encoding="utf-8")
+
+def entity_fishing_xml_string(corpus:Corpus):
+    return ET.tostring(entity_fishing.corpus_to_xml_tag(corpus, include_grobid_tag=True), encoding="utf-8")
+
+@benchmark("entity_fishing_xml_read", setup=entity_fishing_xml_string)
+def entity_fishing_xml_read(xml_string):
+    entity_fishing.corpus_from_tag_and_corpus(ET.fromstring(xml_string))
+
+@benchmark("entity_fishing_json_request_build")
+def entity_fishing_json_request_build(corpus:Corpus):
+    for d in corpus.documents:
+        entity_fishing.document_to_json_request(d, "fr")
+
+def entity_fishing_json_responses(corpus:Corpus):
+    """documents without annotations and the entity-fishing responses that would give back their annotations"""
+    responses = []
+    for d in corpus.documents:
+        response = {
+            "software": "entity-fishing",
+            "runtime": 1000,
+            "nbest": False,
+            "text": d.text,
+            "language": {"lang": "fr", "conf": 1.0},
+            "entities": [
+                {
+                    "rawName": a.mention,
+                    "offsetStart": a.start,
+                    "offsetEnd": a.end,
+                    "confidence_score": 0.5,
+                    "type": a.grobid_tag,
+                    "wikipediaExternalRef": a.wikipedia_page_id,
+                    "wikidataId": a.wikidata_entity_id
+                }
+                for a in d.annotations
+            ]
+        }
+        responses.append((d.__deepcopy__(), json.dumps(response)))
+    for d, _ in responses:
+        d.annotations = []
+    return responses
+
+@benchmark("entity_fishing_json_response_augment", setup=entity_fishing_json_responses)
+def entity_fishing_json_response_augment(documents_and_responses):
+    for d, response in documents_and_responses:
+        entity_fishing.document_augment_from_json_response(d, json.loads(response))
+
+def entity_fishing_replay_transport(corpus:Corpus):
+    """documents without annotations and a ReplayTransport of their recorded entity-fishing responses"""
+    documents_and_responses = entity_fishing_json_responses(corpus)
+    recordings = dict()
+    for d, response in documents_and_responses:
+        body = json.dumps(entity_fishing.document_to_json_request(d, "fr", as_dict=True)).encode("utf-8")
+        recordings[transport.request_fingerprint(body)] = {"status_code": 200, "response": response}
+    return [d for d, _ in documents_and_responses], transport.ReplayTransport(recordings)
+
+@benchmark("entity_fishing_replayed_linking", setup=entity_fishing_replay_transport, count=lambda state: len(state[0]))
+def entity_fishing_replayed_linking(documents_and_transport):
+    """client side of document_named_entity_linking(): request building, replayed response, parsing and augmentation"""
+    documents, replay_transport = documents_and_transport
+    for d in documents:
+        entity_fishing.document_named_entity_linking(d, "fr", transport=replay_transport)
+
+# Document
+# ==============================================
+
+@benchmark("document_replace_regex", setup=clone_corpus)
+def document_replace_regex(corpus:Corpus):
+    for d in corpus.documents:
+        d.replace_regex(r"\bet\b", "and", intersection_behaviour="remove_annotation", warn_on_annotation_removal=False)
+
+@benchmark("document_nesting_level", setup=clone_corpus)
+def document_nesting_level(corpus:Corpus):
+    for d in corpus.documents:
+        d.get_annotations_nesting_level()
+
+# spacy & CLEF-HIPE
+# ==============================================
+
+def spacy_blank_nlp(corpus:Corpus):
+    import spacy
+    return (corpus, spacy.blank("fr"))
+
+@benchmark("spacy_alignment", setup=spacy_blank_nlp, requires="spacy")
+def spacy_alignment(corpus_and_nlp):
+    from inception_fishing.import_export.spacy import document_to_spacy_doc
+    corpus, nlp = corpus_and_nlp
+    for d in corpus.documents:
+        document_to_spacy_doc(d, nlp)
+
+@benchmark("clef_hipe_tsv_export", setup=spacy_blank_nlp, requires="spacy")
+def clef_hipe_tsv_export(corpus_and_nlp):
+    from inception_fishing.import_export.clef_hipe_scorer import corpus_to_conllu_tsv
+    corpus, nlp = corpus_and_nlp
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_to_conllu_tsv(corpus, path.join(tmp_dir, "corpus.tsv"), nlp)
+
+def fast_tokenizer(corpus:Corpus):
+    from inception_fishing.import_export.clef_hipe_scorer import FastTokenizer
+    return (corpus, FastTokenizer())
+
+def tokens_count(corpus_and_tokenizer):
+    from inception_fishing.import_export.clef_hipe_scorer import FastTokenizer, get_tokens_offsets
+    corpus, _ = corpus_and_tokenizer
+    tokenizer = FastTokenizer()
+    return sum(len(get_tokens_offsets(tokenizer, d.text)[0]) for d in corpus.documents)
+
+def tokenize_corpus(corpus_and_tokenizer):
+    from inception_fishing.import_export.clef_hipe_scorer import get_tokens_offsets
+    corpus, tokenizer = corpus_and_tokenizer
+    for d in corpus.documents:
+        get_tokens_offsets(tokenizer, d.text)
+
+# items_per_s of both is tokens/s, counted with the fast tokenizer
+benchmark("tokenizer_fast", setup=fast_tokenizer, count=tokens_count)(tokenize_corpus)
+benchmark("tokenizer_spacy_blank", setup=spacy_blank_nlp, requires="spacy", count=tokens_count)(tokenize_corpus)
+
+@benchmark("clef_hipe_tsv_export_fast_tokenizer", setup=fast_tokenizer)
+def clef_hipe_tsv_export_fast_tokenizer(corpus_and_tokenizer):
+    from inception_fishing.import_export.clef_hipe_scorer import corpus_to_conllu_tsv
+    corpus, tokenizer = corpus_and_tokenizer
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_to_conllu_tsv(corpus, path.join(tmp_dir, "corpus.tsv"), tokenizer)
+
+def spacy_warm_cache(corpus:Corpus):
+    """(corpus, blank nlp, SpacyDocCache holding the docs of all texts)"""
+    from inception_fishing.import_export.spacy_cache import SpacyDocCache
+    corpus, nlp = spacy_blank_nlp(corpus)
+    folder = tempfile.mkdtemp(prefix="inception_fishing_benchmark_")
+    atexit.register(shutil.rmtree, folder, True)
+    cache = SpacyDocCache(folder)
+    for d in corpus.documents:
+        cache.get_doc(d.text, nlp)
+    return (corpus, nlp, cache)
+
+@benchmark("spacy_alignment_cached", setup=spacy_warm_cache, requires="spacy")
+def spacy_alignment_cached(corpus_nlp_and_cache):
+    from inception_fishing.import_export.spacy import document_to_spacy_doc
+    corpus, nlp, cache = corpus_nlp_and_cache
+    for d in corpus.documents:
+        document_to_spacy_doc(d, nlp, cache)
+
+@benchmark("clef_hipe_tsv_export_spacy_cache", setup=spacy_warm_cache, requires="spacy")
+def clef_hipe_tsv_export_spacy_cache(corpus_nlp_and_cache):
+    from inception_fishing.import_export.clef_hipe_scorer import corpus_to_conllu_tsv
+    corpus, nlp, cache = corpus_nlp_and_cache
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_to_conllu_tsv(corpus, path.join(tmp_dir, "corpus.tsv"), nlp, spacy_cache=cache)
+
+# Compressed I/O
+# ==============================================
+
+_xmi_folders = dict()
+def xmi_folder(corpus:Corpus, extension):
+    """folder of the documents XMI files, compressed according to extension, written once per corpus"""
+    key = (id(corpus), extension)
+    if key not in _xmi_folders:
+        folder = tempfile.mkdtemp(prefix="inception_fishing_benchmark_")
+        atexit.register(shutil.rmtree, folder, True)
+        file_names = []
+        for i, d in enumerate(corpus.documents):
+            file_names.append(f"{i}.xmi{extension}")
+            xmi_string = inception.document_to_xml_string(d, force_single_sentence=True, tag_name="custom:Entityfishinglayer")
+            # newlines escaped in sofaString, as in inception's own exports
+            text_start = xmi_string.index('sofaString="')+len('sofaString="')
+            text_end = xmi_string.index('"', text_start)
+            with compressed_io.open_file(path.join(folder, file_names[-1]), "w") as f:
+                f.write(xmi_string[:text_start]+xmi_string[text_start:text_end].replace("\n", "&#10;")+xmi_string[text_end:])
+        _xmi_folders[key] = [path.join(folder, f) for f in file_names]
+    return _xmi_folders[key]
+
+def xmi_files_size(file_paths):
+    return sum(path.getsize(f) for f in file_paths)
+
+def xmi_files_read(file_paths):
+    for f in file_paths:
+        inception.document_from_file(f)
+
+# items_per_s is the bytes/s read from storage: compressed files need that much less bandwidth
+for extension, compression_requires in [("", None), (".gz", None), (".xz", None), (".zst", "zstandard")]:
+    benchmark(
+        f"xmi_files_read{extension.replace('.', '_') or '_plain'}",
+        setup=(lambda extension: lambda corpus: xmi_folder(corpus, extension))(extension),
+        requires=compression_requires,
+        count=xmi_files_size
+    )(xmi_files_read)
+
+# Evaluation
+# ==============================================
+
+def perturbed_predictions(corpus:Corpus):
+    """(gold corpus, predictions): a fifth of the annotations dropped, a fifth shifted by one character, a fifth relinked"""
+    predicted = corpus.__deepcopy__()
+    for d in predicted.documents:
+        d.materialize_annotations()
+        d.annotations = [a for i, a in enumerate(d.annotations) if i%5!=0]
+        for i, a in enumerate(d.annotations):
+            if i%5==1:
+                a.start += 1
+            elif i%5==2:
+                a.wikidata_entity_id = "Q0"
+    return (corpus, predicted)
+
+@benchmark("evaluation_corpus", setup=perturbed_predictions)
+def evaluation_corpus(gold_and_predicted):
+    from inception_fishing import evaluation
+    evaluation.evaluate_corpus(*gold_and_predicted)
+
+# Runner
+# ==============================================
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=path.dirname(__file__), capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(corpus:Corpus, repeat=5, name_filter=None, verbose=True):
+    results = dict()
+    for name, b in BENCHMARKS.items():
+        if name_filter and name_filter not in name:
+            continue
+        if not b.is_available():
+            if verbose:
+                print(f"{name}: skipped, requires {b.requires}")
+            continue
+        results[name] = b.measure(corpus, repeat)
+        if verbose:
+            throughput = f", {results[name]['items_per_s']:.0f} items/s" if results[name].get("items_per_s") is not None else ""
+            print(f"{name}: min {results[name]['min_s']*1000:.1f}ms, mean {results[name]['mean_s']*1000:.1f}ms, peak memory {results[name]['peak_memory_bytes']/1e6:.1f}MB{throughput}")
+    return results
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="inception_fishing benchmark suite")
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--text-length", type=int, default=5000)
+    parser.add_argument("--density", type=float, default=0.1, help="fraction of words starting an annotation")
+    parser.add_argument("--nesting", type=float, default=0.2, help="probability of a nested annotation in multi-word annotations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", default=None, help="only run benchmarks whose name contains this string")
+    parser.add_argument("--output", default=None, help="results JSON file, default: benchmarks/results/<git commit>.json")
+    args = parser.parse_args(args)
+
+    corpus = synthetic_corpus(args.documents, args.text_length, args.density, args.nesting, args.seed)
+    commit = get_git_commit()
+    results = {
+        "commit": commit,
+        "date": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "documents": args.documents,
+            "text_length": args.text_length,
+            "density": args.density,
+            "nesting": args.nesting,
+            "seed": args.seed,
+            "annotations": sum(len(d.annotations) for d in corpus.documents)
+        },
+        "benchmarks": run_benchmarks(corpus, args.repeat, args.filter)
+    }
+    output = args.output
+    if output is None:
+        makedirs(DEFAULT_RESULTS_FOLDER, exist_ok=True)
+        output = path.join(DEFAULT_RESULTS_FOLDER, f"{commit or 'results'}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"results saved to {output}")
+    return results
+
+if __name__=="__main__":
+    main()
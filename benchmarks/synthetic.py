@@ -0,0 +1,85 @@
+"""Synthetic Corpus/Document/Annotation generator for the benchmarks
+
+Documents have configurable text length, annotation density and nesting, without any external data.
+"""
+import random
+from typing import Sequence
+
+from inception_fishing import Annotation, Corpus, Document
+from inception_fishing.import_export.grobid_ner import GROBID_NER_TAGS
+from inception_fishing.utils import ANNOTATION_ORIGIN_ENTITY_FISHING
+
+SYNTHETIC_WORDS = [
+    "Lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do",
+    "eiusmod", "tempor", "incididunt", "ut", "labore", "et", "dolore", "magna", "aliqua", "Genève",
+    "Zürich", "Berne", "Lausanne", "Bâle", "Fribourg", "canton", "abbé", "né", "à", "mort",
+]
+SYNTHETIC_PUNCTUATION = [" ", " ", " ", " ", " ", ", ", ". ", "\n"]
+
+
+def synthetic_text(text_length, rng:random.Random):
+    """Returns a pseudo-text of exactly text_length characters made of words, spaces and punctuation"""
+    parts = []
+    length = 0
+    while length<text_length:
+        word = rng.choice(SYNTHETIC_WORDS)+rng.choice(SYNTHETIC_PUNCTUATION)
+        parts.append(word)
+        length += len(word)
+    return "".join(parts)[:text_length]
+
+def synthetic_annotations(text, annotation_density, nesting, rng:random.Random) -> Sequence[Annotation]:
+    """Returns annotations over the words of text
+
+    annotation_density: fraction of words that start an annotation
+    nesting: probability for an annotation spanning several words to contain a nested annotation on its first word
+    """
+    annotations = []
+    words_spans = []
+    start = None
+    for i, c in enumerate(text):
+        if c.isalnum():
+            if start is None:
+                start = i
+        elif start is not None:
+            words_spans.append((start, i))
+            start = None
+    if start is not None:
+        words_spans.append((start, len(text)))
+    i = 0
+    while i<len(words_spans):
+        if rng.random()<annotation_density:
+            n_words = rng.choice([1, 1, 1, 2, 3])
+            last = min(i+n_words, len(words_spans))-1
+            start, end = words_spans[i][0], words_spans[last][1]
+            annotations.append(synthetic_annotation(text, start, end, rng))
+            if last>i and rng.random()<nesting:
+                annotations.append(synthetic_annotation(text, start, words_spans[i][1], rng))
+            i = last+1
+        else:
+            i += 1
+    return annotations
+
+def synthetic_annotation(text, start, end, rng:random.Random):
+    wikidata_id = rng.randint(1, 100000)
+    return Annotation(
+        start,
+        end,
+        f"Q{wikidata_id}",
+        wikipedia_page_id=str(wikidata_id*7),
+        wikipedia_page_title=text[start:end],
+        mention=text[start:end],
+        grobid_tag=rng.choice(GROBID_NER_TAGS),
+        extra_fields={"origin": ANNOTATION_ORIGIN_ENTITY_FISHING}
+    )
+
+def synthetic_document(name, text_length=5000, annotation_density=0.1, nesting=0.2, seed=0) -> Document:
+    rng = random.Random(f"{seed}-{name}")
+    text = synthetic_text(text_length, rng)
+    return Document(name, synthetic_annotations(text, annotation_density, nesting, rng), text)
+
+def synthetic_corpus(n_documents=100, text_length=5000, annotation_density=0.1, nesting=0.2, seed=0, name="synthetic") -> Corpus:
+    """Returns a reproducible synthetic corpus, see synthetic_document() and synthetic_annotations()"""
+    return Corpus(name, [
+        synthetic_document(f"document{i:06d}.txt", text_length, annotation_density, nesting, seed)
+        for i in range(n_documents)
+    ])
@@ -1,6 +1,5 @@
 
 from __future__ import annotations
-from copy import deepcopy
 import re
 from typing import TYPE_CHECKING
 from warnings import warn
@@ -68,9 +67,9 @@ class Annotation:
             wikipedia_page_title = self.wikipedia_page_title,
             mention = self.mention,
             grobid_tag = self.grobid_tag,
-            extra_fields = deepcopy(self.extra_fields)
+            extra_fields = dict(self.extra_fields)
         )
-    def __deepcopy__(self) -> Annotation:
+    def __deepcopy__(self, memo=None) -> Annotation:
         return self.__copy__()
 
     @staticmethod
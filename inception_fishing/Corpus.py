@@ -1,7 +1,7 @@
-
+# %%
 from __future__ import annotations
 from os import path, listdir
-from typing import Sequence
+from typing import Dict, Iterator, Sequence
 
 import xml.etree.ElementTree as ET
 
@@ -14,14 +14,85 @@ class Corpus:
     def __init__(self, name, documents):
         self.name:str = name
         self.documents:Sequence[Document] = documents
+        self._names_index:Dict[str, Document] = None
+        self._names_index_source:Sequence[Document] = None
+        self._names_index_source_length:int = None
+
+    def _get_names_index(self) -> Dict[str, Document]:
+        """Returns the name->document index, recomputed when self.documents changed (other list or other length)"""
+        if (self._names_index is None) or (self._names_index_source is not self.documents) or (self._names_index_source_length!=len(self.documents)):
+            names_index = dict()
+            for d in self.documents:
+                # keep the first document of a given name, as a linear search would
+                names_index.setdefault(d.name, d)
+            self._names_index = names_index
+            self._names_index_source = self.documents
+            self._names_index_source_length = len(self.documents)
+        return self._names_index
+    def get(self, name, default=None) -> Document:
+        """Returns the document with given name, default if there is none"""
+        return self._get_names_index().get(name, default)
+    def __contains__(self, name):
+        return name in self._get_names_index()
+    def __len__(self):
+        return len(self.documents)
+    def __iter__(self) -> Iterator[Document]:
+        return iter(self.documents)
+
+    def shard(self, n, i) -> Iterator[Document]:
+        """Iterates over the i-th of n interleaved shards of the documents, i in [0, n["""
+        if not (0 <= i < n):
+            raise Exception(f"Corpus.shard({n}, {i}) for corpus {self.name}: shard index i must be in [0, n[")
+        for j in range(i, len(self.documents), n):
+            yield self.documents[j]
+    def batches(self, size) -> Iterator[Sequence[Document]]:
+        """Iterates over consecutive lists of at most size documents"""
+        if size<1:
+            raise Exception(f"Corpus.batches({size}) for corpus {self.name}: size must be at least 1")
+        for start in range(0, len(self.documents), size):
+            yield self.documents[start:start+size]
+
+    def merge(self, other_corpus:Corpus, key="name", skip_duplicates=True, add_missing_documents=False) -> Corpus:
+        """Adds the annotations of other_corpus documents to the documents of self with the same key
+
+        key: Document attribute name or function Document->key used to match documents
+        skip_duplicates: don't add annotations equal to an annotation already in the document
+        add_missing_documents: clones of other_corpus documents without counterpart in self are appended to self.documents
+
+        Added annotations are copies, other_corpus is left untouched.
+        Single pass over each corpus. Modifies self in place, returns it anyway.
+        """
+        get_key = key if callable(key) else (lambda d: getattr(d, key))
+        if key=="name":
+            documents_by_key = self._get_names_index()
+        else:
+            documents_by_key = dict()
+            for d in self.documents:
+                documents_by_key.setdefault(get_key(d), d)
+        missing_documents = []
+        for other_document in other_corpus.documents:
+            document = documents_by_key.get(get_key(other_document))
+            if document is None:
+                if add_missing_documents:
+                    missing_documents.append(other_document.__deepcopy__())
+                continue
+            new_annotations = other_document.annotations
+            if skip_duplicates:
+                existing_annotations = set(document.annotations)
+                new_annotations = [a for a in new_annotations if a not in existing_annotations]
+            document.add_annotations(a.__copy__() for a in new_annotations)
+        if len(missing_documents)>0:
+            self.documents = list(self.documents)+missing_documents
+        return self
 
     def __repr__(self):
         return get_attributes_string(
             "Corpus",
             {"name": self.name,
-            "documents": [d.name for d in self.documents]}
+            "documents": f"{len(self.documents)} documents"}
         )
-    def __deepcopy__(self) -> Corpus:
+    def __deepcopy__(self, memo=None) -> Corpus:
+        """Copy-on-write clone of the corpus, see Document.__deepcopy__()"""
         return Corpus(
             self.name,
             [d.__deepcopy__() for d in self.documents],
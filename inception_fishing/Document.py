@@ -21,6 +21,86 @@ class Document:
         self.annotations:Sequence[Annotation] = annotations
         self.text:str = text
         self.extra_fields:Dict = extra_fields if extra_fields is not None else dict()
+        self._layers:Dict[str, Sequence[Annotation]] = None
+        self._layers_source:Sequence[Annotation] = None
+        self._layers_source_length:int = None
+        self._layers_version:int = None
+        # bumped by the in-place modifications of annotations, see invalidate_layers()
+        self._annotations_version:int = 0
+        self._annotations_shared:bool = False
+
+    def materialize_annotations(self):
+        """Gives the document its own copy of annotations shared with a clone, see __deepcopy__()
+
+        Document methods call it themselves before modifying annotations in place,
+        call it before modifying shared annotations from outside the document.
+        """
+        if self._annotations_shared:
+            self.annotations = [a.__copy__() for a in self.annotations]
+            self._annotations_shared = False
+            self.invalidate_layers()
+    def invalidate_layers(self):
+        """Marks the layers as outdated, to call after modifying annotations in place from outside the document
+
+        e.g. replacing an element of document.annotations, or changing the "origin" or start of an annotation
+        """
+        self._annotations_version += 1
+    def _get_layers(self) -> Dict[str, Sequence[Annotation]]:
+        """Returns the annotations partitioned by their extra_fields "origin", each partition sorted by start
+
+        The partition is computed once and reused until self.annotations is assigned another list, changes length,
+        or is modified in place by a Document method or after invalidate_layers().
+        """
+        if (self._layers is None) or (self._layers_source is not self.annotations) or (self._layers_source_length!=len(self.annotations)) or (self._layers_version!=self._annotations_version):
+            layers = dict()
+            for a in self.annotations:
+                layers.setdefault(a.extra_fields.get("origin"), []).append(a)
+            for layer in layers.values():
+                layer.sort(key=lambda a: a.start)
+            self._layers = layers
+            self._layers_source = self.annotations
+            self._layers_source_length = len(self.annotations)
+            self._layers_version = self._annotations_version
+        return self._layers
+    def get_layer(self, origin):
+        """Returns the annotations whose extra_fields "origin" is origin, sorted by start
+
+        The returned list is shared between calls, do not modify it.
+        """
+        return self._get_layers().get(origin, [])
+    @property
+    def layer_names(self):
+        """origins of the annotations present in the document"""
+        return list(self._get_layers().keys())
+    def get_layers_annotations(self, origins=None) -> Sequence[Annotation]:
+        """Returns the annotations of the given layers (origins), all annotations if origins is None
+
+        A single layer is returned without copy, several layers are concatenated in the given origins order.
+        """
+        if origins is None:
+            return self.annotations
+        if isinstance(origins, str):
+            return self.get_layer(origins)
+        if len(origins)==1:
+            return self.get_layer(origins[0])
+        return [a for o in origins for a in self.get_layer(o)]
+    def add_annotations(self, new_annotations):
+        """Adds new_annotations to the document, updating existing layers incrementally"""
+        new_annotations = list(new_annotations)
+        # layers can be shared with a clone: copy the index and the touched layers only
+        layers = dict(self._get_layers())
+        self.annotations = self.annotations + new_annotations
+        new_annotations_by_origin = dict()
+        for a in new_annotations:
+            new_annotations_by_origin.setdefault(a.extra_fields.get("origin"), []).append(a)
+        for origin, origin_annotations in new_annotations_by_origin.items():
+            # timsort merges the already sorted layer with the new run in linear time
+            layers[origin] = sorted(layers.get(origin, []) + origin_annotations, key=lambda a: a.start)
+        self._layers = layers
+        self._layers_source = self.annotations
+        self._layers_source_length = len(self.annotations)
+        self._layers_version = self._annotations_version
+        return new_annotations
     
     def replace_span(self, start, end, replacement, intersection_behaviour=None, warn_on_annotation_removal=True):
         """Replaces given span in Document text
@@ -66,16 +146,20 @@ class Document:
                 else:
                     raise Exception(f"Document.replace_span({start}, {end}, {replacement}) for doc {self.name} intersects with {a}. Text:\n{self.text}")
         # remove annotations that need to be
-        self.annotations = [
-            a for a in self.annotations
-            if a not in annotations_to_remove
-        ]
+        if len(annotations_to_remove)>0:
+            self.annotations = [
+                a for a in self.annotations
+                if a not in annotations_to_remove
+            ]
         # shift annotations that are after the replacements
+        if annotation_indexation_shift!=0 and any(a.end >= end for a in self.annotations):
+            self.materialize_annotations()
         for a in self.annotations:
             if a.start >= end:
                 a.start += annotation_indexation_shift
             if a.end >= end:
                 a.end += annotation_indexation_shift
+        self.invalidate_layers()
         self.text=new_text
         return (start, old_span_content, replacement, annotation_indexation_shift)
 
@@ -121,6 +205,7 @@ class Document:
             for incremental_match in reversed_incremental_matches
         ]
     def update_mentions(self):
+        self.materialize_annotations()
         for a in self.annotations:
             a.set_mention(self)
     def get_annotations_nesting_level(self):
@@ -130,7 +215,10 @@ class Document:
         }
         if len(self.annotations) <= 1:
             return nesting_levels
-        self.annotations.sort(key=lambda a: a.start)
+        if self._annotations_shared:
+            self.annotations = sorted(self.annotations, key=lambda a: a.start)
+        else:
+            self.annotations.sort(key=lambda a: a.start)
         for i,a in enumerate(self.annotations[:-1]):
             for a2 in self.annotations[i+1:]:
                 if a2.start<a.end:
@@ -150,11 +238,27 @@ class Document:
         #attr_dict["annotations"] = len()
         #return get_attributes_string("Document",self.__dict__)
         return repr
-    def __deepcopy__(self) -> Document:
-        return Document(
+    def __deepcopy__(self, memo=None) -> Document:
+        """Copy-on-write clone of the document
+
+        the clone gets its own annotations list, the Annotation objects, text and layers being shared until either
+        document modifies its annotations in place, see materialize_annotations(). extra_fields are copied one level deep,
+        nested values are shared.
+        """
+        clone = Document(
             self.name,
-            [a.__deepcopy__() for a in self.annotations],
-            self.text
+            list(self.annotations),
+            self.text,
+            dict(self.extra_fields)
         )
+        self._annotations_shared = True
+        clone._annotations_shared = True
+        clone._annotations_version = self._annotations_version
+        if self._layers_source is self.annotations:
+            clone._layers = self._layers
+            clone._layers_source = clone.annotations
+            clone._layers_source_length = self._layers_source_length
+            clone._layers_version = self._layers_version
+        return clone
 
 # %%
\ No newline at end of file
@@ -9,5 +9,10 @@ from .import_export import dhs_article
 from .import_export import grobid_ner
 from .import_export import wikipedia
 from .import_export import spacy
+from .import_export import native
+from .import_export import gazetteer
+from . import instrumentation
+from . import evaluation
+from . import diff
 
-from .utils import ANNOTATION_ORIGIN_DHS_ARTICLE_TITLE, ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_BLOCK, ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_LINK, ANNOTATION_ORIGIN_ENTITY_FISHING
\ No newline at end of file
+from .utils import ANNOTATION_ORIGIN_DHS_ARTICLE_TITLE, ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_BLOCK, ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_LINK, ANNOTATION_ORIGIN_ENTITY_FISHING, ANNOTATION_ORIGIN_SPACY_TOKEN, ANNOTATION_ORIGIN_CLEF_HIPE, ANNOTATION_ORIGIN_GAZETTEER
\ No newline at end of file
@@ -0,0 +1,375 @@
+"""inception-fishing command line
+
+    inception-fishing convert --from ef-xml|xmi-dir|xmi-zip|dhs|hipe-tsv INPUT --to xmi-dir|xmi-zip|ef-xml|hipe-tsv|native OUTPUT [-j N]
+    inception-fishing import-dumps [--wikipedia LANG PAGE_DUMP [PAGE_PROPS_DUMP]]... [--wikidata DUMP --languages fr de ...]
+    inception-fishing loadgen --from ef-xml|xmi-dir|xmi-zip|dhs|hipe-tsv INPUT [--url URL] [--qps Q] [--concurrency N] [--requests N | --duration S] [--record RECORDINGS]
+    inception-fishing replay-server RECORDINGS [--port 8090] [--latency SPEC]
+
+Documents are streamed from the reader to the writer. With -j N, documents are parsed and converted by a pool
+of N worker processes, the main process only gathers the results and writes the single-file outputs.
+"""
+from __future__ import annotations
+import argparse
+from importlib import import_module
+from multiprocessing import Pool
+from os import path, listdir, makedirs
+import sys
+import time
+import xml.etree.ElementTree as ET
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from .Corpus import Corpus
+from .import_export import entity_fishing, inception, clef_hipe_scorer, native
+from .import_export.compressed_io import open_file
+
+
+DEFAULT_DHS_ARTICLES_LOADER = "dhs_scraper:DhsArticle.load_articles_from_jsonl"
+
+# Readers
+# ==============================================
+# a reader yields picklable sources, a loader turns a source into a Document (possibly in a worker process)
+
+def ef_xml_sources(args):
+    """entity-fishing XML documents tags, as bytes, streamed with iterparse"""
+    with open_file(args.input, "rb") as file:
+        for event, elem in ET.iterparse(file, events=("start", "end")):
+            if event=="start" and args.corpus_name is None:
+                args.corpus_name = elem.tag.replace(".entityAnnotation", "")
+            elif event=="end" and elem.tag=="document":
+                yield ET.tostring(elem)
+                elem.clear()
+
+def ef_xml_load(source, args):
+    return entity_fishing.document_from_tag(ET.fromstring(source), args.text_folder)
+
+def xmi_dir_sources(args):
+    """inception's <document>/<user>.xmi files paths, with the document names"""
+    if args.user is None:
+        raise Exception("inception-fishing convert --from xmi-dir requires --user, the inception user name of the .xmi files")
+    for dd in sorted(listdir(args.input)):
+        if path.isdir(path.join(args.input, dd)):
+            yield (path.join(args.input, dd, args.user+".xmi"), dd)
+
+def xmi_dir_load(source, args):
+    file_path, document_name = source
+    return inception.document_from_file(
+        file_path,
+        document_name,
+        named_entity_tag_name=args.xmi_tag_name,
+        identifier_attribute_name=args.identifier_attribute_name
+    )
+
+def xmi_zip_sources(args):
+    """(document name, XMI string) of an inception project export zip, read without extraction"""
+    if args.user is None:
+        raise Exception("inception-fishing convert --from xmi-zip requires --user, the inception user name (CURATION_USER for curated documents)")
+    if args.corpus_name is None:
+        args.corpus_name = path.splitext(path.basename(args.input))[0]
+    folder = inception.INCEPTION_EXPORT_CURATION_FOLDER if args.user==inception.INCEPTION_CURATION_USER else inception.INCEPTION_EXPORT_ANNOTATION_FOLDER
+    with ZipFile(args.input) as zip_file:
+        for name, member in inception.inception_export_zip_members(zip_file, args.user, folder):
+            yield (name, inception.read_inception_export_zip_member(zip_file, member))
+
+def xmi_zip_load(source, args):
+    name, xmi_string = source
+    return inception.document_from_string(
+        name,
+        xmi_string,
+        named_entity_tag_name=args.xmi_tag_name,
+        identifier_attribute_name=args.identifier_attribute_name
+    )
+
+def get_dhs_articles_loader(loader_path):
+    """Returns the function from a "module:attribute.path" string"""
+    module_name, attribute_path = loader_path.split(":")
+    loader = import_module(module_name)
+    for attribute in attribute_path.split("."):
+        loader = getattr(loader, attribute)
+    return loader
+
+def dhs_sources(args):
+    """dhs_articles loaded by the --dhs-loader function from the input file"""
+    try:
+        loader = get_dhs_articles_loader(args.dhs_loader)
+    except (ImportError, AttributeError) as e:
+        raise Exception(f"inception-fishing convert --from dhs: unable to load dhs articles loader '{args.dhs_loader}', install dhs_scraper or give another loader with --dhs-loader.") from e
+    yield from loader(args.input)
+
+def dhs_load(source, args):
+    from .import_export import dhs_article
+    return dhs_article.document_from_dhs_article(source)
+
+def hipe_tsv_sources(args):
+    """Documents of a CLEF-HIPE tsv file, streamed line by line"""
+    if args.corpus_name is None:
+        args.corpus_name = path.splitext(path.basename(args.input))[0]
+    yield from clef_hipe_scorer.documents_from_conllu_tsv(args.input)
+
+def hipe_tsv_load(source, args):
+    return source
+
+READERS = {
+    "ef-xml": (ef_xml_sources, ef_xml_load),
+    "xmi-dir": (xmi_dir_sources, xmi_dir_load),
+    "xmi-zip": (xmi_zip_sources, xmi_zip_load),
+    "dhs": (dhs_sources, dhs_load),
+    "hipe-tsv": (hipe_tsv_sources, hipe_tsv_load),
+}
+
+# Writers
+# ==============================================
+# a writer processes each Document into a picklable result (possibly in a worker process),
+# then writes the results in the main process
+
+def xmi_dir_process(document, args):
+    inception.document_to_xml_file(
+        document,
+        args.output,
+        force_single_sentence=args.force_single_sentence,
+        tag_name=args.xmi_tag_name,
+        identifier_attribute_name=args.identifier_attribute_name
+    )
+    return None
+
+def xmi_dir_write(results, args):
+    for _ in results:
+        pass
+
+def xmi_zip_process(document, args):
+    # compressed here, in the worker processes, where inception.zip_write_deflated() is supported
+    to_xml = inception.document_to_deflated_xml if inception.zip_write_deflated_supported() else inception.document_to_xml_bytes
+    return to_xml(
+        document,
+        force_single_sentence=args.force_single_sentence,
+        tag_name=args.xmi_tag_name,
+        identifier_attribute_name=args.identifier_attribute_name
+    )
+
+def xmi_zip_write(results, args):
+    with ZipFile(args.output, "w", ZIP_DEFLATED) as zip_file:
+        if inception.zip_write_deflated_supported():
+            for name, deflated, crc, size in results:
+                inception.zip_write_deflated(zip_file, name, deflated, crc, size)
+        else:
+            for name, content in results:
+                zip_file.writestr(name, content)
+
+def ef_xml_process(document, args):
+    return ET.tostring(entity_fishing.document_to_xml_tag(document, include_grobid_tag=True), encoding="utf-8").decode("utf-8")
+
+def ef_xml_write(results, args):
+    with open_file(args.output, "w") as file:
+        file.write('<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n')
+        root_tag_written = False
+        for document_tag in results:
+            if not root_tag_written:
+                # corpus name is known once the reader started
+                file.write(f"<{args.corpus_name or 'corpus'}.entityAnnotation>")
+                root_tag_written = True
+            file.write(document_tag)
+        if not root_tag_written:
+            file.write(f"<{args.corpus_name or 'corpus'}.entityAnnotation>")
+        file.write(f"</{args.corpus_name or 'corpus'}.entityAnnotation>")
+
+_spacy_nlp = None
+def get_spacy_nlp(args):
+    global _spacy_nlp
+    if _spacy_nlp is None:
+        import spacy
+        _spacy_nlp = spacy.load(args.spacy_model) if args.spacy_model else spacy.blank(args.language)
+    return _spacy_nlp
+
+_spacy_cache = None
+def get_spacy_cache(args):
+    """SpacyDocCache of --spacy-cache, None without it"""
+    global _spacy_cache
+    if _spacy_cache is None and args.spacy_cache is not None:
+        from .import_export.spacy_cache import SpacyDocCache
+        _spacy_cache = SpacyDocCache(args.spacy_cache, args.spacy_cache_size*1024*1024)
+    return _spacy_cache
+
+def get_hipe_tokenizer(args):
+    if args.tokenizer=="fast":
+        return clef_hipe_scorer.FastTokenizer()
+    return get_spacy_nlp(args)
+
+def hipe_tsv_process(document, args):
+    return (document.name, clef_hipe_scorer.document_to_conllu_tsv(document, get_hipe_tokenizer(args), language=args.language, spacy_cache=get_spacy_cache(args)))
+
+def hipe_tsv_write(results, args):
+    doc_tsv_separator = "\n"+(2*"									\n")
+    # same alphabetical document order as clef_hipe_scorer.corpus_to_conllu_tsv()
+    tsv_docs = [tsv for name, tsv in sorted(results, key=lambda x: x[0])]
+    with open_file(args.output, "w") as file:
+        file.write("\t".join(clef_hipe_scorer.clef_hipe_scorer_tsv_columns)+"\n"+doc_tsv_separator.join(tsv_docs))
+
+def native_process(document, args):
+    return document
+
+def native_write(results, args):
+    documents = list(results)
+    native.corpus_to_native(Corpus(args.corpus_name or path.basename(path.normpath(args.input)), documents), args.output)
+
+WRITERS = {
+    "xmi-dir": (xmi_dir_process, xmi_dir_write),
+    "xmi-zip": (xmi_zip_process, xmi_zip_write),
+    "ef-xml": (ef_xml_process, ef_xml_write),
+    "hipe-tsv": (hipe_tsv_process, hipe_tsv_write),
+    "native": (native_process, native_write),
+}
+
+# Conversion
+# ==============================================
+
+_worker_args = None
+def _init_worker(args):
+    global _worker_args
+    _worker_args = args
+
+def _convert_source(source):
+    """loads and processes one source, returns the writer's result and the document's size statistics"""
+    args = _worker_args
+    document = READERS[args.from_format][1](source, args)
+    result = WRITERS[args.to_format][0](document, args)
+    return result, (len(document.text) if document.text is not None else 0), len(document.annotations)
+
+def convert(args):
+    """Streams documents from the reader to the writer, returns throughput statistics"""
+    if args.to_format=="xmi-dir":
+        makedirs(args.output, exist_ok=True)
+    sources = READERS[args.from_format][0](args)
+    statistics = {"documents": 0, "characters": 0, "annotations": 0}
+    def results_with_statistics(converted):
+        for result, n_characters, n_annotations in converted:
+            statistics["documents"] += 1
+            statistics["characters"] += n_characters
+            statistics["annotations"] += n_annotations
+            yield result
+    start = time.perf_counter()
+    if args.jobs>1:
+        with Pool(args.jobs, initializer=_init_worker, initargs=(args,)) as pool:
+            WRITERS[args.to_format][1](results_with_statistics(pool.imap(_convert_source, sources, chunksize=args.chunksize)), args)
+    else:
+        _init_worker(args)
+        WRITERS[args.to_format][1](results_with_statistics(map(_convert_source, sources)), args)
+    statistics["seconds"] = time.perf_counter()-start
+    return statistics
+
+def get_throughput_report(statistics):
+    seconds = max(statistics["seconds"], 1e-9)
+    return f"converted {statistics['documents']} documents ({statistics['annotations']} annotations, {statistics['characters']} characters) " + \
+        f"in {statistics['seconds']:.2f}s: {statistics['documents']/seconds:.1f} documents/s, " + \
+        f"{statistics['annotations']/seconds:.1f} annotations/s, {statistics['characters']/seconds/1e6:.2f}M characters/s"
+
+# Dumps import
+# ==============================================
+
+def import_dumps(args):
+    """Imports wikipedia/wikidata dumps into the wikipedia titles and ids caches"""
+    from .import_export import wikipedia_dumps
+    for wikipedia_dump in args.wikipedia or []:
+        if len(wikipedia_dump) not in (2, 3):
+            raise Exception("inception-fishing import-dumps --wikipedia LANG PAGE_DUMP [PAGE_PROPS_DUMP]")
+        n_pages, n_wikidata_ids = wikipedia_dumps.import_wikipedia_dumps(*wikipedia_dump, chunk_size=args.chunk_size)
+        print(f"{wikipedia_dump[0]} wikipedia: imported {n_pages} page ids and {n_wikidata_ids} wikidata ids", file=sys.stderr)
+    if args.wikidata is not None:
+        if not args.languages:
+            raise Exception("inception-fishing import-dumps --wikidata requires --languages")
+        n_sitelinks = wikipedia_dumps.import_wikidata_dump(args.wikidata, args.languages, chunk_size=args.chunk_size)
+        print(f"wikidata: imported {n_sitelinks} wikipedia page titles", file=sys.stderr)
+
+# Load generation
+# ==============================================
+
+def generate_load(args):
+    """Sends the documents of the input to entity-fishing at the given rate or concurrency, returns the load report"""
+    from .import_export import loadgen, transport
+    sources, load = READERS[args.from_format]
+    documents = [load(source, args) for source in sources(args)]
+    recorder = transport.RecordingTransport(args.record) if args.record is not None else None
+    try:
+        return loadgen.run_load(
+            documents, args.language,
+            n_requests=args.requests, duration=args.duration, concurrency=args.concurrency, qps=args.qps,
+            entity_fishing_base_url=args.url, entity_fishing_timeout=args.timeout, transport=recorder,
+        )
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+def serve_replay(args):
+    from .import_export import replay_server
+    print(f"replaying {args.recordings} on http://{args.host}:{args.port}", file=sys.stderr)
+    replay_server.serve_replay(args.recordings, args.host, args.port, args.latency, args.unknown_empty, args.seed)
+
+# Command line
+# ==============================================
+
+def add_reader_arguments(parser):
+    parser.add_argument("--from", dest="from_format", choices=list(READERS.keys()), required=True)
+    parser.add_argument("input", help="ef-xml: entity-fishing XML file, xmi-dir: inception annotation directory, xmi-zip: inception project export zip, dhs: dhs articles file, hipe-tsv: CLEF-HIPE tsv file")
+    parser.add_argument("--corpus-name", default=None, help="default: from the input")
+    parser.add_argument("--text-folder", default=None, help="ef-xml: folder of the documents raw texts")
+    parser.add_argument("--user", default=None, help="xmi-dir, xmi-zip: inception user whose annotations are read, xmi-zip: CURATION_USER for the curated documents")
+    parser.add_argument("--xmi-tag-name", default="custom:Entityfishinglayer", help="inception named entity tag name")
+    parser.add_argument("--identifier-attribute-name", default="wikidataidentifier", help="inception named entity wikidata identifier attribute name")
+    parser.add_argument("--dhs-loader", default=DEFAULT_DHS_ARTICLES_LOADER, help="dhs: 'module:function' loading dhs articles from the input file")
+    parser.add_argument("--language", default="fr")
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog="inception-fishing", description="Corpus conversions between entity-fishing, inception, dhs articles, CLEF-HIPE and the native format")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser("convert", help="convert a corpus from one format to another")
+    add_reader_arguments(convert_parser)
+    convert_parser.add_argument("--to", dest="to_format", choices=list(WRITERS.keys()), required=True)
+    convert_parser.add_argument("output", help="xmi-dir and native: output directory, xmi-zip: inception import zip, ef-xml and hipe-tsv: output file")
+    convert_parser.add_argument("-j", "--jobs", type=int, default=1, help="number of worker processes")
+    convert_parser.add_argument("--chunksize", type=int, default=16, help="documents sent at once to a worker process")
+    convert_parser.add_argument("--force-single-sentence", action="store_true", help="xmi-dir, xmi-zip: whole documents as single inception sentences")
+    convert_parser.add_argument("--tokenizer", choices=["spacy", "fast"], default="spacy", help="hipe-tsv: spacy pipeline or built-in regex tokenizer, without any spacy model to load")
+    convert_parser.add_argument("--spacy-model", default=None, help="hipe-tsv: spacy model for tokenization, default: blank spacy pipeline of --language")
+    convert_parser.add_argument("--spacy-cache", default=None, help="hipe-tsv: folder caching the spacy docs of the texts, to skip the spacy pipeline on the next exports")
+    convert_parser.add_argument("--spacy-cache-size", type=int, default=1024, help="--spacy-cache: maximum size in MB, least recently used docs being evicted beyond")
+
+    import_dumps_parser = subparsers.add_parser("import-dumps", help="fill the wikipedia titles and ids caches from wikipedia/wikidata dumps")
+    import_dumps_parser.add_argument("--wikipedia", nargs="+", action="append", metavar="LANG PAGE_DUMP [PAGE_PROPS_DUMP]", help="wikipedia page.sql(.gz) dump of language LANG, and its page_props.sql(.gz) dump for wikidata ids")
+    import_dumps_parser.add_argument("--wikidata", default=None, help="wikidata JSON dump (.json, .json.gz or .json.bz2)")
+    import_dumps_parser.add_argument("--languages", nargs="+", default=None, help="--wikidata: languages of the wikipedia titles to import")
+    import_dumps_parser.add_argument("--chunk-size", type=int, default=100000, help="rows per parsed dataframe")
+
+    loadgen_parser = subparsers.add_parser("loadgen", help="send the documents of a corpus to entity-fishing at a target rate or concurrency, report throughput and latency percentiles")
+    add_reader_arguments(loadgen_parser)
+    loadgen_parser.add_argument("--url", default=entity_fishing.entity_fishing_default_base_url, help="entity-fishing (or replay-server) base url")
+    loadgen_parser.add_argument("--concurrency", type=int, default=8, help="number of concurrent clients")
+    loadgen_parser.add_argument("--qps", type=float, default=None, help="open loop at QPS requests per second, default: closed loop, each client sending its next request when the previous one is answered")
+    loadgen_parser.add_argument("--requests", type=int, default=None, help="number of requests, documents being cycled through, default: one per document (unlimited with --duration)")
+    loadgen_parser.add_argument("--duration", type=float, default=None, help="seconds after which no request is sent anymore")
+    loadgen_parser.add_argument("--timeout", type=float, default=60, help="request timeout in seconds")
+    loadgen_parser.add_argument("--record", default=None, help="jsonl(.gz) file the request/response pairs are appended to, for replay-server")
+
+    replay_server_parser = subparsers.add_parser("replay-server", help="serve recorded entity-fishing responses on /service/disambiguate")
+    replay_server_parser.add_argument("recordings", help="jsonl(.gz) recordings file, see loadgen --record and transport.RecordingTransport")
+    replay_server_parser.add_argument("--host", default="127.0.0.1")
+    replay_server_parser.add_argument("--port", type=int, default=8090)
+    replay_server_parser.add_argument("--latency", default="recorded", help="recorded, none, constant:S, scaled:F, uniform:A,B, normal:MEAN,STD, lognormal:MEDIAN,SIGMA or exponential:MEAN (seconds)")
+    replay_server_parser.add_argument("--unknown-empty", action="store_true", help="answer unrecorded requests with no entities instead of a 404")
+    replay_server_parser.add_argument("--seed", type=int, default=None, help="random seed of the latencies")
+    return parser
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    if args.command=="convert":
+        statistics = convert(args)
+        print(get_throughput_report(statistics), file=sys.stderr)
+    elif args.command=="import-dumps":
+        import_dumps(args)
+    elif args.command=="loadgen":
+        from .import_export.loadgen import get_load_report
+        print(get_load_report(generate_load(args)), file=sys.stderr)
+    elif args.command=="replay-server":
+        serve_replay(args)
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""Annotation diff between two versions of a corpus, e.g. an inception curated export against the entity-fishing output it started from
+
+Documents are matched by name and their annotations compared on the same text, by successive passes over the two
+annotation lists sorted by (start, end, wikidata id, grobid tag), in O(n log n + p log p), p overlapping pairs in step 3:
+1. identical annotations: unchanged
+2. same span: relinked (other wikidata_entity_id), or retagged (same wikidata id, other grobid_tag)
+3. overlapping spans: boundary_changed, pairing first the annotations of the same wikidata id, then of largest overlap
+4. the rest: removed (old annotations) and added (new annotations)
+
+A diff is a list of (change, old annotation, new annotation) tuples, None standing for the missing side of added and
+removed annotations. It can be written as a columnar table (diff_to_dataframe()) or as inception XMI, the changes
+being annotations of a diff layer (document_diff_to_xml_string()).
+"""
+from __future__ import annotations
+from os import path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from .Annotation import Annotation
+from .Corpus import Corpus
+from .Document import Document
+from .instrumentation import timed
+from .import_export import inception
+from .import_export.compressed_io import open_file
+
+
+DIFF_UNCHANGED = "unchanged"
+DIFF_RELINKED = "relinked"
+DIFF_RETAGGED = "retagged"
+DIFF_BOUNDARY_CHANGED = "boundary_changed"
+DIFF_ADDED = "added"
+DIFF_REMOVED = "removed"
+DIFF_CHANGES = [DIFF_ADDED, DIFF_REMOVED, DIFF_BOUNDARY_CHANGED, DIFF_RELINKED, DIFF_RETAGGED]
+
+# inception custom layer of the changes, its "change" feature holding the change type
+DIFF_LAYER_TAG_NAME = "custom:Difflayer"
+DIFF_LAYER_CHANGE_ATTRIBUTE_NAME = "change"
+DIFF_LAYER_IDENTIFIER_ATTRIBUTE_NAME = "wikidataidentifier"
+
+AnnotationChange = Tuple[str, Optional[Annotation], Optional[Annotation]]
+
+
+# Annotation
+# ==============================================
+
+def _annotation_sort_key(annotation:Annotation):
+    return (annotation.start, annotation.end, annotation.wikidata_entity_id or "", annotation.grobid_tag or "")
+
+def _sort_merge(old:Sequence[Annotation], new:Sequence[Annotation], key:Callable):
+    """(old, new) pairs of equal keys, and the unpaired old and new annotations, of lists sorted by key"""
+    pairs, old_rest, new_rest = [], [], []
+    i, j = 0, 0
+    while i<len(old) and j<len(new):
+        old_key, new_key = key(old[i]), key(new[j])
+        if old_key==new_key:
+            pairs.append((old[i], new[j]))
+            i += 1
+            j += 1
+        elif old_key<new_key:
+            old_rest.append(old[i])
+            i += 1
+        else:
+            new_rest.append(new[j])
+            j += 1
+    return pairs, old_rest+list(old[i:]), new_rest+list(new[j:])
+
+def _overlapping_pairs(old:Sequence[Annotation], new:Sequence[Annotation]) -> List[Tuple[int, int]]:
+    """(old index, new index) of all the overlapping annotations of lists sorted by start, by a sweep over their starts"""
+    pairs = []
+    # indices of the annotations started so far whose end may still overlap the next ones
+    active_old, active_new = [], []
+    i, j = 0, 0
+    while i<len(old) or j<len(new):
+        if j>=len(new) or (i<len(old) and old[i].start<=new[j].start):
+            a = old[i]
+            active_new = [k for k in active_new if new[k].end>a.start]
+            pairs += [(i, k) for k in active_new if a.end>new[k].start]
+            active_old.append(i)
+            i += 1
+        else:
+            a = new[j]
+            active_old = [k for k in active_old if old[k].end>a.start]
+            pairs += [(k, j) for k in active_old if a.end>old[k].start]
+            active_new.append(j)
+            j += 1
+    return pairs
+
+def _overlap_merge(old:Sequence[Annotation], new:Sequence[Annotation]):
+    """(old, new) pairs of overlapping annotations, each paired at most once, and the unpaired ones, of lists sorted by start
+
+    pairs of the same wikidata id are preferred, then the ones of largest overlap, then of closest boundaries,
+    so that the nested annotations of a long one are paired with their own new versions
+    """
+    def preference(pair):
+        o, n = old[pair[0]], new[pair[1]]
+        return (
+            o.wikidata_entity_id!=n.wikidata_entity_id,
+            -(min(o.end, n.end)-max(o.start, n.start)),
+            abs(o.start-n.start)+abs(o.end-n.end),
+            pair
+        )
+    paired_old, paired_new = set(), set()
+    pairs = []
+    for i, j in sorted(_overlapping_pairs(old, new), key=preference):
+        if i not in paired_old and j not in paired_new:
+            paired_old.add(i)
+            paired_new.add(j)
+            pairs.append((old[i], new[j]))
+    return (
+        pairs,
+        [a for i, a in enumerate(old) if i not in paired_old],
+        [a for j, a in enumerate(new) if j not in paired_new]
+    )
+
+# Documents
+# ==============================================
+
+def annotations_diff(old_annotations:Sequence[Annotation], new_annotations:Sequence[Annotation], include_unchanged=False) -> List[AnnotationChange]:
+    """Changes from old_annotations to new_annotations, sorted by start of the annotations"""
+    old = sorted(old_annotations, key=_annotation_sort_key)
+    new = sorted(new_annotations, key=_annotation_sort_key)
+    unchanged, old, new = _sort_merge(old, new, _annotation_sort_key)
+    same_span, old, new = _sort_merge(old, new, lambda a: (a.start, a.end))
+    boundary_changed, old, new = _overlap_merge(old, new)
+    changes = [(DIFF_UNCHANGED, o, n) for o, n in unchanged] if include_unchanged else []
+    changes += [(DIFF_RELINKED if o.wikidata_entity_id!=n.wikidata_entity_id else DIFF_RETAGGED, o, n) for o, n in same_span]
+    changes += [(DIFF_BOUNDARY_CHANGED, o, n) for o, n in boundary_changed]
+    changes += [(DIFF_REMOVED, o, None) for o in old]
+    changes += [(DIFF_ADDED, None, n) for n in new]
+    return sorted(changes, key=lambda c: (c[2] or c[1]).start)
+
+def document_diff(old_document:Document, new_document:Document, layers=None, include_unchanged=False) -> List[AnnotationChange]:
+    """Changes from the annotations of old_document to the ones of new_document (None: document without annotations)
+
+    layers: origins of the compared annotations, all annotations if None
+    """
+    return annotations_diff(
+        old_document.get_layers_annotations(layers) if old_document is not None else [],
+        new_document.get_layers_annotations(layers) if new_document is not None else [],
+        include_unchanged
+    )
+
+def document_diff_to_xml_string(name, changes:Sequence[AnnotationChange], text, include_unchanged=False, **document_to_xml_string_kwargs) -> str:
+    """Inception XMI of text with a diff layer: one annotation per change, on the new span (old span of removed annotations)
+
+    the change type is in the DIFF_LAYER_CHANGE_ATTRIBUTE_NAME feature, the new wikidata id (old one of removed annotations) in the identifier
+    """
+    diff_annotations = [
+        Annotation((n or o).start, (n or o).end, (n or o).wikidata_entity_id, grobid_tag=change)
+        for change, o, n in changes
+        if include_unchanged or change!=DIFF_UNCHANGED
+    ]
+    return inception.document_to_xml_string(
+        Document(name, diff_annotations, text),
+        tag_name=DIFF_LAYER_TAG_NAME,
+        identifier_attribute_name=DIFF_LAYER_IDENTIFIER_ATTRIBUTE_NAME,
+        grobid_tag_attribute_name=DIFF_LAYER_CHANGE_ATTRIBUTE_NAME,
+        **document_to_xml_string_kwargs
+    )
+
+# Corpus
+# ==============================================
+
+@timed()
+def corpus_diff(old_corpus:Corpus, new_corpus:Corpus, layers=None, include_unchanged=False) -> Dict[str, List[AnnotationChange]]:
+    """document name -> changes from the annotations of old_corpus to the ones of new_corpus, documents being matched by name
+
+    documents of a single corpus have all their annotations added (new_corpus) or removed (old_corpus)
+    """
+    diffs = dict()
+    for old_document in old_corpus.documents:
+        diffs[old_document.name] = document_diff(old_document, new_corpus.get(old_document.name), layers, include_unchanged)
+    for new_document in new_corpus.documents:
+        if new_document.name not in diffs:
+            diffs[new_document.name] = document_diff(None, new_document, layers, include_unchanged)
+    return diffs
+
+def diff_to_dataframe(diffs:Dict[str, Sequence[AnnotationChange]]) -> pd.DataFrame:
+    """One row per change: document, change, and the start, end, wikidata id and grobid tag of the old and new annotations"""
+    columns = {c: [] for c in [
+        "document", "change",
+        "old_start", "old_end", "new_start", "new_end",
+        "old_wikidata_entity_id", "new_wikidata_entity_id",
+        "old_grobid_tag", "new_grobid_tag"
+    ]}
+    for name, changes in diffs.items():
+        for change, o, n in changes:
+            columns["document"].append(name)
+            columns["change"].append(change)
+            for side, a in (("old", o), ("new", n)):
+                columns[side+"_start"].append(a.start if a is not None else None)
+                columns[side+"_end"].append(a.end if a is not None else None)
+                columns[side+"_wikidata_entity_id"].append(a.wikidata_entity_id if a is not None else None)
+                columns[side+"_grobid_tag"].append(a.grobid_tag if a is not None else None)
+    dtf = pd.DataFrame(columns)
+    for c in ["old_start", "old_end", "new_start", "new_end"]:
+        dtf[c] = dtf[c].astype("Int64")
+    dtf["change"] = dtf["change"].astype("category")
+    return dtf
+
+def corpus_diff_to_xml_files(diffs:Dict[str, Sequence[AnnotationChange]], new_corpus:Corpus, folder, old_corpus:Corpus=None, **document_diff_to_xml_string_kwargs):
+    """Writes the inception XMI with a diff layer of each document of diffs in folder, texts taken from new_corpus (or old_corpus)"""
+    for name, changes in diffs.items():
+        document = new_corpus.get(name)
+        if document is None and old_corpus is not None:
+            document = old_corpus.get(name)
+        if document is None:
+            raise Exception(f"inception_fishing.diff.corpus_diff_to_xml_files(): no text for document {name}, give old_corpus for removed documents")
+        with open_file(path.join(folder, name), "w") as outfile:
+            outfile.write(document_diff_to_xml_string(name, changes, document.text, **document_diff_to_xml_string_kwargs))
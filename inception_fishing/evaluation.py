@@ -0,0 +1,262 @@
+"""In-process NER and NEL evaluation of a predicted corpus against a gold corpus
+
+Documents are matched by name: predicted documents absent from the gold corpus are ignored, gold documents absent
+from the predicted corpus count as documents without predictions.
+The annotations of all documents are gathered in flat arrays, each (document, label) group being shifted to its own
+range of offsets, so that matching is a few sorted-array operations over the whole corpus instead of pairwise
+annotation comparisons:
+- strict: a predicted annotation matches a gold annotation with the same start, end and grobid_tag
+- fuzzy: a predicted annotation matches a gold annotation it overlaps, with the same grobid_tag
+- nel: strict span match with the same wikidata_entity_id, over the annotations with a wikidata id
+- nel accuracy: fraction of the gold annotations with a wikidata id, strictly matched by the span of a predicted
+    annotation, whose predicted wikidata id is the same
+
+Matching is one-to-one: each annotation matches at most one annotation of the other side, duplicated predictions
+of a gold annotation counting as false positives.
+precision = matched predicted / predicted, recall = matched gold / gold
+
+    from inception_fishing import evaluation
+    scores = evaluation.evaluate_corpus(gold_corpus, entity_fishing_corpus, predicted_layers=["entity_fishing"])
+    print(evaluation.get_report(scores))
+"""
+from __future__ import annotations
+from bisect import bisect_right, insort
+from typing import Dict, Sequence
+
+import numpy as np
+
+from .Corpus import Corpus
+from .instrumentation import timed
+from .utils import ANNOTATION_ORIGIN_SPACY_TOKEN, ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_BLOCK
+
+
+# structural annotations, not evaluated by default
+DEFAULT_EVALUATION_EXCLUDED_LAYERS = [ANNOTATION_ORIGIN_SPACY_TOKEN, ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_BLOCK]
+MATCHING_STRICT = "strict"
+MATCHING_FUZZY = "fuzzy"
+MATCHING_NEL = "nel"
+
+
+# Spans
+# ==============================================
+
+def _documents_spans(documents, layers=None, excluded_layers=DEFAULT_EVALUATION_EXCLUDED_LAYERS) -> Dict[str, np.ndarray]:
+    """annotations of documents (None: missing document) as arrays: document index, start, end, grobid tag, wikidata id"""
+    excluded_layers = set(excluded_layers)
+    document_indices, starts, ends, tags, wikidata_ids = [], [], [], [], []
+    for i, document in enumerate(documents):
+        if document is None:
+            continue
+        document_layers = layers if layers is not None else [l for l in document.layer_names if l not in excluded_layers]
+        for a in document.get_layers_annotations(document_layers):
+            document_indices.append(i)
+            starts.append(a.start)
+            ends.append(a.end)
+            tags.append(a.grobid_tag)
+            wikidata_ids.append(a.wikidata_entity_id)
+    return {
+        "document": np.array(document_indices, dtype=np.int64),
+        "start": np.array(starts, dtype=np.int64),
+        "end": np.array(ends, dtype=np.int64),
+        "tag": np.array(tags, dtype=object),
+        "wikidata_id": np.array(wikidata_ids, dtype=object),
+    }
+
+def _codes(gold_values:np.ndarray, predicted_values:np.ndarray):
+    """integer codes of the values (None included) shared between gold and predicted, and the values of the codes"""
+    values = dict()
+    gold_codes = np.fromiter((values.setdefault(v, len(values)) for v in gold_values), dtype=np.int64, count=len(gold_values))
+    predicted_codes = np.fromiter((values.setdefault(v, len(values)) for v in predicted_values), dtype=np.int64, count=len(predicted_values))
+    return gold_codes, predicted_codes, list(values.keys())
+
+def _subset(spans:Dict[str, np.ndarray], mask:np.ndarray) -> Dict[str, np.ndarray]:
+    return {k: v[mask] for k, v in spans.items()}
+
+# Matching
+# ==============================================
+
+def _occurrences(keys:np.ndarray) -> np.ndarray:
+    """rank of each key among the equal keys before it: [5, 3, 5, 5] -> [0, 0, 1, 2]"""
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    positions = np.arange(len(keys))
+    first_positions = np.maximum.accumulate(np.where(np.r_[True, sorted_keys[1:]!=sorted_keys[:-1]], positions, 0)) if len(keys) else positions
+    occurrences = np.empty(len(keys), dtype=np.int64)
+    occurrences[order] = positions-first_positions
+    return occurrences
+
+def _strict_matches(gold_rows:np.ndarray, predicted_rows:np.ndarray):
+    """whether each gold row is matched by an identical predicted row and conversely, rows being (group, start, end)
+
+    matching is one-to-one: the n-th occurrence of a row on one side matches the n-th occurrence on the other side,
+    so that k identical rows on one side and m on the other give min(k, m) matches
+    """
+    _, keys = np.unique(np.concatenate([gold_rows, predicted_rows]), axis=0, return_inverse=True)
+    keys = keys.reshape(-1)
+    gold_keys, predicted_keys = keys[:len(gold_rows)], keys[len(gold_rows):]
+    n_keys = int(keys.max(initial=-1))+1
+    gold_counts, predicted_counts = np.bincount(gold_keys, minlength=n_keys), np.bincount(predicted_keys, minlength=n_keys)
+    return _occurrences(gold_keys)<predicted_counts[gold_keys], _occurrences(predicted_keys)<gold_counts[predicted_keys]
+
+def _overlap_matching(gold_starts:np.ndarray, gold_ends:np.ndarray, predicted_starts:np.ndarray, predicted_ends:np.ndarray):
+    """whether each gold span is matched by an overlapping predicted span and conversely, in a one-to-one maximum matching
+
+    gold spans are taken by increasing end, each matched with the available predicted span overlapping it that ends first:
+    the predicted spans overlapping a gold span and usable by a later one are the ones ending after the later one's start,
+    so the one ending first is the least useful to the later gold spans
+    """
+    gold_matched = np.zeros(len(gold_starts), dtype=bool)
+    predicted_matched = np.zeros(len(predicted_starts), dtype=bool)
+    if len(gold_starts)==0 or len(predicted_starts)==0:
+        return gold_matched, predicted_matched
+    gold_order = np.argsort(gold_ends, kind="stable").tolist()
+    predicted_order = np.argsort(predicted_starts, kind="stable").tolist()
+    gold_starts, gold_ends = gold_starts.tolist(), gold_ends.tolist()
+    predicted_starts, predicted_ends = predicted_starts.tolist(), predicted_ends.tolist()
+    # (end, index) of the unmatched predicted spans starting before the current gold end, sorted
+    available = []
+    next_predicted = 0
+    for g in gold_order:
+        while next_predicted<len(predicted_order) and predicted_starts[predicted_order[next_predicted]]<gold_ends[g]:
+            p = predicted_order[next_predicted]
+            insort(available, (predicted_ends[p], p))
+            next_predicted += 1
+        i = bisect_right(available, (gold_starts[g], len(predicted_starts)))
+        if i<len(available):
+            _, p = available.pop(i)
+            gold_matched[g] = True
+            predicted_matched[p] = True
+    return gold_matched, predicted_matched
+
+def _fuzzy_matches(gold_groups, gold_starts, gold_ends, predicted_groups, predicted_starts, predicted_ends, stride):
+    """whether each gold span is matched by an overlapping predicted span of its group and conversely, one-to-one, stride being above any offset"""
+    gold_shift, predicted_shift = gold_groups*stride, predicted_groups*stride
+    return _overlap_matching(gold_starts+gold_shift, gold_ends+gold_shift, predicted_starts+predicted_shift, predicted_ends+predicted_shift)
+
+# Scores
+# ==============================================
+
+def precision_recall_f1(matched_predicted, predicted, matched_gold, gold) -> Dict:
+    matched_predicted, predicted, matched_gold, gold = int(matched_predicted), int(predicted), int(matched_gold), int(gold)
+    precision = matched_predicted/predicted if predicted>0 else 0.0
+    recall = matched_gold/gold if gold>0 else 0.0
+    return {
+        "predicted": predicted,
+        "matched_predicted": matched_predicted,
+        "gold": gold,
+        "matched_gold": matched_gold,
+        "precision": precision,
+        "recall": recall,
+        "f1": 2*precision*recall/(precision+recall) if precision+recall>0 else 0.0
+    }
+
+def _grouped_scores(gold_matched, gold_groups, predicted_matched, predicted_groups, n_groups) -> Sequence[Dict]:
+    """precision_recall_f1() of each group"""
+    counts = np.stack([
+        np.bincount(predicted_groups, weights=predicted_matched, minlength=n_groups),
+        np.bincount(predicted_groups, minlength=n_groups),
+        np.bincount(gold_groups, weights=gold_matched, minlength=n_groups),
+        np.bincount(gold_groups, minlength=n_groups),
+    ], axis=1).astype(np.int64)
+    return [precision_recall_f1(*c) for c in counts.tolist()]
+
+def _macro_average(scores:Sequence[Dict]) -> Dict:
+    """mean precision, recall and f1 of the scores with gold or predicted annotations"""
+    scores = [s for s in scores if s["gold"]>0 or s["predicted"]>0]
+    return {
+        metric: (sum(s[metric] for s in scores)/len(scores) if len(scores)>0 else 0.0)
+        for metric in ("precision", "recall", "f1")
+    }
+
+# Corpus
+# ==============================================
+
+@timed()
+def evaluate_corpus(gold_corpus:Corpus, predicted_corpus:Corpus,
+        gold_layers=None, predicted_layers=None, excluded_layers=DEFAULT_EVALUATION_EXCLUDED_LAYERS
+    ) -> Dict:
+    """Scores the annotations of predicted_corpus against the ones of gold_corpus, documents being matched by name
+
+    gold_layers, predicted_layers: origins of the evaluated annotations, all except excluded_layers if None
+    returns a dict:
+    - "micro": strict, fuzzy and nel precision_recall_f1() over all annotations, and "nel_accuracy"
+    - "macro_documents", "macro_tags": mean precision, recall and f1 of documents and of grobid tags
+    - "documents": strict, fuzzy and nel scores of each gold document, by name
+    - "tags": strict and fuzzy scores of each grobid tag
+    """
+    gold_documents = list(gold_corpus.documents)
+    predicted_documents = [predicted_corpus.get(d.name) for d in gold_documents]
+    gold = _documents_spans(gold_documents, gold_layers, excluded_layers)
+    predicted = _documents_spans(predicted_documents, predicted_layers, excluded_layers)
+    n_documents = len(gold_documents)
+    # above any offset, for the groups of the fuzzy matching not to overlap
+    stride = max(int(gold["end"].max(initial=0)), int(predicted["end"].max(initial=0)))+1
+
+    # strict and fuzzy NER, per (document, grobid tag)
+    gold_tags, predicted_tags, tags = _codes(gold["tag"], predicted["tag"])
+    n_tags = max(len(tags), 1)
+    gold_groups, predicted_groups = gold["document"]*n_tags+gold_tags, predicted["document"]*n_tags+predicted_tags
+    gold_strict, predicted_strict = _strict_matches(
+        np.stack([gold_groups, gold["start"], gold["end"]], axis=1),
+        np.stack([predicted_groups, predicted["start"], predicted["end"]], axis=1)
+    )
+    gold_fuzzy, predicted_fuzzy = _fuzzy_matches(gold_groups, gold["start"], gold["end"], predicted_groups, predicted["start"], predicted["end"], stride)
+
+    # NEL, per (document, wikidata id) over annotations with a wikidata id
+    gold_linked = _subset(gold, np.array([i is not None for i in gold["wikidata_id"]], dtype=bool))
+    predicted_linked = _subset(predicted, np.array([i is not None for i in predicted["wikidata_id"]], dtype=bool))
+    gold_ids, predicted_ids, _ = _codes(gold_linked["wikidata_id"], predicted_linked["wikidata_id"])
+    gold_nel, predicted_nel = _strict_matches(
+        np.stack([gold_linked["document"], gold_ids, gold_linked["start"], gold_linked["end"]], axis=1),
+        np.stack([predicted_linked["document"], predicted_ids, predicted_linked["start"], predicted_linked["end"]], axis=1)
+    )
+    # NEL accuracy: among gold linked annotations whose span is predicted (with or without wikidata id)
+    gold_linked_span_found, _ = _strict_matches(
+        np.stack([gold_linked["document"], gold_linked["start"], gold_linked["end"]], axis=1),
+        np.stack([predicted["document"], predicted["start"], predicted["end"]], axis=1)
+    )
+    n_gold_linked_span_found = int(gold_linked_span_found.sum())
+
+    micro = {
+        MATCHING_STRICT: precision_recall_f1(predicted_strict.sum(), len(predicted_strict), gold_strict.sum(), len(gold_strict)),
+        MATCHING_FUZZY: precision_recall_f1(predicted_fuzzy.sum(), len(predicted_fuzzy), gold_fuzzy.sum(), len(gold_fuzzy)),
+        MATCHING_NEL: precision_recall_f1(predicted_nel.sum(), len(predicted_nel), gold_nel.sum(), len(gold_nel)),
+        "nel_accuracy": int(gold_nel.sum())/n_gold_linked_span_found if n_gold_linked_span_found>0 else 0.0
+    }
+    documents_scores = {
+        MATCHING_STRICT: _grouped_scores(gold_strict, gold["document"], predicted_strict, predicted["document"], n_documents),
+        MATCHING_FUZZY: _grouped_scores(gold_fuzzy, gold["document"], predicted_fuzzy, predicted["document"], n_documents),
+        MATCHING_NEL: _grouped_scores(gold_nel, gold_linked["document"], predicted_nel, predicted_linked["document"], n_documents),
+    }
+    tags_scores = {
+        MATCHING_STRICT: _grouped_scores(gold_strict, gold_tags, predicted_strict, predicted_tags, len(tags)),
+        MATCHING_FUZZY: _grouped_scores(gold_fuzzy, gold_tags, predicted_fuzzy, predicted_tags, len(tags)),
+    }
+    return {
+        "micro": micro,
+        "macro_documents": {matching: _macro_average(scores) for matching, scores in documents_scores.items()},
+        "macro_tags": {matching: _macro_average(scores) for matching, scores in tags_scores.items()},
+        "documents": {
+            d.name: {matching: scores[i] for matching, scores in documents_scores.items()}
+            for i, d in enumerate(gold_documents)
+        },
+        "tags": {
+            tag: {matching: scores[i] for matching, scores in tags_scores.items()}
+            for i, tag in enumerate(tags)
+        },
+    }
+
+def get_report(scores:Dict) -> str:
+    """Human-readable report of evaluate_corpus() scores: micro and macro averages, then per grobid tag"""
+    lines = [f"{'':<24} {'precision':>10} {'recall':>10} {'f1':>10} {'predicted':>10} {'gold':>10}"]
+    for matching, s in scores["micro"].items():
+        if isinstance(s, dict):
+            lines.append(f"{'micro '+matching:<24} {s['precision']:>10.4f} {s['recall']:>10.4f} {s['f1']:>10.4f} {s['predicted']:>10} {s['gold']:>10}")
+    lines.append(f"{'nel accuracy':<24} {scores['micro']['nel_accuracy']:>10.4f}")
+    for average in ("macro_documents", "macro_tags"):
+        for matching, s in scores[average].items():
+            lines.append(f"{average.replace('_', ' ')+' '+matching:<24} {s['precision']:>10.4f} {s['recall']:>10.4f} {s['f1']:>10.4f}")
+    for tag, tag_scores in sorted(scores["tags"].items(), key=lambda x: -x[1][MATCHING_STRICT]["gold"]):
+        for matching, s in tag_scores.items():
+            lines.append(f"{str(tag)+' '+matching:<24} {s['precision']:>10.4f} {s['recall']:>10.4f} {s['f1']:>10.4f} {s['predicted']:>10} {s['gold']:>10}")
+    return "\n".join(lines)
@@ -4,3 +4,4 @@ from . import clef_hipe_scorer
 from . import dhs_article
 from . import wikipedia
 from . import spacy
+from . import native
@@ -0,0 +1,54 @@
+"""Shared aiohttp client session of the async API layers (entity-fishing, wikidata, wikipedia)
+
+One session per event loop, whose connector limits the number of simultaneous connections,
+so that hundreds of documents can be in flight without opening hundreds of connections.
+aiohttp is an optional dependency: pip install inception_fishing[async]
+"""
+import asyncio
+from typing import Dict
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+ASYNC_HTTP_LIMIT = 100
+ASYNC_HTTP_LIMIT_PER_HOST = 20
+
+_sessions:Dict[asyncio.AbstractEventLoop, "aiohttp.ClientSession"] = dict()
+
+def configure_async_http(limit=None, limit_per_host=None):
+    """Sets the connection limits of sessions created afterwards (see close_async_session())"""
+    global ASYNC_HTTP_LIMIT, ASYNC_HTTP_LIMIT_PER_HOST
+    if limit is not None:
+        ASYNC_HTTP_LIMIT = limit
+    if limit_per_host is not None:
+        ASYNC_HTTP_LIMIT_PER_HOST = limit_per_host
+
+def check_aiohttp():
+    if aiohttp is None:
+        raise Exception("inception_fishing async functions require aiohttp: pip install aiohttp (or inception_fishing[async])")
+
+def get_async_session() -> "aiohttp.ClientSession":
+    """Returns the shared session of the running event loop, creating it if needed"""
+    check_aiohttp()
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        for other_loop in [l for l in _sessions if l.is_closed()]:
+            del _sessions[other_loop]
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=ASYNC_HTTP_LIMIT, limit_per_host=ASYNC_HTTP_LIMIT_PER_HOST))
+        _sessions[loop] = session
+    return session
+
+async def close_async_session():
+    """Closes the shared session of the running event loop, to call before the loop ends"""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+def get_async_timeout(timeout_seconds):
+    """aiohttp timeout of timeout_seconds total, None for no timeout"""
+    check_aiohttp()
+    return aiohttp.ClientTimeout(total=timeout_seconds)
@@ -1,10 +1,18 @@
 
+from os import path
+import re
+from typing import Dict, Iterator, Sequence, Tuple
+
+import numpy as np
 from spacy.tokens import Token
 
 from ..Annotation import Annotation
 from ..Corpus import Corpus
 from ..Document import Document
-from .spacy import document_to_spacy_doc
+from ..utils import ANNOTATION_ORIGIN_SPACY_TOKEN, ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_BLOCK, ANNOTATION_ORIGIN_CLEF_HIPE
+from .compressed_io import open_file
+from .grobid_ner import GROBID_NER_TAGS_TO_HIPE_COARSE
+from .spacy_cache import SpacyDocCache
 
 default_tsv_col_to_token_extension = {
     "NEL-LIT": "wikidata_entity_id"
@@ -21,6 +29,48 @@ clef_hipe_scorer_tsv_data_columns_with_default= {
     "MISC": "-"
 }
 clef_hipe_scorer_tsv_columns = ["TOKEN"]+list(clef_hipe_scorer_tsv_data_columns_with_default.keys())
+# structural annotations, not exported as entities by default
+default_hipe_excluded_layers = [ANNOTATION_ORIGIN_SPACY_TOKEN, ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_BLOCK]
+# grobid tag of the annotations read from a CLEF-HIPE coarse type, the first grobid tag mapped to it
+HIPE_COARSE_TO_GROBID_NER_TAGS = dict()
+for grobid_tag, hipe_coarse_type in GROBID_NER_TAGS_TO_HIPE_COARSE.items():
+    HIPE_COARSE_TO_GROBID_NER_TAGS.setdefault(hipe_coarse_type, grobid_tag)
+# MISC flags
+HIPE_MISC_NO_SPACE_AFTER = "NoSpaceAfter"
+HIPE_MISC_END_OF_LINE = "EndOfLine"
+HIPE_MISC_END_OF_PARAGRAPH = "EndOfParagraph"
+# NEL-LIT values without a wikidata id
+HIPE_NO_LINK_VALUES = {"-", "_", "NIL", ""}
+# metadata keys repeated for each segment of a document, listed in "hipe_metadata"
+HIPE_SEGMENT_METADATA_KEYS = {"segment_iiif_link"}
+
+# elisions (l', d', qu'), words with inner hyphens, dots, commas or apostrophes (Jean-Pierre, 3.5, aujourd'hui), single punctuation characters
+FAST_TOKENIZER_REGEX = r"\b(?:\w{1,2}|\w*[Qq]u)['’](?=\w)|\w+(?:[-.,'’]\w+)*|[^\w\s]"
+
+
+class FastTokenizer:
+    """Compiled regex tokenizer, a lightweight alternative to a spacy pipeline for the CLEF-HIPE export
+
+    close to spacy's tokenization of french, german and english for the words and punctuation of running text.
+    Usable wherever a spacy nlp is, see get_tokens_offsets().
+    """
+    def __init__(self, pattern=FAST_TOKENIZER_REGEX):
+        self.regex = re.compile(pattern)
+    def tokens_offsets(self, text) -> Tuple[np.ndarray, np.ndarray]:
+        """(start offsets, end offsets) of the tokens of text"""
+        spans = np.array([m.span() for m in self.regex.finditer(text)], dtype=np.int64).reshape(-1, 2)
+        return spans[:, 0], spans[:, 1]
+
+def get_tokens_offsets(tokenizer, text, spacy_cache:SpacyDocCache=None) -> Tuple[np.ndarray, np.ndarray]:
+    """(start offsets, end offsets) of the tokens of text, tokenizer being a FastTokenizer or a spacy nlp
+
+    spacy_cache: spacy_cache.SpacyDocCache of the spacy docs, not used by a FastTokenizer
+    """
+    if isinstance(tokenizer, FastTokenizer):
+        return tokenizer.tokens_offsets(text)
+    spacy_doc = spacy_cache.get_doc(text, tokenizer) if spacy_cache is not None else tokenizer(text)
+    offsets = spacy_doc.to_array(["IDX", "LENGTH"]).astype(np.int64).reshape(-1, 2)
+    return offsets[:, 0], offsets[:, 0]+offsets[:, 1]
 
 
 def spacy_token_to_tsv_line(
@@ -37,39 +87,256 @@ def spacy_token_to_tsv_line(
             line += default
     return line
 
+def iob_tags(token_starts:np.ndarray, starts:np.ndarray, ends:np.ndarray, labels:Sequence, default="O", iob_prefixes=True) -> np.ndarray:
+    """Labels of tokens from non-overlapping spans, in one pass over arrays
+
+    token_starts: sorted start offsets of the tokens
+    starts, ends, labels: spans, a token being in a span if start <= token start < end, as spacy.annotation_get_tokens()
+    iob_prefixes: labels as "B-<label>" for the first token of a span and "I-<label>" for the next ones
+    spans with a None label are skipped, tokens outside of spans get default
+    """
+    tags = np.full(len(token_starts), default, dtype=object)
+    labels = np.asarray(labels, dtype=object)
+    kept = np.array([l is not None for l in labels], dtype=bool)
+    if len(labels)==0 or not kept.any():
+        return tags
+    first_tokens = np.searchsorted(token_starts, np.asarray(starts)[kept], side="left")
+    lengths = np.maximum(np.searchsorted(token_starts, np.asarray(ends)[kept], side="left")-first_tokens, 0)
+    labels = labels[kept]
+    # token index and span index of every (token, span) pair
+    span_indices = np.repeat(np.arange(len(labels)), lengths)
+    offsets_in_span = np.arange(lengths.sum())-np.repeat(np.cumsum(lengths)-lengths, lengths)
+    token_indices = first_tokens[span_indices]+offsets_in_span
+    if iob_prefixes:
+        prefixed_labels = np.array([("B-"+l, "I-"+l) for l in labels], dtype=object).reshape(-1, 2)
+        tags[token_indices] = prefixed_labels[span_indices, np.minimum(offsets_in_span, 1)]
+    else:
+        tags[token_indices] = labels[span_indices]
+    return tags
+
 # Annotation
 # ==============================================
 
+def _tsv_value(value):
+    return str(value) if value is not None else None
+
+def annotation_hipe_coarse_type(annotation:Annotation):
+    return GROBID_NER_TAGS_TO_HIPE_COARSE.get(annotation.grobid_tag) if annotation.grobid_tag is not None else None
+
 # Documents
 # ==============================================
 
+def document_to_hipe_columns(document:Document, token_starts:np.ndarray, layers=None, excluded_layers=default_hipe_excluded_layers,
+        tsv_columns=clef_hipe_scorer_tsv_data_columns_with_default, tsv_col_to_token_extension=default_tsv_col_to_token_extension
+    ) -> Dict[str, np.ndarray]:
+    """CLEF-HIPE data columns of the tokens starting at token_starts (sorted), as arrays of strings
+
+    NE-COARSE-LIT: IOB coarse type (from grobid_tag, see grobid_ner.GROBID_NER_TAGS_TO_HIPE_COARSE) of top level annotations
+    NE-NESTED: IOB coarse type of annotations nested once
+    tsv_col_to_token_extension: column -> Annotation attribute of the top level annotations (wikidata_entity_id for NEL-LIT by default)
+    other columns of tsv_columns (column -> default value): their default value
+    layers: origins of the exported annotations, all except excluded_layers if None
+    """
+    if layers is None:
+        excluded_layers = set(excluded_layers)
+        layers = [l for l in document.layer_names if l not in excluded_layers]
+    annotations = document.get_layers_annotations(layers)
+    nesting_levels = Document(document.name, annotations).get_annotations_nesting_level()
+    columns = dict()
+    for level, tags_column in [(0, "NE-COARSE-LIT"), (1, "NE-NESTED")]:
+        level_annotations = [a for a in annotations if nesting_levels[a]==level]
+        starts = np.fromiter((a.start for a in level_annotations), dtype=np.int64, count=len(level_annotations))
+        ends = np.fromiter((a.end for a in level_annotations), dtype=np.int64, count=len(level_annotations))
+        if tags_column in tsv_columns:
+            columns[tags_column] = iob_tags(token_starts, starts, ends, [annotation_hipe_coarse_type(a) for a in level_annotations], default=tsv_columns[tags_column])
+        if level==0:
+            for col, attribute in tsv_col_to_token_extension.items():
+                if col in tsv_columns:
+                    columns[col] = iob_tags(
+                        token_starts, starts, ends,
+                        [_tsv_value(getattr(a, attribute, None)) for a in level_annotations],
+                        default=tsv_columns[col], iob_prefixes=False
+                    )
+    for col, default in tsv_columns.items():
+        if col not in columns:
+            columns[col] = np.full(len(token_starts), default, dtype=object)
+    return columns
+
+def hipe_misc_spacing_flags(text, token_starts:np.ndarray, token_ends:np.ndarray, default="-") -> np.ndarray:
+    """MISC column of tokens: NoSpaceAfter when the next token is glued, EndOfLine before a newline, EndOfLine|EndOfParagraph for the last token"""
+    flags = np.full(len(token_starts), default, dtype=object)
+    if len(token_starts)==0:
+        return flags
+    next_starts = token_starts[1:].tolist()
+    ends = token_ends[:-1].tolist()
+    for i, (end, next_start) in enumerate(zip(ends, next_starts)):
+        if end>=next_start:
+            flags[i] = HIPE_MISC_NO_SPACE_AFTER
+        elif "\n" in text[end:next_start]:
+            flags[i] = HIPE_MISC_END_OF_LINE
+    flags[-1] = HIPE_MISC_END_OF_LINE+"|"+HIPE_MISC_END_OF_PARAGRAPH
+    return flags
+
 def document_to_conllu_tsv(document, spacy_nlp,
         language="fr", date="1918-11-08", newspaper= "DHS",
-        **spacy_token_to_tsv_line_kwargs
+        layers=None, spacy_cache:SpacyDocCache=None,
+        **hipe_columns_kwargs
     ) -> str:
+    """CLEF-HIPE tsv of document tokenized by spacy_nlp (or a FastTokenizer), see document_to_hipe_columns() for the columns
+
+    spacy_cache: spacy_cache.SpacyDocCache skipping the spacy pipeline for texts already tokenized by spacy_nlp
+    hipe_columns_kwargs: tsv_columns, tsv_col_to_token_extension, see document_to_hipe_columns()
+    """
     intro = f"# language = {language}									\n" + \
             f"# newspaper = {newspaper}									\n" + \
             f"# date = {date}									\n" + \
             f"# document_id = {document.name}									\n"
     sentence_intro = f"# segment_iiif_link = _									\n"
 
-    spacy_doc = document_to_spacy_doc(document, spacy_nlp)
+    tsv_columns = hipe_columns_kwargs.get("tsv_columns", clef_hipe_scorer_tsv_data_columns_with_default)
+    token_starts, token_ends = get_tokens_offsets(spacy_nlp, document.text, spacy_cache)
+    columns = document_to_hipe_columns(document, token_starts, layers, **hipe_columns_kwargs)
+    text = document.text
+    if "MISC" in tsv_columns:
+        columns["MISC"] = hipe_misc_spacing_flags(text, token_starts, token_ends, default=tsv_columns["MISC"])
     sentence_tsv_lines = sentence_intro + "\n".join([
-        spacy_token_to_tsv_line(t, **spacy_token_to_tsv_line_kwargs)
-        for t in spacy_doc
+        "\t".join(line)
+        for line in zip(
+            [text[start:end] for start, end in zip(token_starts.tolist(), token_ends.tolist())],
+            *[columns[col] for col in tsv_columns.keys()]
+        )
     ])
         
-    return intro+sentence_tsv_lines[:-1]+"EndOfLine|EndOfParagraph"
+    return intro+sentence_tsv_lines
+
+def _iob_runs(tags:Sequence[str]) -> Iterator[Tuple[int, int, str]]:
+    """(first token index, end token index, label) of the runs of IOB tags, I- tags without a B- tag starting a run"""
+    run_start, run_label = None, None
+    for i, tag in enumerate(tags):
+        prefix, label = (tag[:2], tag[2:]) if tag[:2] in ("B-", "I-") else (None, None)
+        if run_label is not None and (prefix!="I-" or label!=run_label):
+            yield run_start, i, run_label
+            run_label = None
+        if prefix is not None and run_label is None:
+            run_start, run_label = i, label
+    if run_label is not None:
+        yield run_start, len(tags), run_label
+
+def document_from_hipe_tokens(name, tokens:Sequence[str], columns:Dict[str, Sequence[str]], annotations_origin=ANNOTATION_ORIGIN_CLEF_HIPE, extra_fields=None) -> Document:
+    """Document of CLEF-HIPE tokens and their data columns
+
+    text: tokens separated by a space, nothing after NoSpaceAfter tokens and a newline after EndOfLine tokens (MISC)
+    annotations: IOB runs of NE-COARSE-LIT linked with the NEL-LIT of their first token, and of NE-NESTED,
+        with the HIPE types in extra fields "hipe_coarse_type" and "hipe_fine_type" (NE-FINE-LIT)
+    """
+    miscs = columns.get("MISC", [])
+    starts, ends = [], []
+    text_parts = []
+    offset = 0
+    for i, token in enumerate(tokens):
+        if i>0:
+            previous_misc = miscs[i-1] if i-1<len(miscs) else ""
+            separator = "" if HIPE_MISC_NO_SPACE_AFTER in previous_misc else ("\n" if HIPE_MISC_END_OF_LINE in previous_misc else " ")
+            text_parts.append(separator)
+            offset += len(separator)
+        starts.append(offset)
+        text_parts.append(token)
+        offset += len(token)
+        ends.append(offset)
+    text = "".join(text_parts)
+    annotations = []
+    for tags_column, link_column, fine_column in [("NE-COARSE-LIT", "NEL-LIT", "NE-FINE-LIT"), ("NE-NESTED", None, None)]:
+        if tags_column not in columns:
+            continue
+        for first, end, label in _iob_runs(columns[tags_column]):
+            annotation_extra_fields = {"origin": annotations_origin, "hipe_coarse_type": label}
+            if fine_column in columns and columns[fine_column][first][:2] in ("B-", "I-"):
+                annotation_extra_fields["hipe_fine_type"] = columns[fine_column][first][2:]
+            link = columns[link_column][first] if link_column in columns else None
+            annotations.append(Annotation(
+                starts[first], ends[end-1],
+                wikidata_entity_id=link if link not in HIPE_NO_LINK_VALUES else None,
+                mention=text[starts[first]:ends[end-1]],
+                grobid_tag=HIPE_COARSE_TO_GROBID_NER_TAGS.get(label),
+                extra_fields=annotation_extra_fields
+            ))
+    return Document(name, sorted(annotations, key=lambda a: a.start), text, extra_fields)
+
+def _add_hipe_metadata(metadata:Dict, keys_values:Sequence[Tuple[str, str]]):
+    for key, value in keys_values:
+        if key in HIPE_SEGMENT_METADATA_KEYS:
+            metadata.setdefault(key, []).append(value)
+        else:
+            metadata[key] = value
+
+def documents_from_conllu_tsv(filepath, annotations_origin=ANNOTATION_ORIGIN_CLEF_HIPE) -> Iterator[Document]:
+    """Streams the Documents of a CLEF-HIPE tsv file, parsed line by line, see document_from_hipe_tokens()
+
+    documents start at "# document_id = <name>" lines (keys may be prefixed, as "# hipe2022:document_id"), the other "# <key> = <value>" lines preceding or
+    following it (language, newspaper, date...) go in the extra field "hipe_metadata" of the document.
+    Metadata lines after tokens go to the next document if a "# document_id" line follows them, to the current one otherwise,
+    the values of the per segment keys (HIPE_SEGMENT_METADATA_KEYS) of a document being listed in order.
+    Columns are read from the TOKEN header line, clef_hipe_scorer_tsv_columns without one.
+    """
+    columns_names = clef_hipe_scorer_tsv_columns
+    name, metadata = None, dict()
+    # metadata lines after the tokens of a document, until the next "# document_id" or token line tells whose they are
+    pending_metadata = []
+    tokens, columns = [], dict()
+    def document():
+        return document_from_hipe_tokens(name, tokens, columns, annotations_origin, {"hipe_metadata": metadata})
+    with open_file(filepath) as file:
+        for line in file:
+            line = line.rstrip("\r\n")
+            if line.startswith("#"):
+                key, equal, value = line[1:].partition("=")
+                if equal=="":
+                    continue
+                # "# hipe2022:document_id = ..." in the HIPE 2020 and 2022 datasets
+                key, value = key.strip().rpartition(":")[2], value.strip()
+                if key=="document_id":
+                    if name is not None:
+                        yield document()
+                    name, metadata = value, dict()
+                    _add_hipe_metadata(metadata, pending_metadata)
+                    pending_metadata = []
+                    tokens, columns = [], dict()
+                elif name is None or len(tokens)>0:
+                    pending_metadata.append((key, value))
+                else:
+                    _add_hipe_metadata(metadata, [(key, value)])
+                continue
+            values = line.split("\t")
+            if values[0]=="TOKEN":
+                columns_names = values
+                continue
+            if values[0].strip()=="":
+                continue
+            if name is None:
+                raise Exception(f"inception_fishing.clef_hipe_scorer.documents_from_conllu_tsv(): token before any '# document_id' line in {filepath}")
+            _add_hipe_metadata(metadata, pending_metadata)
+            pending_metadata = []
+            tokens.append(values[0])
+            for column_name, value in zip(columns_names[1:], values[1:]):
+                columns.setdefault(column_name, []).append(value)
+    if name is not None:
+        _add_hipe_metadata(metadata, pending_metadata)
+        yield document()
 
 # Corpus
 # ==============================================
 
+def corpus_from_conllu_tsv(filepath, corpus_name=None, **documents_kwargs) -> Corpus:
+    """Corpus of the documents of a CLEF-HIPE tsv file, see documents_from_conllu_tsv() to stream them instead"""
+    return Corpus(corpus_name if corpus_name is not None else path.splitext(path.basename(filepath))[0], list(documents_from_conllu_tsv(filepath, **documents_kwargs)))
+
 def corpus_to_conllu_tsv(corpus, filepath, spacy_nlp, **document_kwargs):
     doc_tsv_separator = "\n"+(2*"									\n")
     alphabetic_ordered_docs = sorted(corpus.documents, key= lambda d: d.name)
     tsv_docs = [document_to_conllu_tsv(d, spacy_nlp, **document_kwargs) for d in alphabetic_ordered_docs]
 
-    tsv_content = "\t".join(clef_hipe_scorer_tsv_columns)+"\n"+doc_tsv_separator.join(tsv_docs)
-    with open(filepath, "w", encoding="utf-8") as file:
+    tsv_columns = ["TOKEN"]+list(document_kwargs.get("tsv_columns", clef_hipe_scorer_tsv_data_columns_with_default).keys())
+    tsv_content = "\t".join(tsv_columns)+"\n"+doc_tsv_separator.join(tsv_docs)
+    with open_file(filepath, "w") as file:
         file.write(tsv_content)
     return tsv_content
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""Transparent compressed file I/O shared by the file readers and writers of inception_fishing
+
+open_file() opens plain, gzip (.gz), zstandard (.zst), xz (.xz) and bzip2 (.bz2) files alike, with streaming
+(de)compression behind large buffered reads and writes. Compression is detected by the magic bytes of the file
+when reading, by its extension when writing.
+zstandard is an optional dependency: pip install zstandard (or inception_fishing[zstd])
+"""
+import bz2
+import gzip
+import io
+import lzma
+from os import path
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+COMPRESSION_XZ = "xz"
+COMPRESSION_BZ2 = "bz2"
+COMPRESSION_EXTENSIONS = {
+    ".gz": COMPRESSION_GZIP,
+    ".zst": COMPRESSION_ZSTD,
+    ".xz": COMPRESSION_XZ,
+    ".bz2": COMPRESSION_BZ2,
+}
+COMPRESSION_MAGIC_BYTES = {
+    b"\x1f\x8b": COMPRESSION_GZIP,
+    b"\x28\xb5\x2f\xfd": COMPRESSION_ZSTD,
+    b"\xfd7zXZ\x00": COMPRESSION_XZ,
+    b"BZh": COMPRESSION_BZ2,
+}
+DEFAULT_BUFFER_SIZE = 1024*1024
+
+
+def check_zstandard():
+    if zstandard is None:
+        raise Exception("inception_fishing .zst files require zstandard: pip install zstandard (or inception_fishing[zstd])")
+
+def detect_compression(file_path, mode="r") -> Optional[str]:
+    """compression of file_path from its magic bytes when reading an existing file, from its extension otherwise, None if uncompressed"""
+    if "r" in mode and path.isfile(file_path):
+        with open(file_path, "rb") as f:
+            head = f.read(max(len(m) for m in COMPRESSION_MAGIC_BYTES))
+        for magic_bytes, compression in COMPRESSION_MAGIC_BYTES.items():
+            if head.startswith(magic_bytes):
+                return compression
+        return None
+    return COMPRESSION_EXTENSIONS.get(path.splitext(file_path)[1].lower())
+
+def _open_compressed_binary(file_path, binary_mode, compression, compresslevel=None):
+    if compression==COMPRESSION_GZIP:
+        return gzip.GzipFile(file_path, binary_mode, compresslevel=compresslevel if compresslevel is not None else 6)
+    if compression==COMPRESSION_XZ:
+        return lzma.LZMAFile(file_path, binary_mode, preset=compresslevel)
+    if compression==COMPRESSION_BZ2:
+        return bz2.BZ2File(file_path, binary_mode, compresslevel=compresslevel if compresslevel is not None else 9)
+    if compression==COMPRESSION_ZSTD:
+        check_zstandard()
+        return zstandard.open(
+            file_path, binary_mode,
+            cctx=zstandard.ZstdCompressor(level=compresslevel if compresslevel is not None else 3) if "r" not in binary_mode else None
+        )
+    raise Exception(f"inception_fishing.compressed_io.open_file(): unknown compression '{compression}' for file {file_path}")
+
+def open_file(file_path, mode="r", encoding="utf-8", errors=None, newline=None, compression="auto", compresslevel=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Opens file_path like open(), (de)compressing it on the fly
+
+    mode: "r", "w", "a" or "x", with "b" for binary files, text otherwise
+    compression: "auto" (see detect_compression()), None for uncompressed, or one of COMPRESSION_*
+    compresslevel: when writing, the default level of the compression otherwise
+    """
+    binary = "b" in mode
+    binary_mode = mode.replace("b", "").replace("t", "")+"b"
+    if compression=="auto":
+        compression = detect_compression(file_path, mode)
+    if compression is None:
+        if binary:
+            return open(file_path, binary_mode, buffering=buffer_size)
+        return open(file_path, mode, buffering=buffer_size, encoding=encoding, errors=errors, newline=newline)
+    compressed = _open_compressed_binary(file_path, binary_mode, compression, compresslevel)
+    buffered = io.BufferedReader(compressed, buffer_size) if "r" in binary_mode else io.BufferedWriter(compressed, buffer_size)
+    if binary:
+        return buffered
+    return io.TextIOWrapper(buffered, encoding=encoding, errors=errors, newline=newline)
@@ -1,5 +1,11 @@
 
 from __future__ import annotations
+from bisect import bisect_right
+from functools import lru_cache
+from heapq import merge
+import json
+import os
+from os import path
 from warnings import warn
 import re
 from typing import Dict, Sequence
@@ -9,19 +15,57 @@ from requests.exceptions import Timeout
 from ..Annotation import Annotation
 from ..Corpus import Corpus
 from ..Document import Document, INTERSECTION_BEHAVIOUR_REMOVE_ANNOTATION
+from ..instrumentation import timed, increment, COUNTER_ANNOTATIONS_PROCESSED, COUNTER_CACHE_HITS, COUNTER_CACHE_MISSES
 from ..utils import *
 
-from .entity_fishing import document_named_entity_linking
+from .entity_fishing import document_send_request, document_augment_from_json_response, document_request_fingerprint
 from .get_dhs_id_from_wikidata_id import get_infos_from_wikidata_id
 from .wikipedia import document_set_annotations_page_titles_and_ids
 
+DHS_ARTICLE_ID_FROM_URL_REGEX = re.compile(r"(fr|de|it)/articles/(\d+)/")
+
+@lru_cache(maxsize=1024)
+def get_initial_regex(initial):
+    """Returns the compiled regex matching a dhs_article initial followed by a dot"""
+    return re.compile(initial+r"\.")
+
+@lru_cache(maxsize=1024)
+def get_title_regex(title):
+    """Returns the compiled regex matching a dhs_article title literally"""
+    return re.compile(re.escape(title))
+
 # Annotation
 # ==============================================
 
 
+def annotation_to_text_link(annotation:Annotation, text_block:Annotation, dhs_article):
+    """Returns the dhs_article text_link corresponding to annotation, see document_reintegrate_annotations_into_dhs_article()"""
+    a = annotation
+    wiki_infos = get_infos_from_wikidata_id(a.wikidata_entity_id)
+    text_link = {
+        "start": a.start-text_block.start,
+        "end": a.end-text_block.start,
+        "mention": a.mention,
+        "origin": a.extra_fields.get("origin"),
+        "annotation": {
+            "wikidata_entity_id": a.wikidata_entity_id,
+            "wikipedia_page_id": a.wikipedia_page_id,
+            "wikipedia_page_title": a.wikipedia_page_title,
+            "wikidata_entity_url": a.wikidata_entity_url,
+            "grobid_tag": a.grobid_tag,
+            "extra_fields": a.extra_fields
+        }
+    }
+    if wiki_infos is not None:
+        text_link["href"] = dhs_article.language+"/articles/" + wiki_infos["dhsid"]
+        text_link["dhsid"] = wiki_infos["dhsid"]
+        text_link["wiki"] = wiki_infos
+    return text_link
+
 # Documents
 # ==============================================
 
+@timed()
 def document_from_dhs_article(
     dhs_article,
     p_text_blocks_separator = "\n",
@@ -54,8 +98,6 @@ def document_from_dhs_article(
     - annotations for text blocks with extra_fields "dhs_type"->"text_block" and "dhs_html_tag"->html tag name
     - annotations for text links with extra_fields "dhs_type"->"text_link", "dhs_id"->dhs_id and "dhs_href"->internal dhs link
     """
-    
-    dhs_article_id_from_url_regex = re.compile(r"(fr|de|it)/articles/(\d+)/")
 
     # assembling text blocks as annotations and crfeating whole_text
     text_blocks = dhs_article.parse_text_blocks()
@@ -92,7 +134,7 @@ def document_from_dhs_article(
                     mention = text_link["mention"]
                     href = text_link["href"]
                     # get text link correspondance in wikidata & wikipedia (if present)
-                    dhs_id_match = dhs_article_id_from_url_regex.search(href)
+                    dhs_id_match = DHS_ARTICLE_ID_FROM_URL_REGEX.search(href)
                     if dhs_id_match:
                         dhs_id = dhs_id_match.group(2)
                         document.annotations.append(Annotation(
@@ -112,22 +154,24 @@ def document_from_dhs_article(
     return document
 
 
+@timed()
 def document_replace_initial_from_dhs_article(document:Document, dhs_article, replacement=None):
     dhs_article.parse_identifying_initial() # reparse to ensure latest unbugged parse_identifying_initial()
     replacement = replacement if replacement is not None else dhs_article.title
     if dhs_article.initial is not None:
-        return document.replace_regex(dhs_article.initial+r"\.", replacement)
+        return document.replace_regex(get_initial_regex(dhs_article.initial), replacement)
     else:
         return []
 
+@timed()
 def document_annotate_title_from_dhs_article(document:Document, dhs_article):
     """mostly works after document_replace_initial_from_dhs_article"""
     wikidata_url, wikipedia_page_title, wiki_links = dhs_article.get_wikidata_links()
     new_annotations = []
-    for match in re.finditer(re.escape(dhs_article.title), document.text):
+    existing_spans = {(a.start, a.end, a.wikidata_entity_url) for a in document.annotations}
+    for match in get_title_regex(dhs_article.title).finditer(document.text):
         start, end = match.span()
-        skip = any(a.start==start and a.end==end and a.wikidata_entity_url==wikidata_url for a in document.annotations)
-        if not skip:
+        if (start, end, wikidata_url) not in existing_spans:
             new_annotations.append(Annotation(
                 start,
                 end,
@@ -139,19 +183,16 @@ def document_annotate_title_from_dhs_article(document:Document, dhs_article):
                     "origin": ANNOTATION_ORIGIN_DHS_ARTICLE_TITLE
                 }
             ))
-    document.annotations += new_annotations
+    document.add_annotations(new_annotations)
     return new_annotations
 
 def document_get_text_block_annotations(document:Document):
-    text_blocks = [a for a in document.annotations if a.extra_fields.get("origin")==ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_BLOCK]
-    text_blocks.sort(key = lambda x: x.start)
-    return text_blocks
+    return document.get_layer(ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_BLOCK)
 
 def document_get_entity_fishing_annotations(document:Document):
-    entity_fishing_annotations = [a for a in document.annotations if a.extra_fields.get("origin")==ANNOTATION_ORIGIN_ENTITY_FISHING]
-    entity_fishing_annotations.sort(key = lambda x: x.start)
-    return entity_fishing_annotations
+    return document.get_layer(ANNOTATION_ORIGIN_ENTITY_FISHING)
 
+@timed()
 def document_reintegrate_annotations_into_dhs_article(document:Document, dhs_article):
     """add annotations back into dhs_article.text_links
     
@@ -166,54 +207,46 @@ def document_reintegrate_annotations_into_dhs_article(document:Document, dhs_art
     - wiki: object with links to wikidata and wikipedias.
     - origin: a.extra_fields.get("origin"), most often "entity_fishing"
     - annotation: the 6 Annotation field: wikidata_entity_id, wikipedia_page_id, wikipedia_page_title, wikidata_entity_url, grobid_tag, extra_fields
+
+    The text_links of each text_block are appended in the start order of the annotations.
     """
 
     #print(f"{len(document.annotations)} annotations to reintegrate into {dhs_article.title}")
+    # text_links keep the annotations extra_fields: not the ones shared with a clone
+    document.materialize_annotations()
     text_blocks = document_get_text_block_annotations(document)
+    text_blocks_starts = [tb.start for tb in text_blocks]
+    increment(COUNTER_ANNOTATIONS_PROCESSED, len(document.annotations), stage="dhs_article.document_reintegrate_annotations_into_dhs_article")
     annotations_to_avoid = set([ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_BLOCK, ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_LINK, ANNOTATION_ORIGIN_DHS_ARTICLE_TITLE])
-    for i, tb in enumerate(text_blocks):
-        tb.start
-        for a in document.annotations:
+    # layers are sorted by start: merging them appends the text_links in start order, as they appear in the text
+    layers = [document.get_layer(origin) for origin in document.layer_names if origin!=ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_BLOCK]
+    for a in merge(*layers, key=lambda a: a.start):
+        avoid_origin = a.extra_fields.get("origin") in annotations_to_avoid
+        # text blocks don't overlap each other: only the block containing a.start and the following ones can overlap a
+        i = max(bisect_right(text_blocks_starts, a.start)-1, 0)
+        while i<len(text_blocks) and text_blocks[i].start<=a.end:
+            tb = text_blocks[i]
             overlap_status = get_spans_overlap_status(a.start, a.end, tb.start, tb.end)
             if overlap_status in [OVERLAP_START, OVERLAP_END, OVERLAP_INCLUDES]:
                 warn(
                     f"inception_fishing.import_export.dhs_article.document_reintegrate_annotations_into_dhs_article() problem for document '{document.name}':" + \
                     f" annotation overlapping with text_block.\nannotation: {a}\ntext_block: {tb}"
                 )
-            #if a.start >= tb.start and a.start<tb.end and \
-            elif overlap_status in [OVERLAP_IS_INCLUDED, OVERLAP_IDENTICAL] and a.extra_fields.get("origin") not in annotations_to_avoid:
-                wiki_infos = get_infos_from_wikidata_id(a.wikidata_entity_id)
-                text_link = {
-                    "start": a.start-tb.start,
-                    "end": a.end-tb.start,
-                    "mention": a.mention,
-                    "origin": a.extra_fields.get("origin"),
-                    "annotation": {
-                        "wikidata_entity_id": a.wikidata_entity_id,
-                        "wikipedia_page_id": a.wikipedia_page_id,
-                        "wikipedia_page_title": a.wikipedia_page_title,
-                        "wikidata_entity_url": a.wikidata_entity_url,
-                        "grobid_tag": a.grobid_tag,
-                        "extra_fields": a.extra_fields
-                    }
-                }
-                if wiki_infos is not None:
-                    text_link["href"] = dhs_article.language+"/articles/" + wiki_infos["dhsid"]
-                    text_link["dhsid"] = wiki_infos["dhsid"]
-                    text_link["wiki"] = wiki_infos
-                else:
-                    pass#print(f"wiki_infos is None for wikidata_id: {a.wikidata_entity_id}\nannotation: {a}\n{dhs_article.title} with id: {dhs_article.id}")
-                dhs_article.text_links[i].append(text_link)
-            elif overlap_status not in [OVERLAP_NONE]:
-                pass#print(f" unwanted annotation with overlap_status: {overlap_status}, annotation: {a}")
+            elif overlap_status in [OVERLAP_IS_INCLUDED, OVERLAP_IDENTICAL] and not avoid_origin:
+                dhs_article.text_links[i].append(annotation_to_text_link(a, tb, dhs_article))
+            i += 1
 
     return dhs_article
 
 # DhsArticle
 # ==============================================
 
-def link_entities(dhs_article, verbose=True, timed_out_articles_file="timed_out_article_ids.txt", **entity_linking_kwargs):
+@timed()
+def link_entities(dhs_article, verbose=True, timed_out_articles_file="timed_out_article_ids.txt", relink_manifest_folder=None, relink_manifest:Dict=None, **entity_linking_kwargs):
     """Does the whole process of sending a dhs_article through entity_fishing and reintegrating the obtained annotations
+
+    relink_manifest_folder, relink_manifest: see relink_changed(), if the fingerprint of the article's entity-fishing request
+    is the one in relink_manifest, the stored entity-fishing response is reintegrated instead of querying entity-fishing.
     
     Modify article in place, returns it anyway
     """
@@ -228,13 +261,28 @@ def link_entities(dhs_article, verbose=True, timed_out_articles_file="timed_out_
     
     d = document_from_dhs_article(dhs_article)
     document_set_annotations_page_titles_and_ids(d, dhs_article.language)
-    try:
-        linked_doc = document_named_entity_linking(d, dhs_article.language, **entity_linking_kwargs)
-    except Timeout:
-        print(f'EF TIMEOUT for article {dhs_article.id}, skipping it.')
-        with open(timed_out_articles_file, "a") as f:
-            f.write(dhs_article.id)
-        return None
+
+    fingerprint = None
+    entity_fishing_json_resp = None
+    if relink_manifest is not None:
+        fingerprint = document_request_fingerprint(d, dhs_article.language, **entity_linking_kwargs)
+        if relink_manifest.get(str(dhs_article.id))==fingerprint:
+            entity_fishing_json_resp = load_relink_response(relink_manifest_folder, dhs_article.id)
+        increment(COUNTER_CACHE_HITS if entity_fishing_json_resp is not None else COUNTER_CACHE_MISSES, stage="dhs_article.relink_manifest")
+    if entity_fishing_json_resp is None:
+        try:
+            entity_fishing_json_resp = document_send_request(d, dhs_article.language, **entity_linking_kwargs)
+        except Timeout:
+            print(f'EF TIMEOUT for article {dhs_article.id}, skipping it.')
+            with open(timed_out_articles_file, "a") as f:
+                f.write(dhs_article.id)
+            return None
+        if relink_manifest is not None:
+            save_relink_response(relink_manifest_folder, dhs_article.id, entity_fishing_json_resp)
+            relink_manifest[str(dhs_article.id)] = fingerprint
+    elif verbose:
+        print("Unchanged, reusing stored entity-fishing response. ", end = '')
+    linked_doc = document_augment_from_json_response(d, entity_fishing_json_resp, **entity_linking_kwargs)
     if verbose:
         print(f"Found {len(document_get_entity_fishing_annotations(linked_doc))} annotations. ", end = '')
     
@@ -267,3 +315,55 @@ def link_dhs_articles(dhs_articles:Sequence, **entity_linking_kwargs):
         if linked_article is not None:
             yield linked_article
 
+# Incremental relinking
+# ==============================================
+# a relink manifest folder holds fingerprints.json, the fingerprints of the entity-fishing requests by article id,
+# and responses/<article id>.json, the corresponding entity-fishing responses (without their "text" field)
+
+RELINK_MANIFEST_FINGERPRINTS_FILE = "fingerprints.json"
+RELINK_MANIFEST_RESPONSES_FOLDER = "responses"
+
+def load_relink_manifest(manifest_folder) -> Dict[str, str]:
+    """article id -> fingerprint of its last entity-fishing request, empty if there is no manifest yet"""
+    fingerprints_file = path.join(manifest_folder, RELINK_MANIFEST_FINGERPRINTS_FILE)
+    if not path.isfile(fingerprints_file):
+        return dict()
+    with open(fingerprints_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_relink_manifest(manifest_folder, manifest:Dict[str, str]):
+    os.makedirs(manifest_folder, exist_ok=True)
+    fingerprints_file = path.join(manifest_folder, RELINK_MANIFEST_FINGERPRINTS_FILE)
+    with open(fingerprints_file+".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(fingerprints_file+".tmp", fingerprints_file)
+
+def load_relink_response(manifest_folder, article_id):
+    """stored entity-fishing response of article_id, None if there is none"""
+    response_file = path.join(manifest_folder, RELINK_MANIFEST_RESPONSES_FOLDER, f"{article_id}.json")
+    if not path.isfile(response_file):
+        return None
+    with open(response_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_relink_response(manifest_folder, article_id, entity_fishing_json_resp:Dict):
+    os.makedirs(path.join(manifest_folder, RELINK_MANIFEST_RESPONSES_FOLDER), exist_ok=True)
+    with open(path.join(manifest_folder, RELINK_MANIFEST_RESPONSES_FOLDER, f"{article_id}.json"), "w", encoding="utf-8") as f:
+        json.dump({k: v for k, v in entity_fishing_json_resp.items() if k!="text"}, f, ensure_ascii=False)
+
+def relink_changed(dhs_articles:Sequence, manifest_folder, **entity_linking_kwargs):
+    """Generator like link_dhs_articles(), only sending to entity-fishing the articles whose request changed since the last run
+
+    The fingerprint of each article's entity-fishing request (text after initial replacement, input entities, language and
+    query parameters, see entity_fishing.document_request_fingerprint()) is compared to the one in manifest_folder:
+    unchanged articles get their stored entity-fishing response reintegrated, the others are linked and recorded.
+    The manifest is saved when the generator finishes or is closed.
+    """
+    manifest = load_relink_manifest(manifest_folder)
+    try:
+        for a in dhs_articles:
+            linked_article = link_entities(a, relink_manifest_folder=manifest_folder, relink_manifest=manifest, **entity_linking_kwargs)
+            if linked_article is not None:
+                yield linked_article
+    finally:
+        save_relink_manifest(manifest_folder, manifest)
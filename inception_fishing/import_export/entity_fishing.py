@@ -1,15 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
 from copy import Error
+import asyncio
+import hashlib
 import json
+import time
 from os import path
 from typing import Dict
 
-import requests as r
+from requests.exceptions import Timeout
 import xml.etree.ElementTree as ET
 
 from ..Annotation import Annotation
 from ..Corpus import Corpus
 from ..Document import Document
+from ..instrumentation import timed, increment, COUNTER_BYTES_SENT, COUNTER_BYTES_RECEIVED, COUNTER_ENTITIES_RETURNED, COUNTER_API_REQUESTS
 from ..utils import wikidata_entity_base_url, ANNOTATION_ORIGIN_ENTITY_FISHING
+from .async_http import get_async_session, get_async_timeout
+from .compressed_io import open_file
+from .transport import Transport, get_default_transport
+from .scheduling import LatencyModel, lpt_order, processing_estimate
 
 
 entity_fishing_default_base_url = "http://localhost:8090"
@@ -107,21 +116,28 @@ def annotation_from_json(json_annotation:Dict):
 # ==============================================
 
 
+@timed()
 def document_get_text_from_corpus_folder(document:Document, corpus_folder):
     text_file_path = path.join(corpus_folder, document.name) if corpus_folder else document.name
-    with open(text_file_path) as f:
+    with open_file(text_file_path) as f:
             document.text = f.read()
             return document.text
 
 
-def document_to_xml_tag(document:Document, **annotation_kwargs):
+@timed()
+def document_to_xml_tag(document:Document, layers=None, **annotation_kwargs):
+    """Returns the entity-fishing <document> tag
+
+    layers: origins of the annotations to write, all annotations if None
+    """
     document_tag = ET.Element("document")
     document_tag.set("docName", document.name)
-    for a in document.annotations:
+    for a in document.get_layers_annotations(layers):
         document_tag.append(annotation_to_xml_tag(a, **annotation_kwargs))
     return document_tag
 
 
+@timed()
 def document_from_tag(ef_xml_document_tag, corpus_folder = None) -> Document:
     """Returns a Document from a lxml etree entity-fishing document tag"""
     annotations_tags = ef_xml_document_tag.findall("annotation")
@@ -137,8 +153,10 @@ non_query_kwargs = set([
     "as_dict",
     "include_entities",
     "entity_fishing_base_url",
-    "annotations_origin"
+    "annotations_origin",
+    "transport"
 ])
+@timed()
 def document_to_json_request(document:Document, language, include_entities=True, as_dict=False, **query_kwargs):
     """Formats the document to a json (dict or str) ready to be sent to the entity-fishing API
     
@@ -176,23 +194,67 @@ def document_to_json_request(document:Document, language, include_entities=True,
         return json.dumps(json_query)
 
 
-def document_send_request(document:Document, language:str, entity_fishing_base_url = entity_fishing_default_base_url, include_entities=True, entity_fishing_timeout=None ,**query_kwargs):
-    """Sends the document text to a running entity-fishing service for NE linking and returns the response json.
-    
+# changing it invalidates all fingerprints
+FINGERPRINT_VERSION = "1"
+
+def document_request_fingerprint(document:Document, language, include_entities=True, entity_fishing_base_url=None, entity_fishing_timeout=None, session=None, transport=None, **query_kwargs):
+    """sha256 hex digest of the entity-fishing request of document: text, input entities, language and query parameters
+
+    takes the same arguments as document_send_request(), two documents with the same fingerprint get the same entity-fishing response
     """
-    entity_fishing_disambiguate_url = entity_fishing_base_url+entity_fishing_disambiguate_path
     json_query = document_to_json_request(document, language, include_entities, True, **query_kwargs)
-    entity_fishing_resp = r.post(entity_fishing_disambiguate_url, json = json_query, timeout=entity_fishing_timeout)
+    return hashlib.sha256(
+        (FINGERPRINT_VERSION+json.dumps(json_query, sort_keys=True, ensure_ascii=False)).encode("utf-8")
+    ).hexdigest()
 
-    if entity_fishing_resp.status_code!=200:
+def json_response_from_entity_fishing_response(entity_fishing_disambiguate_url, status_code, content, json_query):
+    """Parses entity-fishing's response content, raises an Error if status_code isn't 200"""
+    if status_code!=200:
         raise Error(
             f"inception_fishing.entity_fishing.document_send_request() Non 200 response code. "+
             f"Unable to connect to entity-fishing at url '{entity_fishing_disambiguate_url}'.\n"+
-            f"Response code: {entity_fishing_resp.status_code}\nResponse content:\n{entity_fishing_resp.content}"+
+            f"Response code: {status_code}\nResponse content:\n{content}"+
             f"Sent JSON query:\n{json_query}"
         )
-    return json.loads(entity_fishing_resp.content)
+    return json.loads(content)
+
+@timed()
+def document_send_request(document:Document, language:str, entity_fishing_base_url = entity_fishing_default_base_url, include_entities=True, entity_fishing_timeout=None, transport:Transport=None, **query_kwargs):
+    """Sends the document text to a running entity-fishing service for NE linking and returns the response json.
 
+    transport: the HTTP client, transport.get_default_transport() (requests) if None, see transport
+    """
+    entity_fishing_disambiguate_url = entity_fishing_base_url+entity_fishing_disambiguate_path
+    json_query = document_to_json_request(document, language, include_entities, True, **query_kwargs)
+    json_query_bytes = json.dumps(json_query).encode("utf-8")
+    status_code, content = (transport or get_default_transport())(entity_fishing_disambiguate_url, json_query_bytes, entity_fishing_timeout)
+    increment(COUNTER_API_REQUESTS, stage="entity_fishing.document_send_request")
+    increment(COUNTER_BYTES_SENT, len(json_query_bytes), stage="entity_fishing.document_send_request")
+    increment(COUNTER_BYTES_RECEIVED, len(content), stage="entity_fishing.document_send_request")
+    return json_response_from_entity_fishing_response(entity_fishing_disambiguate_url, status_code, content, json_query)
+
+@timed()
+async def adocument_send_request(document:Document, language:str, entity_fishing_base_url = entity_fishing_default_base_url, include_entities=True, entity_fishing_timeout=None, session=None, **query_kwargs):
+    """async version of document_send_request(), through the shared aiohttp session of async_http (or the given session)
+
+    raises requests.exceptions.Timeout on timeout, as document_send_request()
+    """
+    entity_fishing_disambiguate_url = entity_fishing_base_url+entity_fishing_disambiguate_path
+    json_query = document_to_json_request(document, language, include_entities, True, **query_kwargs)
+    json_query_bytes = json.dumps(json_query).encode("utf-8")
+    session = session if session is not None else get_async_session()
+    try:
+        async with session.post(entity_fishing_disambiguate_url, data = json_query_bytes, headers = {"Content-Type": "application/json"}, timeout=get_async_timeout(entity_fishing_timeout)) as entity_fishing_resp:
+            content = await entity_fishing_resp.read()
+            status_code = entity_fishing_resp.status
+    except asyncio.TimeoutError as e:
+        raise Timeout(f"inception_fishing.entity_fishing.adocument_send_request() timeout after {entity_fishing_timeout}s for document {document.name}") from e
+    increment(COUNTER_API_REQUESTS, stage="entity_fishing.adocument_send_request")
+    increment(COUNTER_BYTES_SENT, len(json_query_bytes), stage="entity_fishing.adocument_send_request")
+    increment(COUNTER_BYTES_RECEIVED, len(content), stage="entity_fishing.adocument_send_request")
+    return json_response_from_entity_fishing_response(entity_fishing_disambiguate_url, status_code, content, json_query)
+
+@timed()
 def document_augment_from_json_response(document:Document, json_response:Dict, annotations_origin = ANNOTATION_ORIGIN_ENTITY_FISHING, **kwargs):
     """Augments a document with the annotation obtained from the entity-fishing API
 
@@ -207,13 +269,15 @@ def document_augment_from_json_response(document:Document, json_response:Dict, a
 
     entities = json_response.get("entities")
     if entities is not None:
+        increment(COUNTER_ENTITIES_RETURNED, len(entities), stage="entity_fishing.document_augment_from_json_response")
         new_annotations = [annotation_from_json(j) for j in entities]
         for a in new_annotations:
             a.extra_fields["origin"] = annotations_origin
-        document.annotations = document.annotations+new_annotations
+        document.add_annotations(new_annotations)
 
     return document
     
+@timed()
 def document_named_entity_linking(document, language:str, include_entities=True, **kwargs):
     """Augments document with entity-fishing named entities annotations
 
@@ -221,30 +285,112 @@ def document_named_entity_linking(document, language:str, include_entities=True,
     """
     entity_fishing_json_resp = document_send_request(document, language, include_entities = include_entities, **kwargs)
     return document_augment_from_json_response(document, entity_fishing_json_resp, **kwargs)
+
+@timed()
+async def adocument_named_entity_linking(document, language:str, include_entities=True, **kwargs):
+    """async version of document_named_entity_linking()"""
+    entity_fishing_json_resp = await adocument_send_request(document, language, include_entities = include_entities, **kwargs)
+    return document_augment_from_json_response(document, entity_fishing_json_resp, **kwargs)
     
 
 # Corpus
 # ==============================================
 
+def _document_request_size(document:Document, include_entities=True):
+    """(text length, number of input entities) of the entity-fishing request of document"""
+    return len(document.text), len(document.annotations) if include_entities else 0
 
+@timed()
+def corpus_named_entity_linking(corpus:Corpus, language:str, jobs=4, latency_model:LatencyModel=None, include_entities=True, **kwargs):
+    """Augments the documents of corpus with entity-fishing named entities annotations, jobs requests at a time
 
+    documents are sent longest-processing-time-first, estimated from their text length and number of input entities,
+    each request with the timeout of latency_model (LatencyModel(entity_fishing_timeout) by default), which is fitted to the observed latencies,
+    timed-out requests included (see LatencyModel.observe_censored()). A given entity_fishing_timeout caps the timeouts of all requests.
+    Documents whose request timed out are sent again once with latency_model.max_timeout (capped too), and left unchanged if it times out again.
+    Documents whose request failed otherwise (entity-fishing error, invalid response...) are left unchanged, with their error in the report.
+    Returns the run report: makespan, sum of latencies, and their ratio, the parallel speedup, the timed out and failed documents, see get_linking_report()
+    """
+    max_timeout = kwargs.pop("entity_fishing_timeout", None)
+    if latency_model is None:
+        latency_model = LatencyModel(default_timeout=max_timeout)
+    def capped(timeout):
+        if max_timeout is None:
+            return timeout
+        return max_timeout if timeout is None else min(timeout, max_timeout)
+    retry_timeout = capped(latency_model.max_timeout)
+    documents = lpt_order(corpus.documents, lambda d: processing_estimate(*_document_request_size(d, include_entities)))
+    def link(document, timeout=None):
+        """(document, latency, None if linked else "timeout" or the error message)"""
+        text_length, n_entities = _document_request_size(document, include_entities)
+        if timeout is None:
+            timeout = capped(latency_model.timeout(text_length, n_entities))
+        start = time.perf_counter()
+        try:
+            document_named_entity_linking(document, language, include_entities, entity_fishing_timeout=timeout, **kwargs)
+        except Timeout:
+            latency = time.perf_counter()-start
+            latency_model.observe_censored(text_length, n_entities, latency)
+            return document, latency, "timeout"
+        except Exception as e:
+            return document, time.perf_counter()-start, f"{type(e).__name__}: {e}"
+        latency = time.perf_counter()-start
+        latency_model.observe(text_length, n_entities, latency)
+        return document, latency, None
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(link, documents))
+        timed_out_documents = [document for document, _, failure in results if failure=="timeout"]
+        retry_results = list(executor.map(lambda d: link(d, retry_timeout), timed_out_documents))
+    makespan = time.perf_counter()-start
+    coefficients = latency_model.coefficients()
+    latencies_sum = sum(latency for _, latency, _ in results+retry_results)
+    return {
+        "documents": len(results),
+        "jobs": jobs,
+        "makespan_s": makespan,
+        "latencies_sum_s": latencies_sum,
+        "speedup": latencies_sum/makespan if makespan>0 else None,
+        "timed_out_documents": [document.name for document in timed_out_documents],
+        "retry_timeout_s": retry_timeout,
+        "failed_documents": [document.name for document, _, failure in retry_results if failure=="timeout"],
+        "errors": {document.name: failure for document, _, failure in results+retry_results if failure not in (None, "timeout")},
+        "latency_model_coefficients": coefficients.tolist() if coefficients is not None else None,
+    }
+
+def get_linking_report(report:Dict) -> str:
+    """Human readable report of corpus_named_entity_linking()"""
+    lines = [
+        f"{report['documents']} documents linked by {report['jobs']} jobs in {report['makespan_s']:.2f}s "+
+        f"(sum of latencies {report['latencies_sum_s']:.2f}s, speedup {report['speedup'] or 0:.2f}x)"
+    ]
+    if report["timed_out_documents"]:
+        lines.append(f"{len(report['timed_out_documents'])} timed out, sent again with a {report['retry_timeout_s']}s timeout: {', '.join(report['timed_out_documents'])}")
+    if report["failed_documents"]:
+        lines.append(f"{len(report['failed_documents'])} timed out again, left unchanged: {', '.join(report['failed_documents'])}")
+    if report["errors"]:
+        lines.append(f"{len(report['errors'])} failed, left unchanged:")
+        lines += [f"  {name}: {error}" for name, error in report["errors"].items()]
+    return "\n".join(lines)
+
+@timed()
 def corpus_to_xml_tag(corpus:Corpus, **document_kwargs):
     corpus_tag = ET.Element(corpus.name+".entityAnnotation")
     for d in corpus.documents:
         corpus_tag.append(document_to_xml_tag(d, **document_kwargs))
     return corpus_tag
 
+@timed()
 def corpus_to_xml_file(corpus:Corpus, filepath, **document_kwargs):
     intro_str = '<?xml version="1.0" encoding="UTF-8" standalone="no"?>'
     corpus_tag = corpus_to_xml_tag(corpus, **document_kwargs)
     
-    ET.ElementTree(corpus_tag).write(filepath, encoding="utf-8")
-    with open(filepath, "r", encoding="utf-8") as file:
-        content = file.read()
-    with open(filepath, "w", encoding="utf-8") as file:
-        file.write(intro_str+"\n"+content)
+    with open_file(filepath, "w") as file:
+        file.write(intro_str+"\n")
+        ET.ElementTree(corpus_tag).write(file, encoding="unicode")
 
 
+@timed()
 def corpus_from_tag_and_corpus(ef_xml_root_tag, corpus_folder = None) -> Corpus:
     """Returns a Corpus object from a lxml.etree tag (the root of an EF evaluation XML output) and the EF corpus folder"""
     name = ef_xml_root_tag.tag.replace(".entityAnnotation", "")
@@ -0,0 +1,235 @@
+"""Gazetteer annotator: every known label of the DHS/wikidata links table, found in one pass over each document text
+
+Labels (itemLabel, namefr, namede, nameit, nameen columns of the get_dhs_id_from_wikidata_id csv) are compiled once into
+an Aho-Corasick automaton, pickled next to the csv and rebuilt when the csv or the options change.
+Scanning a text is then linear in its length, whatever the number of labels.
+
+    from inception_fishing.import_export import gazetteer
+    gazetteer.document_annotate_gazetteer(document)
+"""
+from __future__ import annotations
+from collections import deque
+from os import path
+import pickle
+import re
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from ..Annotation import Annotation
+from ..Corpus import Corpus
+from ..Document import Document
+from ..instrumentation import timed, increment, COUNTER_ANNOTATIONS_PROCESSED, COUNTER_CACHE_HITS, COUNTER_CACHE_MISSES
+from ..utils import ANNOTATION_ORIGIN_GAZETTEER
+from .get_dhs_id_from_wikidata_id import DEFAULT_WIKIDATA_LINKS_FILE, read_wikidata_links_rows
+
+
+GAZETTEER_CACHE_VERSION = 1
+GAZETTEER_LABEL_COLUMNS = ["itemLabel", "namefr", "namede", "nameit", "nameen"]
+GAZETTEER_MIN_LABEL_LENGTH = 3
+# wikipedia disambiguation suffix: "Berne (canton)"
+WIKIPEDIA_DISAMBIGUATION_REGEX = re.compile(r"\s*\([^()]*\)$")
+# itemLabel of entities without label in the label language
+WIKIDATA_ID_REGEX = re.compile(r"^Q\d+$")
+# transitions keys: state*UNICODE_SIZE+ord(character)
+UNICODE_SIZE = 0x110000
+
+
+class AhoCorasickAutomaton:
+    """Aho-Corasick automaton over strings, each added string having a value
+
+    transitions of all states are in a single dict, keyed by state*UNICODE_SIZE+ord(character), for compactness
+    """
+    def __init__(self):
+        self.transitions:Dict[int, int] = dict()
+        self.depths:List[int] = [0]
+        self.values:List = [None]
+        self.fail:List[int] = [0]
+        # next state along the fail links with a value, 0 if none
+        self.output_links:List[int] = [0]
+    def add(self, string, value):
+        """Adds string with value, replacing the value of an already added string. Call build() after the last add()"""
+        state = 0
+        for character in string:
+            key = state*UNICODE_SIZE+ord(character)
+            next_state = self.transitions.get(key)
+            if next_state is None:
+                next_state = len(self.depths)
+                self.transitions[key] = next_state
+                self.depths.append(self.depths[state]+1)
+                self.values.append(None)
+            state = next_state
+        self.values[state] = value
+    def build(self):
+        """Computes the fail and output links, breadth-first"""
+        n_states = len(self.depths)
+        self.fail = [0]*n_states
+        self.output_links = [0]*n_states
+        children = [[] for _ in range(n_states)]
+        for key, child in self.transitions.items():
+            children[key//UNICODE_SIZE].append((key%UNICODE_SIZE, child))
+        queue = deque(child for _, child in children[0])
+        while queue:
+            state = queue.popleft()
+            for code, child in children[state]:
+                fallback = self.fail[state]
+                while fallback and fallback*UNICODE_SIZE+code not in self.transitions:
+                    fallback = self.fail[fallback]
+                child_fail = self.transitions.get(fallback*UNICODE_SIZE+code, 0)
+                self.fail[child] = child_fail if child_fail!=child else 0
+                self.output_links[child] = self.fail[child] if self.values[self.fail[child]] is not None else self.output_links[self.fail[child]]
+                queue.append(child)
+        return self
+    def iter_matches(self, text) -> Iterator[Tuple[int, int, object]]:
+        """(start, end, value) of all occurrences of the added strings in text, by end"""
+        transitions, fail, values, output_links, depths = self.transitions, self.fail, self.values, self.output_links, self.depths
+        state = 0
+        for end, character in enumerate(text, 1):
+            code = ord(character)
+            while state and state*UNICODE_SIZE+code not in transitions:
+                state = fail[state]
+            state = transitions.get(state*UNICODE_SIZE+code, 0)
+            match_state = state if values[state] is not None else output_links[state]
+            while match_state:
+                yield end-depths[match_state], end, values[match_state]
+                match_state = output_links[match_state]
+
+
+class Gazetteer:
+    """Labels -> wikidata ids, matched in texts by an AhoCorasickAutomaton"""
+    def __init__(self, labels_wikidata_ids:Dict[str, Sequence[str]], case_sensitive=True):
+        self.case_sensitive = case_sensitive
+        self.automaton = AhoCorasickAutomaton()
+        for label, wikidata_ids in labels_wikidata_ids.items():
+            self.automaton.add(label if case_sensitive else label.lower(), tuple(sorted(set(wikidata_ids))))
+        self.automaton.build()
+    def _searched_text(self, text):
+        if self.case_sensitive:
+            return text
+        lowered = text.lower()
+        if len(lowered)==len(text):
+            return lowered
+        # characters whose lower case is longer (İ) would shift offsets
+        return "".join(c if len(c.lower())!=1 else c.lower() for c in text)
+    def matches(self, text, word_boundaries=True, longest_match=True) -> List[Tuple[int, int, Tuple[str]]]:
+        """(start, end, wikidata ids) of the labels found in text, sorted by start
+
+        word_boundaries: only labels not preceded nor followed by a word character
+        longest_match: leftmost longest non-overlapping matches, all matches otherwise
+        """
+        matches = self.automaton.iter_matches(self._searched_text(text))
+        if word_boundaries:
+            matches = (
+                m for m in matches
+                if (m[0]==0 or not _is_word_character(text[m[0]-1])) and (m[1]==len(text) or not _is_word_character(text[m[1]]))
+            )
+        matches = sorted(matches, key=lambda m: (m[0], -m[1]))
+        if not longest_match:
+            return matches
+        non_overlapping = []
+        last_end = -1
+        for m in matches:
+            if m[0]>=last_end:
+                non_overlapping.append(m)
+                last_end = m[1]
+        return non_overlapping
+
+def _is_word_character(character):
+    return character.isalnum() or character=="_"
+
+# Gazetteer loading
+# ==============================================
+
+def clean_label(label):
+    """label without wikipedia disambiguation suffix, None for empty labels and labels that are wikidata ids"""
+    if label is None:
+        return None
+    label = WIKIPEDIA_DISAMBIGUATION_REGEX.sub("", label.strip())
+    if label=="" or WIKIDATA_ID_REGEX.match(label):
+        return None
+    return label
+
+def labels_from_wikidata_links(wikidata_links_file=DEFAULT_WIKIDATA_LINKS_FILE, label_columns=GAZETTEER_LABEL_COLUMNS, min_label_length=GAZETTEER_MIN_LABEL_LENGTH) -> Dict[str, List[str]]:
+    """label -> wikidata ids of the rows of the DHS/wikidata links csv, this file only, see get_dhs_id_from_wikidata_id.read_wikidata_links_rows()"""
+    labels_wikidata_ids = dict()
+    for row in read_wikidata_links_rows(wikidata_links_file):
+        wikidata_id = row["wikidata_id"]
+        for column in label_columns:
+            label = clean_label(row.get(column))
+            if label is not None and len(label)>=min_label_length:
+                ids = labels_wikidata_ids.setdefault(label, [])
+                if wikidata_id not in ids:
+                    ids.append(wikidata_id)
+    return labels_wikidata_ids
+
+def default_cache_file(wikidata_links_file):
+    return wikidata_links_file+".gazetteer.pickle"
+
+LOADED_GAZETTEERS:Dict[Tuple, Gazetteer] = dict()
+
+@timed()
+def load_gazetteer(wikidata_links_file=DEFAULT_WIKIDATA_LINKS_FILE, label_columns=GAZETTEER_LABEL_COLUMNS,
+        case_sensitive=True, min_label_length=GAZETTEER_MIN_LABEL_LENGTH, cache_file=None
+    ) -> Gazetteer:
+    """Gazetteer of the DHS/wikidata links csv, from memory, else from its pickled cache_file, else built and pickled
+
+    cache_file defaults to <wikidata_links_file>.gazetteer.pickle, it is rebuilt when the csv or the options changed.
+    cache_file=False: no disk cache
+    """
+    if cache_file is None:
+        cache_file = default_cache_file(wikidata_links_file)
+    source_stat = path.getmtime(wikidata_links_file), path.getsize(wikidata_links_file)
+    key = (GAZETTEER_CACHE_VERSION, path.abspath(wikidata_links_file), source_stat, tuple(label_columns), case_sensitive, min_label_length)
+    gazetteer = LOADED_GAZETTEERS.get(key)
+    if gazetteer is None and cache_file and path.exists(cache_file):
+        with open(cache_file, "rb") as f:
+            cached_key, cached_gazetteer = pickle.load(f)
+        if cached_key==key:
+            gazetteer = cached_gazetteer
+    if gazetteer is None:
+        increment(COUNTER_CACHE_MISSES, stage="gazetteer.load_gazetteer")
+        gazetteer = Gazetteer(labels_from_wikidata_links(wikidata_links_file, label_columns, min_label_length), case_sensitive)
+        if cache_file:
+            with open(cache_file, "wb") as f:
+                pickle.dump((key, gazetteer), f, protocol=pickle.HIGHEST_PROTOCOL)
+    else:
+        increment(COUNTER_CACHE_HITS, stage="gazetteer.load_gazetteer")
+    LOADED_GAZETTEERS[key] = gazetteer
+    return gazetteer
+
+# Documents
+# ==============================================
+
+@timed()
+def document_annotate_gazetteer(document:Document, gazetteer:Gazetteer=None, word_boundaries=True, longest_match=True, skip_existing=True, annotations_origin=ANNOTATION_ORIGIN_GAZETTEER):
+    """Adds an annotation for each gazetteer label found in document.text, returns the new annotations
+
+    gazetteer: load_gazetteer() by default
+    labels of several wikidata ids get no wikidata id, the ids being in the "gazetteer_wikidata_ids" extra field
+    skip_existing: no annotation on spans already annotated in the document with the same wikidata id
+    """
+    if gazetteer is None:
+        gazetteer = load_gazetteer()
+    existing_spans = {(a.start, a.end, a.wikidata_entity_id) for a in document.annotations} if skip_existing else set()
+    new_annotations = []
+    for start, end, wikidata_ids in gazetteer.matches(document.text, word_boundaries, longest_match):
+        wikidata_id = wikidata_ids[0] if len(wikidata_ids)==1 else None
+        if (start, end, wikidata_id) in existing_spans:
+            continue
+        extra_fields = {"origin": annotations_origin}
+        if wikidata_id is None:
+            extra_fields["gazetteer_wikidata_ids"] = list(wikidata_ids)
+        new_annotations.append(Annotation(start, end, wikidata_id, mention=document.text[start:end], extra_fields=extra_fields))
+    increment(COUNTER_ANNOTATIONS_PROCESSED, len(new_annotations), stage="gazetteer.document_annotate_gazetteer")
+    document.add_annotations(new_annotations)
+    return new_annotations
+
+# Corpus
+# ==============================================
+
+@timed()
+def corpus_annotate_gazetteer(corpus:Corpus, gazetteer:Gazetteer=None, **document_kwargs):
+    """document_annotate_gazetteer() on all documents of corpus, the gazetteer being loaded once"""
+    if gazetteer is None:
+        gazetteer = load_gazetteer()
+    for d in corpus.documents:
+        document_annotate_gazetteer(d, gazetteer, **document_kwargs)
+    return corpus
@@ -3,6 +3,8 @@ from csv import DictReader
 from os import path
 from warnings import warn
 
+from .compressed_io import open_file
+
 
 
 script_folder = path.dirname(__file__)
@@ -24,25 +26,31 @@ SPARQL_DOWNLOAD_DISCLAIMER = \
     f"A prerequisite is to have manually downloaded the result of the sparql query in file '{WIKIDATA_QUERY_FILE}' at 'https://query.wikidata.org/' " + \
     f"as a csv at this location '{DEFAULT_WIKIDATA_LINKS_FILE}' (or provide to this function the location of your csv file as function argument)."
 
+def read_wikidata_links_rows(wikidata_links_file = DEFAULT_WIKIDATA_LINKS_FILE):
+    """Generator of the rows of the csv links file, as dicts with an added "wikidata_id" (short id) field\n\n""" + SPARQL_DOWNLOAD_DISCLAIMER
+    if not path.exists(wikidata_links_file):
+        raise Exception(
+            f"inception_fishing.import_export.get_dhs_id_from_wikidata_id() wikidata_links_file at location '{wikidata_links_file}' not found.\n"+
+            SPARQL_DOWNLOAD_DISCLAIMER
+        )
+    with open_file(wikidata_links_file, newline="") as f:
+        for r in DictReader(f):
+            r["wikidata_id"] = get_wikidata_short_id(r[WIKIDATA_URL_KEY])
+            yield r
+
 def load_wikidata_links(wikidata_links_file = DEFAULT_WIKIDATA_LINKS_FILE):
-    """Loads the csv links in a dictionary of the form wikidata_id->list(linked wikidata_wikipedia entities)\n\n""" + SPARQL_DOWNLOAD_DISCLAIMER
+    """Loads the csv links in a dictionary of the form wikidata_id->list(linked wikidata_wikipedia entities)
+
+    the dictionary is shared by all loaded csv files, see read_wikidata_links_rows() for the rows of a single file\n\n""" + SPARQL_DOWNLOAD_DISCLAIMER
     if wikidata_links_file not in LOADED_WIKIDATA_LINKS_CSVS:
-        if not path.exists(wikidata_links_file):
-            raise Exception(
-                f"inception_fishing.import_export.get_dhs_id_from_wikidata_id() wikidata_links_file at location '{wikidata_links_file}' not found.\n"+
-                SPARQL_DOWNLOAD_DISCLAIMER
-            )
-        with open(wikidata_links_file) as f:
-            reader = DictReader(f)
-            for r in reader:
-                wd_id = get_wikidata_short_id(r[WIKIDATA_URL_KEY])
-                r["wikidata_id"] = wd_id
-                if wd_id in WIKIDATA_LINKS and r["dhsid"]!=WIKIDATA_LINKS[wd_id]['dhsid']:
-                    #warn(f"inception_fishing.import_export.get_dhs_id_from_wikidata_id(): wikidata id {wd_id} pointing to multiple DHS ids: {[WIKIDATA_LINKS[wd_id]['dhsid'], r['dhsid']]}") 
-                    if wd_id not in WIKIDATA_DUPLICATE_LINKS:
-                        WIKIDATA_DUPLICATE_LINKS[wd_id] = [WIKIDATA_LINKS[wd_id]]
-                    WIKIDATA_DUPLICATE_LINKS[wd_id].append(r)
-                WIKIDATA_LINKS[wd_id] = r
+        for r in read_wikidata_links_rows(wikidata_links_file):
+            wd_id = r["wikidata_id"]
+            if wd_id in WIKIDATA_LINKS and r["dhsid"]!=WIKIDATA_LINKS[wd_id]['dhsid']:
+                #warn(f"inception_fishing.import_export.get_dhs_id_from_wikidata_id(): wikidata id {wd_id} pointing to multiple DHS ids: {[WIKIDATA_LINKS[wd_id]['dhsid'], r['dhsid']]}") 
+                if wd_id not in WIKIDATA_DUPLICATE_LINKS:
+                    WIKIDATA_DUPLICATE_LINKS[wd_id] = [WIKIDATA_LINKS[wd_id]]
+                WIKIDATA_DUPLICATE_LINKS[wd_id].append(r)
+            WIKIDATA_LINKS[wd_id] = r
         LOADED_WIKIDATA_LINKS_CSVS.add(wikidata_links_file)
     return WIKIDATA_LINKS
 
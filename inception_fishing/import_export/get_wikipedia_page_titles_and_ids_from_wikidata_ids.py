@@ -1,10 +1,20 @@
 # %%
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
 from os import path
-from typing import Sequence
+from threading import RLock
+import time
+from typing import Dict, Sequence
 
+import numpy as np
 import pandas as pd
 import requests as r
 
+from .async_http import get_async_session
+from .single_flight import SingleFlightBatcher, AsyncSingleFlightBatcher
+from ..instrumentation import timed, increment, COUNTER_CACHE_HITS, COUNTER_CACHE_MISSES, COUNTER_CACHE_STALE, COUNTER_API_REQUESTS
+
 """
 Two step solution to get wikipedia page id from wikidata entity id (from maxlath answer to https://stackoverflow.com/questions/43746798/how-to-get-wikipedia-pageid-from-wikidata-id):
 1) find wikipedia page title (in any language) using wikidata API: `
@@ -17,32 +27,99 @@ https://en.wikipedia.org/w/api.php?action=query&titles=Fribourg&format=json
 # %%
 script_folder = path.dirname(__file__)
 
+def _read_cache_csv(file_path, columns):
+    """Reads a cache csv, entries of csv files written without fetched_at count as fetched now"""
+    if not path.isfile(file_path):
+        return pd.DataFrame(columns=columns)
+    dtf = pd.read_csv(file_path)
+    if "fetched_at" not in dtf.columns:
+        dtf["fetched_at"] = time.time()
+    return dtf
+
+# cache entries: the value is null for a negative entry (no sitelink in that language, no page of that title),
+# fetched_at is the epoch time of the API response, see WIKIPEDIA_CACHE_POSITIVE_TTL and WIKIPEDIA_CACHE_NEGATIVE_TTL
 DTF_LANG_WDID_WPTITLE_FILE = path.join(script_folder, "wikidata_id_wikipedia_title.csv")
-DTF_LANG_WDID_WPTITLE_COLUMNS=["language", "wikidata_id", "wikipedia_title"]
-DTF_LANG_WDID_WPTITLE = pd.read_csv(DTF_LANG_WDID_WPTITLE_FILE) if path.isfile(DTF_LANG_WDID_WPTITLE_FILE) else pd.DataFrame(columns=DTF_LANG_WDID_WPTITLE_COLUMNS)
+DTF_LANG_WDID_WPTITLE_COLUMNS=["language", "wikidata_id", "wikipedia_title", "fetched_at"]
+DTF_LANG_WDID_WPTITLE = _read_cache_csv(DTF_LANG_WDID_WPTITLE_FILE, DTF_LANG_WDID_WPTITLE_COLUMNS)
 
 DTF_LANG_WPTITLE_WPID_FILE = path.join(script_folder, "wikipedia_title_and_id.csv")
-DTF_LANG_WPTITLE_WPID_COLUMNS = ["language", "wikipedia_title","wikipedia_id"]
-DTF_LANG_WPTITLE_WPID = pd.read_csv(DTF_LANG_WPTITLE_WPID_FILE) if path.isfile(DTF_LANG_WPTITLE_WPID_FILE) else pd.DataFrame(columns=DTF_LANG_WPTITLE_WPID_COLUMNS)
+DTF_LANG_WPTITLE_WPID_COLUMNS = ["language", "wikipedia_title","wikipedia_id", "fetched_at"]
+DTF_LANG_WPTITLE_WPID = _read_cache_csv(DTF_LANG_WPTITLE_WPID_FILE, DTF_LANG_WPTITLE_WPID_COLUMNS)
+# missing pages used to be cached with the negative page id the wikipedia API gives them
+DTF_LANG_WPTITLE_WPID.loc[pd.to_numeric(DTF_LANG_WPTITLE_WPID.wikipedia_id, errors="coerce")<0, "wikipedia_id"] = None
 
+# all the cached wikidata ids with their wikipedia page titles and ids, see save_wikipedia_page_titles_and_ids_csv()
 DTF_LANG_WDID_WPTITLE_WPID_FILE = path.join(script_folder, "wikidata_id_wikipedia_title_and_id.csv")
-DTF_LANG_WDID_WPTITLE_WPID_COLUMNS=["language", "wikidata_id", "wikipedia_title"]
-DTF_LANG_WDID_WPTITLE_WPID = pd.read_csv(DTF_LANG_WDID_WPTITLE_WPID_FILE) if path.isfile(DTF_LANG_WDID_WPTITLE_WPID_FILE) else pd.DataFrame(columns=DTF_LANG_WDID_WPTITLE_WPID_COLUMNS)
+
+# guards the cache dataframes above and their csv files, shared by threads
+WIKIPEDIA_CACHE_LOCK = RLock()
+# seconds a lookup waits for the ids of concurrent lookups to fill a 50 ids API call, see single_flight.py
+WIKIPEDIA_COALESCING_WINDOW = 0.01
+# seconds after which cache entries are queried again, None: never
+WIKIPEDIA_CACHE_POSITIVE_TTL = None
+WIKIPEDIA_CACHE_NEGATIVE_TTL = 30*24*3600
+# stale entries are returned as they are and refreshed by a background thread, instead of being queried again before returning
+WIKIPEDIA_CACHE_BACKGROUND_REFRESH = False
+
+def configure_wikipedia_cache(positive_ttl=..., negative_ttl=..., background_refresh=None):
+    """Sets the TTLs (seconds, None: never expire) of positive and negative cache entries, and the background refresh mode"""
+    global WIKIPEDIA_CACHE_POSITIVE_TTL, WIKIPEDIA_CACHE_NEGATIVE_TTL, WIKIPEDIA_CACHE_BACKGROUND_REFRESH
+    if positive_ttl is not ...:
+        WIKIPEDIA_CACHE_POSITIVE_TTL = positive_ttl
+    if negative_ttl is not ...:
+        WIKIPEDIA_CACHE_NEGATIVE_TTL = negative_ttl
+    if background_refresh is not None:
+        WIKIPEDIA_CACHE_BACKGROUND_REFRESH = background_refresh
 # %%
 
 def dataframe_from_cartesian_product(columns:Sequence[str], col0:Sequence, col1:Sequence):
     return pd.DataFrame({columns[0]: col0}).merge(pd.DataFrame({columns[1]: col1}), how="cross")
 
+def _dataframe_keys(dtf, columns):
+    # null values as "" so that they match each other, whether None or NaN (once read from a csv)
+    return pd.MultiIndex.from_frame(dtf[columns].astype(object).fillna("").astype(str))
+
 def dataframe_only_rows_not_in_dtf2(dtf1, dtf2, columns):
-    dtf1["XXcombinedXX"] = ""
-    dtf2["XXcombinedXX"] = ""
-    for c in columns:
-        dtf1["XXcombinedXX"] = dtf1["XXcombinedXX"] +"-XYX-"+dtf1[c]
-        dtf2["XXcombinedXX"] = dtf2["XXcombinedXX"] +"-XYX-"+dtf2[c]
-    dtf1_kept = dtf1.loc[~dtf1["XXcombinedXX"].isin(dtf2["XXcombinedXX"])].copy()
-    del dtf1_kept["XXcombinedXX"]
-    del dtf2["XXcombinedXX"]
-    return dtf1_kept
+    """rows of dtf1 whose values in columns aren't in any row of dtf2, null values matching each other"""
+    return dtf1.loc[~_dataframe_keys(dtf1, columns).isin(_dataframe_keys(dtf2, columns))].copy()
+
+def _rows_to_query(dtf_keys:pd.DataFrame, cache:pd.DataFrame, key_columns, value_column, stage):
+    """(missing, stale) rows of dtf_keys: absent from cache, and whose cache entry is older than its TTL
+    
+    the TTL of an entry being WIKIPEDIA_CACHE_NEGATIVE_TTL if its value_column is null, WIKIPEDIA_CACHE_POSITIVE_TTL otherwise
+    """
+    cache_entries = cache[key_columns+[value_column, "fetched_at"]].drop_duplicates(key_columns, keep="last")
+    merged = dtf_keys[key_columns].merge(cache_entries, on=key_columns, how="left", indicator=True)
+    missing = (merged["_merge"]=="left_only").values
+    ttl = np.where(
+        merged[value_column].isnull().values,
+        np.inf if WIKIPEDIA_CACHE_NEGATIVE_TTL is None else WIKIPEDIA_CACHE_NEGATIVE_TTL,
+        np.inf if WIKIPEDIA_CACHE_POSITIVE_TTL is None else WIKIPEDIA_CACHE_POSITIVE_TTL
+    )
+    age = time.time()-pd.to_numeric(merged["fetched_at"], errors="coerce").fillna(0).values
+    stale = (~missing) & (age>ttl)
+    increment(COUNTER_CACHE_HITS, int((~missing & ~stale).sum()), stage=stage)
+    increment(COUNTER_CACHE_MISSES, int(missing.sum()), stage=stage)
+    increment(COUNTER_CACHE_STALE, int(stale.sum()), stage=stage)
+    return merged.loc[missing, key_columns].reset_index(drop=True), merged.loc[stale, key_columns].reset_index(drop=True)
+
+_refresh_executor:ThreadPoolExecutor = None
+def _refresh_in_background(batcher:SingleFlightBatcher, keys, dtf_name, file_path):
+    """Fetches keys with batcher in a background thread, then saves the cache dataframe of global name dtf_name"""
+    global _refresh_executor
+    if _refresh_executor is None:
+        _refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wikipedia_cache_refresh")
+    def refresh():
+        batcher.get(keys)
+        with WIKIPEDIA_CACHE_LOCK:
+            _save_csv(globals()[dtf_name], file_path)
+    return _refresh_executor.submit(refresh)
+
+def _save_csv(dtf:pd.DataFrame, file_path):
+    """Writes dtf to file_path through a temporary file, so that readers never see a partially written csv"""
+    tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+    dtf.to_csv(tmp_file_path, index=False)
+    os.replace(tmp_file_path, file_path)
 
 # %%
 
@@ -51,41 +128,62 @@ wikipedia_page_titles_by_lng_and_wikidata_ids = dict()
 # %%
 
 
+WIKIDATA_API_URL = "https://www.wikidata.org/w/api.php"
+
+def _wikidata_sitelinks_request_params(dtf_lang_wdid):
+    """params of the wikidata API query for the sitelinks of dtf_lang_wdid's wikidata ids, max 50 items at a time"""
+    if dtf_lang_wdid.wikidata_id.nunique()>50:
+        raise(Exception(f"wiki._get_wikipedia_page_titles_from_wikidata_ids_max50() more than 50 wikidata_ids given:\n{list(dtf_lang_wdid.wikidata_id)}"))
+    return {
+        "format":  "json",
+        "action":  "wbgetentities",
+        "ids":  "|".join(dict.fromkeys(dtf_lang_wdid.wikidata_id)),
+        "props":  "sitelinks"
+    }
+
+def _wikipedia_page_titles_from_wikidata_sitelinks_response(dtf_lang_wdid, data):
+    """dataframe of wikipedia page titles from the wikidata API sitelinks json response"""
+    entities = data["entities"]
+    return pd.DataFrame(columns=['language', 'wikidata_id', "wikipedia_title"], data=[
+        (
+            lng,
+            wd_id,
+            entities[wd_id]["sitelinks"][lng+"wiki"]["title"]
+            if (lng+"wiki") in entities[wd_id]["sitelinks"]
+            else None
+        )
+        for i,(lng, wd_id) in dtf_lang_wdid.iterrows()
+    ])
+
+@timed()
 def _get_wikipedia_page_titles_from_wikidata_ids_max50(dtf_lang_wdid, verbose=False):#wikidata_ids:Sequence[str], languages:Sequence[str]=None):
     """Returns wikipedia page titles from wikidata ids, max 50 items at a time"""
     #dtf_lang_wdid:pd.DataFrame = dataframe_from_ids_and_lngs(wikidata_ids, languages)
 
-    if dtf_lang_wdid.shape[0]>50:
-        raise(Exception(f"wiki._get_wikipedia_page_titles_from_wikidata_ids_max50() more than 50 wikidata_ids given:\n{wikidata_ids}"))
+    params = _wikidata_sitelinks_request_params(dtf_lang_wdid)
     if dtf_lang_wdid.shape[0]>0:
         if verbose:
             print(f"Querying wikidata API for wikipedia page titles, wikidata ids: {list(dtf_lang_wdid.wikidata_id)}")
-        url = "https://www.wikidata.org/w/api.php"
-        params = {
-            "format":  "json",
-            "action":  "wbgetentities",
-            "ids":  "|".join(dtf_lang_wdid.wikidata_id),
-            "props":  "sitelinks"
-        }
-
-        resp = r.get(url=url, params=params)
-        data = resp.json()
-        
-        entities = data["entities"]
-        new_lng_wd_id_title = pd.DataFrame(columns=['language', 'wikidata_id', "wikipedia_title"], data=[
-            (
-                lng,
-                wd_id,
-                entities[wd_id]["sitelinks"][lng+"wiki"]["title"]
-                if (lng+"wiki") in entities[wd_id]["sitelinks"]
-                else None
-            )
-            for i,(lng, wd_id) in dtf_lang_wdid.iterrows()
-        ])
-        return new_lng_wd_id_title
+        resp = r.get(url=WIKIDATA_API_URL, params=params)
+        increment(COUNTER_API_REQUESTS, stage="wikidata_api")
+        return _wikipedia_page_titles_from_wikidata_sitelinks_response(dtf_lang_wdid, resp.json())
+
+@timed()
+async def _aget_wikipedia_page_titles_from_wikidata_ids_max50(dtf_lang_wdid, verbose=False, session=None):
+    """async version of _get_wikipedia_page_titles_from_wikidata_ids_max50()"""
+    params = _wikidata_sitelinks_request_params(dtf_lang_wdid)
+    if dtf_lang_wdid.shape[0]>0:
+        if verbose:
+            print(f"Querying wikidata API for wikipedia page titles, wikidata ids: {list(dtf_lang_wdid.wikidata_id)}")
+        session = session if session is not None else get_async_session()
+        async with session.get(WIKIDATA_API_URL, params=params) as resp:
+            data = await resp.json(content_type=None)
+        increment(COUNTER_API_REQUESTS, stage="wikidata_api")
+        return _wikipedia_page_titles_from_wikidata_sitelinks_response(dtf_lang_wdid, data)
 
 # %%
 
+@timed()
 def get_wikipedia_page_titles_from_wikidata_ids(wikidata_ids:Sequence[str], languages:Sequence[str]=None, verbose=False):
     """Returns wikipedia page titles from wikidata ids
 
@@ -94,24 +192,86 @@ def get_wikipedia_page_titles_from_wikidata_ids(wikidata_ids:Sequence[str], lang
     note: this function returns a global accumulator that accumulates this function's results over a program run.
     always iterate over your own wikidata_ids, not this function result. consider further optimization if long runs.
     """
-    global DTF_LANG_WDID_WPTITLE
+    dtf_wdid_lang_to_query = _wikidata_ids_not_in_page_titles_cache(wikidata_ids, languages)
+    if dtf_wdid_lang_to_query.shape[0]>0:
+        if verbose:
+            print(f"Querying wikidata API for wikipedia page titles of {dtf_wdid_lang_to_query.shape[0]} (language, wikidata id)")
+        PAGE_TITLES_BATCHER.get(list(zip(dtf_wdid_lang_to_query.language, dtf_wdid_lang_to_query.wikidata_id)))
+        with WIKIPEDIA_CACHE_LOCK:
+            _save_csv(DTF_LANG_WDID_WPTITLE, DTF_LANG_WDID_WPTITLE_FILE)
+    return DTF_LANG_WDID_WPTITLE
+
+@timed()
+async def aget_wikipedia_page_titles_from_wikidata_ids(wikidata_ids:Sequence[str], languages:Sequence[str]=None, verbose=False, session=None):
+    """async version of get_wikipedia_page_titles_from_wikidata_ids(), batches of 50 wikidata ids are queried concurrently"""
+    dtf_wdid_lang_to_query = _wikidata_ids_not_in_page_titles_cache(wikidata_ids, languages)
+    if dtf_wdid_lang_to_query.shape[0]>0:
+        if verbose:
+            print(f"Querying wikidata API for wikipedia page titles of {dtf_wdid_lang_to_query.shape[0]} (language, wikidata id)")
+        batcher = _get_async_batcher(_async_page_titles_batchers, _afetch_page_titles_batch, session, batch_unit=_key_wikidata_id)
+        await batcher.get(list(zip(dtf_wdid_lang_to_query.language, dtf_wdid_lang_to_query.wikidata_id)))
+        with WIKIPEDIA_CACHE_LOCK:
+            _save_csv(DTF_LANG_WDID_WPTITLE, DTF_LANG_WDID_WPTITLE_FILE)
+    return DTF_LANG_WDID_WPTITLE
 
+def _fetch_page_titles_batch(lang_wdid_keys):
+    """fetches the titles of max 50 (language, wikidata_id) into the page titles cache"""
+    _add_to_page_titles_cache([
+        _get_wikipedia_page_titles_from_wikidata_ids_max50(pd.DataFrame(lang_wdid_keys, columns=["language", "wikidata_id"]))
+    ])
+    return dict()
+
+async def _afetch_page_titles_batch(lang_wdid_keys, session=None):
+    _add_to_page_titles_cache([
+        await _aget_wikipedia_page_titles_from_wikidata_ids_max50(pd.DataFrame(lang_wdid_keys, columns=["language", "wikidata_id"]), session=session)
+    ])
+    return dict()
+
+def _key_wikidata_id(lang_wdid_key):
+    return lang_wdid_key[1]
+
+# (language, wikidata_id) lookups of concurrent threads are coalesced into shared 50 ids wikidata API calls
+PAGE_TITLES_BATCHER = SingleFlightBatcher(_fetch_page_titles_batch, 50, window=WIKIPEDIA_COALESCING_WINDOW, batch_unit=_key_wikidata_id)
+_async_page_titles_batchers:Dict = dict()
+
+def _get_async_batcher(batchers:Dict, afetch_batch, session=None, batch_group=None, batch_unit=None) -> AsyncSingleFlightBatcher:
+    """AsyncSingleFlightBatcher of the running event loop and session, created if needed"""
+    loop = asyncio.get_running_loop()
+    batcher = batchers.get((loop, session))
+    if batcher is None:
+        for closed in [k for k in batchers if k[0].is_closed()]:
+            del batchers[closed]
+        async def afetch_batch_with_session(keys):
+            return await afetch_batch(keys, session)
+        batcher = AsyncSingleFlightBatcher(afetch_batch_with_session, 50, batch_group, WIKIPEDIA_COALESCING_WINDOW, batch_unit)
+        batchers[(loop, session)] = batcher
+    return batcher
+
+def _wikidata_ids_not_in_page_titles_cache(wikidata_ids:Sequence[str], languages:Sequence[str]):
+    """(language, wikidata_id) dataframe of the combinations to query: absent from the page titles cache or stale
+
+    with WIKIPEDIA_CACHE_BACKGROUND_REFRESH, stale combinations are refreshed in background and not returned
+    """
     dtf_lang_wdid:pd.DataFrame = dataframe_from_cartesian_product(["language", "wikidata_id"], languages,list(wikidata_ids))
     dtf_lang_wdid = dtf_lang_wdid.loc[dtf_lang_wdid.wikidata_id!="null"].copy()
 
-    dtf_wdid_lang_to_query = dataframe_only_rows_not_in_dtf2(dtf_lang_wdid, DTF_LANG_WDID_WPTITLE, ["wikidata_id", "language"])
-
-    accumulator = pd.DataFrame(columns=DTF_LANG_WDID_WPTITLE_COLUMNS)
-    rest = dtf_wdid_lang_to_query
-    while rest.shape[0]>0:
-        current = rest[:50]
-        rest = rest[50:]
-        new_dtf_wdid_lang_title = _get_wikipedia_page_titles_from_wikidata_ids_max50(current, verbose)
-        accumulator = accumulator.append(new_dtf_wdid_lang_title)
-    accumulator = dataframe_only_rows_not_in_dtf2(accumulator, DTF_LANG_WDID_WPTITLE, ["wikidata_id", "language"])
-    DTF_LANG_WDID_WPTITLE = DTF_LANG_WDID_WPTITLE.append(accumulator)
-    DTF_LANG_WDID_WPTITLE.to_csv(DTF_LANG_WDID_WPTITLE_FILE, index=False)
-    return DTF_LANG_WDID_WPTITLE
+    with WIKIPEDIA_CACHE_LOCK:
+        missing, stale = _rows_to_query(dtf_lang_wdid, DTF_LANG_WDID_WPTITLE, ["language", "wikidata_id"], "wikipedia_title", "wikipedia_page_titles_cache")
+    if WIKIPEDIA_CACHE_BACKGROUND_REFRESH:
+        if stale.shape[0]>0:
+            _refresh_in_background(PAGE_TITLES_BATCHER, list(zip(stale.language, stale.wikidata_id)), "DTF_LANG_WDID_WPTITLE", DTF_LANG_WDID_WPTITLE_FILE)
+        return missing
+    return pd.concat([missing, stale], ignore_index=True)
+
+def _add_to_page_titles_cache(new_dtfs_wdid_lang_title):
+    """Adds the API results dataframes to the page titles cache (in memory), replacing older entries, returns the cache"""
+    global DTF_LANG_WDID_WPTITLE
+    accumulator = pd.concat([pd.DataFrame(columns=DTF_LANG_WDID_WPTITLE_COLUMNS)]+[d for d in new_dtfs_wdid_lang_title if d is not None])
+    accumulator["fetched_at"] = time.time()
+    with WIKIPEDIA_CACHE_LOCK:
+        kept = dataframe_only_rows_not_in_dtf2(DTF_LANG_WDID_WPTITLE, accumulator, ["wikidata_id", "language"])
+        DTF_LANG_WDID_WPTITLE = pd.concat([kept, accumulator], ignore_index=True)
+        return DTF_LANG_WDID_WPTITLE
 
 
 # %%
@@ -121,74 +281,201 @@ wikipedia_page_ids_by_lng_and_title = dict()
 # %%
 
 
-def _get_wikipedia_pages_ids_from_titles_max50( wikipedia_titles:Sequence[str], language:str, verbose=False):
-    """Returns wikipedia page ids from their title, max 50 items at a time"""
-    #dtf_lang_wptitle = dataframe_from_cartesian_product(["wikipedia_title", "language"],wikidata_ids, [language])
+def _wikipedia_api_url(language:str):
+    return f"https://{language}.wikipedia.org/w/api.php"
 
-    # get_wikipedia_pages_ids_from_titles(wikipedia_titles:str, language:str):
+def _wikipedia_pages_ids_request_params(wikipedia_titles:Sequence[str]):
+    """params of the wikipedia API query for the page ids of wikipedia_titles, max 50 items at a time"""
     if len(wikipedia_titles)>50:
         raise(Exception(f"wiki._get_wikipedia_pages_ids_from_titles_max50() more than 50 wikipedia_titles given:\n{wikipedia_titles}"))
+    return {
+        "action":  "query",
+        "titles":  "|".join(wikipedia_titles),
+        "format":  "json"
+    }
+
+def _wikipedia_pages_ids_from_query_response(language:str, data):
+    """dataframe of wikipedia page ids from the wikipedia API query json response
+
+    titles are the queried ones, not the ones normalized by the API, and missing pages get a None page id
+    """
+    pages = data["query"]["pages"]
+    queried_titles = {n["to"]: n["from"] for n in data["query"].get("normalized", [])}
+    return pd.DataFrame(columns=['language', "wikipedia_title", 'wikipedia_id'], data=[
+        (
+            language,
+            queried_titles.get(page_info["title"], page_info["title"]),
+            None if ("missing" in page_info or "invalid" in page_info or int(pageid)<0) else pageid
+        )
+        for pageid,page_info in pages.items()
+    ])
+
+@timed()
+def _get_wikipedia_pages_ids_from_titles_max50( wikipedia_titles:Sequence[str], language:str, verbose=False):
+    """Returns wikipedia page ids from their title, max 50 items at a time"""
+    params = _wikipedia_pages_ids_request_params(wikipedia_titles)
     if len(wikipedia_titles)>0:
         if verbose:
             print(f"Querying wikipedia API for wikipedia page ids in {language} version, wikipedia page titles: {list(wikipedia_titles)}")
-        url = f"https://{language}.wikipedia.org/w/api.php"
-        params = {
-            "action":  "query",
-            "titles":  "|".join(wikipedia_titles),
-            "format":  "json"
-        }
-        resp = r.get(url=url, params=params)
-        data = resp.json()
-            
-        pages = data["query"]["pages"]
-
-
-        new_dtf_lng_title_wpid = pd.DataFrame(columns=['language', "wikipedia_title", 'wikipedia_id'], data=[
-            (
-                language,
-                page_info["title"],
-                pageid
-            )
-            for pageid,page_info in pages.items()
-        ])
-        return new_dtf_lng_title_wpid
+        resp = r.get(url=_wikipedia_api_url(language), params=params)
+        increment(COUNTER_API_REQUESTS, stage="wikipedia_api")
+        return _wikipedia_pages_ids_from_query_response(language, resp.json())
+
+@timed()
+async def _aget_wikipedia_pages_ids_from_titles_max50( wikipedia_titles:Sequence[str], language:str, verbose=False, session=None):
+    """async version of _get_wikipedia_pages_ids_from_titles_max50()"""
+    params = _wikipedia_pages_ids_request_params(wikipedia_titles)
+    if len(wikipedia_titles)>0:
+        if verbose:
+            print(f"Querying wikipedia API for wikipedia page ids in {language} version, wikipedia page titles: {list(wikipedia_titles)}")
+        session = session if session is not None else get_async_session()
+        async with session.get(_wikipedia_api_url(language), params=params) as resp:
+            data = await resp.json(content_type=None)
+        increment(COUNTER_API_REQUESTS, stage="wikipedia_api")
+        return _wikipedia_pages_ids_from_query_response(language, data)
+
+def import_into_wikipedia_caches(dtfs_lang_wdid_wptitle:Sequence[pd.DataFrame]=(), dtfs_lang_wptitle_wpid:Sequence[pd.DataFrame]=(), save=True):
+    """Adds (language, wikidata_id, wikipedia_title) and (language, wikipedia_title, wikipedia_id) dataframes to the caches, e.g. from dumps
+
+    imported entries replace cached ones and count as fetched now, the caches csv files are saved once if save
+    """
+    dtfs_lang_wdid_wptitle = [d for d in dtfs_lang_wdid_wptitle if d.shape[0]>0]
+    dtfs_lang_wptitle_wpid = [d for d in dtfs_lang_wptitle_wpid if d.shape[0]>0]
+    with WIKIPEDIA_CACHE_LOCK:
+        if len(dtfs_lang_wdid_wptitle)>0:
+            _add_to_page_titles_cache(dtfs_lang_wdid_wptitle)
+            if save:
+                _save_csv(DTF_LANG_WDID_WPTITLE, DTF_LANG_WDID_WPTITLE_FILE)
+        if len(dtfs_lang_wptitle_wpid)>0:
+            _add_to_page_ids_cache(dtfs_lang_wptitle_wpid)
+            if save:
+                _save_csv(DTF_LANG_WPTITLE_WPID, DTF_LANG_WPTITLE_WPID_FILE)
+
+def save_wikipedia_caches(page_titles=True, page_ids=True):
+    """Writes the page titles and/or page ids caches to their csv files, e.g. once after import_into_wikipedia_caches(save=False) calls"""
+    with WIKIPEDIA_CACHE_LOCK:
+        if page_titles:
+            _save_csv(DTF_LANG_WDID_WPTITLE, DTF_LANG_WDID_WPTITLE_FILE)
+        if page_ids:
+            _save_csv(DTF_LANG_WPTITLE_WPID, DTF_LANG_WPTITLE_WPID_FILE)
 
 # %%
 
-def get_wikipedia_pages_ids_from_titles(dtf_lang_wptitle:pd.DataFrame):#wikipedia_titles:Sequence[str], language:str):
+@timed()
+def get_wikipedia_pages_ids_from_titles(dtf_lang_wptitle:pd.DataFrame, verbose=False):#wikipedia_titles:Sequence[str], language:str):
     """Returns wikipedia page ids from their title, max 50 items at a time"""
-    global DTF_LANG_WPTITLE_WPID
+    dtf_lang_wptitle_to_query = _titles_not_in_page_ids_cache(dtf_lang_wptitle)
+    if dtf_lang_wptitle_to_query.shape[0]>0:
+        if verbose:
+            print(f"Querying wikipedia API for wikipedia page ids of {dtf_lang_wptitle_to_query.shape[0]} (language, wikipedia title)")
+        PAGE_IDS_BATCHER.get(list(zip(dtf_lang_wptitle_to_query.language, dtf_lang_wptitle_to_query.wikipedia_title)))
+        with WIKIPEDIA_CACHE_LOCK:
+            _save_csv(DTF_LANG_WPTITLE_WPID, DTF_LANG_WPTITLE_WPID_FILE)
+    return DTF_LANG_WPTITLE_WPID
 
-    #dtf_lang_wptitle:pd.DataFrame = dataframe_from_cartesian_product(["wikipedia_title", "language"],wikipedia_titles, [language])
-    
-    dtf_lang_wptitle = dtf_lang_wptitle.loc[~dtf_lang_wptitle.wikipedia_title.isnull()].copy()
-
-    dtf_lang_wptitle_to_query = dataframe_only_rows_not_in_dtf2(dtf_lang_wptitle, DTF_LANG_WPTITLE_WPID, ["wikipedia_title", "language"])
-
-    accumulator = pd.DataFrame(columns=DTF_LANG_WPTITLE_WPID_COLUMNS)
-    for lng in dtf_lang_wptitle_to_query.language.unique():
-        rest = dtf_lang_wptitle_to_query.loc[dtf_lang_wptitle_to_query.language==lng]
-        while rest.shape[0]>0:
-            current = rest[:50]
-            rest = rest[50:]
-            new_dtf_dtf_lang_wptitle_wpid = _get_wikipedia_pages_ids_from_titles_max50(current.wikipedia_title, lng)
-            accumulator = accumulator.append(new_dtf_dtf_lang_wptitle_wpid)
-    accumulator = dataframe_only_rows_not_in_dtf2(accumulator, DTF_LANG_WPTITLE_WPID, ["wikipedia_title", "language"])
-    DTF_LANG_WPTITLE_WPID = DTF_LANG_WPTITLE_WPID.append(accumulator)
-    DTF_LANG_WPTITLE_WPID.to_csv(DTF_LANG_WPTITLE_WPID_FILE, index=False)
+@timed()
+async def aget_wikipedia_pages_ids_from_titles(dtf_lang_wptitle:pd.DataFrame, verbose=False, session=None):
+    """async version of get_wikipedia_pages_ids_from_titles(), batches of 50 titles are queried concurrently"""
+    dtf_lang_wptitle_to_query = _titles_not_in_page_ids_cache(dtf_lang_wptitle)
+    if dtf_lang_wptitle_to_query.shape[0]>0:
+        if verbose:
+            print(f"Querying wikipedia API for wikipedia page ids of {dtf_lang_wptitle_to_query.shape[0]} (language, wikipedia title)")
+        batcher = _get_async_batcher(_async_page_ids_batchers, _afetch_page_ids_batch, session, _key_language)
+        await batcher.get(list(zip(dtf_lang_wptitle_to_query.language, dtf_lang_wptitle_to_query.wikipedia_title)))
+        with WIKIPEDIA_CACHE_LOCK:
+            _save_csv(DTF_LANG_WPTITLE_WPID, DTF_LANG_WPTITLE_WPID_FILE)
     return DTF_LANG_WPTITLE_WPID
+
+def _key_language(lang_key):
+    return lang_key[0]
+
+def _fetch_page_ids_batch(lang_wptitle_keys):
+    """fetches the page ids of max 50 (language, wikipedia_title) of the same language into the page ids cache"""
+    _add_to_page_ids_cache([
+        _get_wikipedia_pages_ids_from_titles_max50([t for l, t in lang_wptitle_keys], lang_wptitle_keys[0][0])
+    ])
+    return dict()
+
+async def _afetch_page_ids_batch(lang_wptitle_keys, session=None):
+    _add_to_page_ids_cache([
+        await _aget_wikipedia_pages_ids_from_titles_max50([t for l, t in lang_wptitle_keys], lang_wptitle_keys[0][0], session=session)
+    ])
+    return dict()
+
+# (language, wikipedia_title) lookups of concurrent threads are coalesced into shared 50 titles wikipedia API calls
+PAGE_IDS_BATCHER = SingleFlightBatcher(_fetch_page_ids_batch, 50, _key_language, WIKIPEDIA_COALESCING_WINDOW)
+_async_page_ids_batchers:Dict = dict()
+
+def _titles_not_in_page_ids_cache(dtf_lang_wptitle:pd.DataFrame):
+    """(language, wikipedia_title) dataframe of the combinations to query: absent from the page ids cache or stale
+
+    null titles (negative entries of the page titles cache) are never queried.
+    with WIKIPEDIA_CACHE_BACKGROUND_REFRESH, stale combinations are refreshed in background and not returned
+    """
+    dtf_lang_wptitle = dtf_lang_wptitle.loc[~dtf_lang_wptitle.wikipedia_title.isnull()].drop_duplicates(["language", "wikipedia_title"])
+
+    with WIKIPEDIA_CACHE_LOCK:
+        missing, stale = _rows_to_query(dtf_lang_wptitle, DTF_LANG_WPTITLE_WPID, ["language", "wikipedia_title"], "wikipedia_id", "wikipedia_page_ids_cache")
+    if WIKIPEDIA_CACHE_BACKGROUND_REFRESH:
+        if stale.shape[0]>0:
+            _refresh_in_background(PAGE_IDS_BATCHER, list(zip(stale.language, stale.wikipedia_title)), "DTF_LANG_WPTITLE_WPID", DTF_LANG_WPTITLE_WPID_FILE)
+        return missing
+    return pd.concat([missing, stale], ignore_index=True)
+
+def _add_to_page_ids_cache(new_dtfs_lang_wptitle_wpid):
+    """Adds the API results dataframes to the page ids cache (in memory), replacing older entries, returns the cache"""
+    global DTF_LANG_WPTITLE_WPID
+    accumulator = pd.concat([pd.DataFrame(columns=DTF_LANG_WPTITLE_WPID_COLUMNS)]+[d for d in new_dtfs_lang_wptitle_wpid if d is not None])
+    accumulator["fetched_at"] = time.time()
+    with WIKIPEDIA_CACHE_LOCK:
+        kept = dataframe_only_rows_not_in_dtf2(DTF_LANG_WPTITLE_WPID, accumulator, ["wikipedia_title", "language"])
+        DTF_LANG_WPTITLE_WPID = pd.concat([kept, accumulator], ignore_index=True)
+        return DTF_LANG_WPTITLE_WPID
 # %%
 
 
-def get_wikipedia_page_titles_and_ids_from_wikidata_ids(wikidata_ids:str, languages:str):
+def _requested_page_titles(wikidata_ids:Sequence[str], languages:Sequence[str]):
+    """rows of the page titles cache for the given wikidata ids and languages"""
+    with WIKIPEDIA_CACHE_LOCK:
+        return DTF_LANG_WDID_WPTITLE.loc[
+            DTF_LANG_WDID_WPTITLE.wikidata_id.isin(set(wikidata_ids)) & DTF_LANG_WDID_WPTITLE.language.isin(set(languages))
+        ].drop(columns="fetched_at").drop_duplicates(["language", "wikidata_id"], keep="last")
+
+def _merge_page_ids(dtf_lang_wdid_wptitle:pd.DataFrame):
+    with WIKIPEDIA_CACHE_LOCK:
+        dtf_lang_wptitle_wpid = DTF_LANG_WPTITLE_WPID.drop(columns="fetched_at").drop_duplicates(["language", "wikipedia_title"], keep="last")
+    return pd.merge(dtf_lang_wdid_wptitle, dtf_lang_wptitle_wpid, on=["language","wikipedia_title"], how="left")
+
+@timed()
+def get_wikipedia_page_titles_and_ids_from_wikidata_ids(wikidata_ids:str, languages:str, save=True):
     """Returns wikipedia page titles and ids from wikidata ids
-    """
-    dtf_lang_wdid_wptitle = get_wikipedia_page_titles_from_wikidata_ids(wikidata_ids, languages)
 
-    dtf_lang_wptitle_wpid = get_wikipedia_pages_ids_from_titles(dtf_lang_wdid_wptitle)
-    DTF_LANG_WDID_WPTITLE_WPID = pd.merge(dtf_lang_wdid_wptitle, dtf_lang_wptitle_wpid, on=["language","wikipedia_title"],how="outer")
-    DTF_LANG_WDID_WPTITLE_WPID.to_csv(DTF_LANG_WDID_WPTITLE_WPID_FILE, index=False)
-    return DTF_LANG_WDID_WPTITLE_WPID
+    a (language, wikidata_id, wikipedia_title, wikipedia_id) dataframe of the given wikidata ids and languages only (not of all
+    the cached ones), titles and ids being null if there is no such page. Only the entries absent from the caches are queried.
+    save: also write all the cached entries to DTF_LANG_WDID_WPTITLE_WPID_FILE, see save_wikipedia_page_titles_and_ids_csv()
+    """
+    get_wikipedia_page_titles_from_wikidata_ids(wikidata_ids, languages)
+    dtf_lang_wdid_wptitle = _requested_page_titles(wikidata_ids, languages)
+    get_wikipedia_pages_ids_from_titles(dtf_lang_wdid_wptitle)
+    if save:
+        save_wikipedia_page_titles_and_ids_csv()
+    return _merge_page_ids(dtf_lang_wdid_wptitle)
+
+@timed()
+async def aget_wikipedia_page_titles_and_ids_from_wikidata_ids(wikidata_ids:str, languages:str, session=None, save=True):
+    """async version of get_wikipedia_page_titles_and_ids_from_wikidata_ids()"""
+    await aget_wikipedia_page_titles_from_wikidata_ids(wikidata_ids, languages, session=session)
+    dtf_lang_wdid_wptitle = _requested_page_titles(wikidata_ids, languages)
+    await aget_wikipedia_pages_ids_from_titles(dtf_lang_wdid_wptitle, session=session)
+    if save:
+        save_wikipedia_page_titles_and_ids_csv()
+    return _merge_page_ids(dtf_lang_wdid_wptitle)
+
+def save_wikipedia_page_titles_and_ids_csv(file_path=None):
+    """Writes all cached (language, wikidata_id, wikipedia_title, wikipedia_id) to a csv file, DTF_LANG_WDID_WPTITLE_WPID_FILE by default"""
+    with WIKIPEDIA_CACHE_LOCK:
+        dtf_lang_wdid_wptitle = DTF_LANG_WDID_WPTITLE.drop(columns="fetched_at").drop_duplicates(["language", "wikidata_id"], keep="last")
+        _save_csv(_merge_page_ids(dtf_lang_wdid_wptitle), file_path if file_path is not None else DTF_LANG_WDID_WPTITLE_WPID_FILE)
 # %%
 
 if __name__=="__main__":
@@ -36,4 +36,20 @@ DHS_NERD_EXTRA_TAGS = [
     "FAMILY"
 ]
 
-DHS_NERD_ANNOTATIONS_TAGS = GROBID_NER_TAGS + DHS_NERD_EXTRA_TAGS
\ No newline at end of file
+DHS_NERD_ANNOTATIONS_TAGS = GROBID_NER_TAGS + DHS_NERD_EXTRA_TAGS
+
+# CLEF-HIPE coarse entity types (pers, loc, org, time, prod) of grobid NER tags, tags absent from it have no HIPE type
+GROBID_NER_TAGS_TO_HIPE_COARSE = {
+    "PERSON": "pers",
+    "FAMILY": "pers",
+    "LOCATION": "loc",
+    "INSTALLATION": "loc",
+    "ORGANISATION": "org",
+    "INSTITUTION": "org",
+    "BUSINESS": "org",
+    "SPORT_TEAM": "org",
+    "PERIOD": "time",
+    "CREATION": "prod",
+    "MEDIA": "prod",
+    "WEBSITE": "prod",
+}
@@ -1,16 +1,30 @@
+from functools import partial
+from io import BytesIO
+from multiprocessing import Pool
 from os import path, listdir
-
+import platform
 import re
+import sys
+import time
+from typing import Iterable, Iterator, Tuple
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP64_LIMIT
+import zlib
 
 from ..Annotation import Annotation
 from ..Corpus import Corpus
 from ..Document import Document
+from ..instrumentation import timed, increment, COUNTER_ANNOTATIONS_PROCESSED
 from . import wikipedia
+from .compressed_io import open_file
 
 
 INCEPTION_DEFAULT_TAGSET_TAG_STR = '<type2:TagsetDescription xmi:id="8999" sofa="1" begin="0" end="0" layer="de.tudarmstadt.ukp.dkpro.core.api.ner.type.NamedEntity" name="Named Entity tags" input="false"/>'
 inception_being_regex=re.compile(r'begin="(\d+)"')
 inception_end_regex=re.compile(r'end="(\d+)"')
+# folders of the annotators' and the curated documents in an inception project export
+INCEPTION_EXPORT_ANNOTATION_FOLDER = "annotation"
+INCEPTION_EXPORT_CURATION_FOLDER = "curation"
+INCEPTION_CURATION_USER = "CURATION_USER"
 
 
 
@@ -79,14 +93,18 @@ def annotation_from_tag_string(
 
 
 
-def document_to_xml_string(document, force_single_sentence=False, annotations_xmi_ids_start = 9000, tagset_tag_str=INCEPTION_DEFAULT_TAGSET_TAG_STR, **named_entity_to_tag_kwargs):
+@timed()
+def document_to_xml_string(document, force_single_sentence=False, annotations_xmi_ids_start = 9000, tagset_tag_str=INCEPTION_DEFAULT_TAGSET_TAG_STR, layers=None, **named_entity_to_tag_kwargs):
     """Returns a valid inception input file content in UIMA CAS XMI (XML 1.1) format
     
     Note: replaces " characters in text wth ', to simplify handling of XML.
     force_single_sentence=True forces the whole document text to be considered as a single sentence by inception,
     useful when text contains non-sentence-inducing dots (such as abbreviation dots in the DHS)
+    layers: origins of the annotations to write, all annotations if None
     """
-    annotations_str ="\n            ".join(annotation_to_tag_string(ne, annotations_xmi_ids_start+i, **named_entity_to_tag_kwargs) for i, ne in enumerate(document.annotations))
+    annotations = document.get_layers_annotations(layers)
+    increment(COUNTER_ANNOTATIONS_PROCESSED, len(annotations), stage="inception.document_to_xml_string")
+    annotations_str ="\n            ".join(annotation_to_tag_string(ne, annotations_xmi_ids_start+i, **named_entity_to_tag_kwargs) for i, ne in enumerate(annotations))
     force_single_sentence_str = f'\n            <type4:Sentence xmi:id="8998" sofa="1" begin="0" end="{len(document.text)}"/>' if force_single_sentence else ""
     return f'''
     <?xml version="1.1" encoding="UTF-8"?>
@@ -95,19 +113,22 @@ def document_to_xml_string(document, force_single_sentence=False, annotations_xm
         {annotations_str}{force_single_sentence_str}
         {tagset_tag_str}
         <cas:Sofa xmi:id="1" sofaNum="1" sofaID="_InitialView" mimeType="text" sofaString="{document.text.replace('"', "'")}"/>
-        <cas:View sofa="1" members="{("8998 " if force_single_sentence else "")}8999 {" ".join(str(annotations_xmi_ids_start+i) for i, ne in enumerate(document.annotations))}"/>
+        <cas:View sofa="1" members="{("8998 " if force_single_sentence else "")}8999 {" ".join(str(annotations_xmi_ids_start+i) for i in range(len(annotations)))}"/>
     </xmi:XMI>
     '''.replace("\n    ","\n").strip()
+@timed()
 def document_to_xml_file(document, folder="./", filename=None, **inception_to_xml_string_kwargs):
     if not filename:
         filename=document.name
-    with open(path.join(folder,filename), "w") as outfile:
+    with open_file(path.join(folder,filename), "w") as outfile:
         outfile.write(document_to_xml_string(document, **inception_to_xml_string_kwargs))
 
+@timed()
 def document_from_string(name, document_string, named_entity_tag_name="custom:Entityfishinglayer", text_tag_name="cas:Sofa", **named_entity_parser_kwargs) -> Document:
     named_entity_tag_regex = "<"+named_entity_tag_name+r"\W.+?/>"
     tags = re.findall(named_entity_tag_regex, document_string)
     annotations = [annotation_from_tag_string(t, **named_entity_parser_kwargs) for t in tags if named_entity_tag_name in t]
+    increment(COUNTER_ANNOTATIONS_PROCESSED, len(annotations), stage="inception.document_from_string")
     text_regex = r'sofaString="(.+?)"'
     text = re.search(text_regex, document_string).group(1)
     return Document(
@@ -116,8 +137,9 @@ def document_from_string(name, document_string, named_entity_tag_name="custom:En
         text
     )
 
+@timed()
 def document_from_file(file_path, document_name=None, **inception_from_string_kwargs) -> Document:
-    with open(file_path) as file:
+    with open_file(file_path) as file:
         document_string = file.read()
         if document_name is None:
             document_name = file_path
@@ -127,6 +149,7 @@ def document_from_file(file_path, document_name=None, **inception_from_string_kw
 # ==============================================
 
 
+@timed()
 def corpus_from_directory(
         name,
         dir_path,
@@ -148,6 +171,125 @@ def corpus_from_directory(
     corpus = Corpus(name, documents)
     if wikipedia_page_titles_and_ids_language is not None:
         #corpus.set_annotations_wikipedia_page_titles_and_ids(wikipedia_page_titles_and_ids_language)
-        wikipedia.corpus_set_annotations_page_titles_and_ids(corpus, None, wikipedia_page_titles_and_ids_language)
+        wikipedia.corpus_set_annotations_page_titles_and_ids(corpus, wikipedia_page_titles_and_ids_language)
 
     return corpus
+
+def inception_export_zip_members(zip_file:ZipFile, inception_user_name, folder=INCEPTION_EXPORT_ANNOTATION_FOLDER) -> Iterator:
+    """(document name, member) of the <folder>/<document>/<user>.xmi or .zip (zipped XMI) members of an inception project export"""
+    member_regex = re.compile(r"(?:^|/)"+re.escape(folder)+r"/([^/]+)/"+re.escape(inception_user_name)+r"\.(?:xmi|zip)$")
+    for member in zip_file.infolist():
+        match = member_regex.search(member.filename)
+        if match:
+            yield match.group(1), member
+
+def read_inception_export_zip_member(zip_file:ZipFile, member) -> str:
+    """XMI string of an inception export member, unzipped in memory if the XMI is zipped"""
+    content = zip_file.read(member)
+    if member.filename.endswith(".zip"):
+        with ZipFile(BytesIO(content)) as xmi_zip:
+            xmi_members = [m for m in xmi_zip.namelist() if m.endswith(".xmi")]
+            if len(xmi_members)==0:
+                raise Exception(f"inception.read_inception_export_zip_member(): no .xmi file in zipped member {member.filename}")
+            content = xmi_zip.read(xmi_members[0])
+    return content.decode("utf-8")
+
+def _document_from_name_and_string(name_and_string, **document_from_string_kwargs) -> Document:
+    return document_from_string(*name_and_string, **document_from_string_kwargs)
+
+def documents_from_inception_export_zip(zip_path, inception_user_name, folder=INCEPTION_EXPORT_ANNOTATION_FOLDER, jobs=1, chunksize=16, **document_from_string_kwargs) -> Iterator[Document]:
+    """Streams the documents of an inception project export zip, read from the archive without extraction
+
+    folder: INCEPTION_EXPORT_CURATION_FOLDER with inception_user_name=INCEPTION_CURATION_USER for the curated documents
+    jobs: number of worker processes parsing the XMI, the archive being read by the calling process
+    """
+    with ZipFile(zip_path) as zip_file:
+        names_and_strings = (
+            (name, read_inception_export_zip_member(zip_file, member))
+            for name, member in inception_export_zip_members(zip_file, inception_user_name, folder)
+        )
+        parse = partial(_document_from_name_and_string, **document_from_string_kwargs)
+        if jobs>1:
+            with Pool(jobs) as pool:
+                yield from pool.imap(parse, names_and_strings, chunksize=chunksize)
+        else:
+            yield from map(parse, names_and_strings)
+
+@timed()
+def corpus_from_inception_export_zip(
+        zip_path,
+        inception_user_name,
+        name = None,
+        wikipedia_page_titles_and_ids_language = None,
+        **documents_from_inception_export_zip_kwargs
+    ) -> Corpus:
+    """Corpus of an inception project export zip, see documents_from_inception_export_zip()"""
+    documents = list(documents_from_inception_export_zip(zip_path, inception_user_name, **documents_from_inception_export_zip_kwargs))
+    corpus = Corpus(name if name is not None else path.splitext(path.basename(zip_path))[0], documents)
+    if wikipedia_page_titles_and_ids_language is not None:
+        wikipedia.corpus_set_annotations_page_titles_and_ids(corpus, wikipedia_page_titles_and_ids_language)
+    return corpus
+
+def document_to_xml_bytes(document, **document_to_xml_string_kwargs) -> Tuple[str, bytes]:
+    """(document name, utf-8 XMI)"""
+    return document.name, document_to_xml_string(document, **document_to_xml_string_kwargs).encode("utf-8")
+
+def document_to_deflated_xml(document, compresslevel=6, **document_to_xml_string_kwargs) -> Tuple[str, bytes, int, int]:
+    """(document name, raw deflate compressed XMI, crc32 and size of the XMI), for zip_write_deflated()"""
+    name, content = document_to_xml_bytes(document, **document_to_xml_string_kwargs)
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+    return name, compressor.compress(content)+compressor.flush(), zlib.crc32(content), len(content)
+
+# zipfile has no public API to append already compressed data: zip_write_deflated() updates the private state of ZipFile
+# as ZipFile.writestr() does in these CPython versions, other versions compress in the calling process with writestr()
+ZIP_WRITE_DEFLATED_PYTHON_VERSIONS = [(3, 8), (3, 9), (3, 10), (3, 11), (3, 12), (3, 13)]
+
+def zip_write_deflated_supported() -> bool:
+    return platform.python_implementation()=="CPython" and sys.version_info[:2] in ZIP_WRITE_DEFLATED_PYTHON_VERSIONS
+
+def zip_write_deflated(zip_file:ZipFile, filename, deflated:bytes, crc, size):
+    """Appends an entry already compressed by document_to_deflated_xml() to zip_file, opened in "w" mode
+
+    does what ZipFile.writestr() does after compressing, only if zip_write_deflated_supported()
+    """
+    if not zip_write_deflated_supported():
+        raise Exception(f"inception.zip_write_deflated(): unsupported python version {platform.python_implementation()} {platform.python_version()}, use ZipFile.writestr()")
+    zinfo = ZipInfo(filename, time.localtime(time.time())[:6])
+    zinfo.compress_type = ZIP_DEFLATED
+    zinfo.external_attr = 0o600 << 16
+    zinfo.CRC, zinfo.compress_size, zinfo.file_size = crc, len(deflated), size
+    zinfo.header_offset = zip_file.fp.tell()
+    zip_file.fp.write(zinfo.FileHeader(size>ZIP64_LIMIT or len(deflated)>ZIP64_LIMIT))
+    zip_file.fp.write(deflated)
+    zip_file.filelist.append(zinfo)
+    zip_file.NameToInfo[filename] = zinfo
+    zip_file.start_dir = zip_file.fp.tell()
+    zip_file._didModify = True
+
+@timed()
+def corpus_to_inception_import_zip(corpus, zip_path, jobs=1, chunksize=16, compresslevel=6, **document_to_xml_string_kwargs):
+    """Writes one XMI entry per document into the zip zip_path, for a bulk upload into inception, without intermediary files
+
+    corpus: Corpus or iterable (e.g. generator) of Documents, streamed into the zip in one sequential write
+    jobs: number of worker processes generating and compressing the XMI, entries being appended by the calling process
+    returns the number of documents written
+    """
+    documents:Iterable[Document] = corpus.documents if isinstance(corpus, Corpus) else corpus
+    n_documents = 0
+    with ZipFile(zip_path, "w", ZIP_DEFLATED, compresslevel=compresslevel) as zip_file:
+        if jobs>1 and zip_write_deflated_supported():
+            deflate = partial(document_to_deflated_xml, compresslevel=compresslevel, **document_to_xml_string_kwargs)
+            with Pool(jobs) as pool:
+                for name, deflated, crc, size in pool.imap(deflate, documents, chunksize=chunksize):
+                    zip_write_deflated(zip_file, name, deflated, crc, size)
+                    n_documents += 1
+        elif jobs>1:
+            with Pool(jobs) as pool:
+                for name, content in pool.imap(partial(document_to_xml_bytes, **document_to_xml_string_kwargs), documents, chunksize=chunksize):
+                    zip_file.writestr(name, content)
+                    n_documents += 1
+        else:
+            for d in documents:
+                zip_file.writestr(d.name, document_to_xml_string(d, **document_to_xml_string_kwargs))
+                n_documents += 1
+    return n_documents
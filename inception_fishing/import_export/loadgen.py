@@ -0,0 +1,116 @@
+"""Load generator of entity-fishing requests: replays the documents of a corpus against a service (or a replay_server)
+
+Closed loop (concurrency): concurrency clients each send their next request as soon as the previous one is answered.
+Open loop (qps): requests are sent at a fixed rate, by at most concurrency clients at once. Latencies are measured from
+the scheduled send time, so that a saturated client or service shows up in the latencies instead of lowering the rate.
+
+Requests go through entity_fishing.document_send_request(), request building and response parsing included, so that
+client-side regressions show up in the report. Documents are cycled through until n_requests or duration is reached.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from threading import Lock
+import time
+from typing import Dict, List, Sequence
+
+import numpy as np
+from requests.exceptions import Timeout
+
+from ..Document import Document
+from . import entity_fishing
+
+
+LOADGEN_PERCENTILES = [50, 95, 99]
+
+
+def _send(document, language, **send_request_kwargs):
+    """(outcome, latency) of one request, outcome being "ok", "timeout" or "error" """
+    start = time.perf_counter()
+    try:
+        entity_fishing.document_send_request(document, language, **send_request_kwargs)
+        outcome = "ok"
+    except Timeout:
+        outcome = "timeout"
+    except Exception:
+        outcome = "error"
+    return outcome, time.perf_counter()-start
+
+def run_load(documents:Sequence[Document], language, n_requests=None, duration=None, concurrency=8, qps=None, **send_request_kwargs) -> Dict:
+    """Sends the requests of documents to entity-fishing (entity_fishing_base_url, transport... in send_request_kwargs), returns the report
+
+    n_requests: number of requests, len(documents) by default, unlimited if duration is given
+    duration: seconds after which no request is sent anymore
+    qps: open loop at qps requests per second, closed loop with concurrency clients if None
+    """
+    if len(documents)==0:
+        raise Exception("inception_fishing.loadgen.run_load(): no documents to send")
+    if n_requests is None and duration is None:
+        n_requests = len(documents)
+    outcomes:List[str] = []
+    latencies:List[float] = []
+    lock = Lock()
+    start = time.perf_counter()
+    def has_next(i):
+        return (n_requests is None or i<n_requests) and (duration is None or time.perf_counter()-start<duration)
+    def record(outcome, latency):
+        with lock:
+            outcomes.append(outcome)
+            latencies.append(latency)
+    if qps is None:
+        indices = count()
+        def client():
+            while True:
+                with lock:
+                    i = next(indices)
+                if not has_next(i):
+                    return
+                record(*_send(documents[i%len(documents)], language, **send_request_kwargs))
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(client)
+    else:
+        def scheduled_send(i, scheduled_time):
+            outcome, _ = _send(documents[i%len(documents)], language, **send_request_kwargs)
+            record(outcome, time.perf_counter()-scheduled_time)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            i = 0
+            while has_next(i):
+                scheduled_time = start+i/qps
+                wait = scheduled_time-time.perf_counter()
+                if wait>0:
+                    time.sleep(wait)
+                executor.submit(scheduled_send, i, scheduled_time)
+                i += 1
+    elapsed = time.perf_counter()-start
+    outcomes, latencies = np.array(outcomes, dtype=str), np.array(latencies, dtype=float)
+    ok_latencies = latencies[outcomes=="ok"]
+    report = {
+        "mode": "open loop" if qps is not None else "closed loop",
+        "concurrency": concurrency,
+        "target_qps": qps,
+        "requests": len(outcomes),
+        "ok": int((outcomes=="ok").sum()),
+        "timeouts": int((outcomes=="timeout").sum()),
+        "errors": int((outcomes=="error").sum()),
+        "seconds": elapsed,
+        "throughput_qps": len(ok_latencies)/elapsed if elapsed>0 else None,
+        "latency_mean_s": float(ok_latencies.mean()) if len(ok_latencies) else None,
+        "latency_max_s": float(ok_latencies.max()) if len(ok_latencies) else None,
+    }
+    for p in LOADGEN_PERCENTILES:
+        report[f"latency_p{p}_s"] = float(np.percentile(ok_latencies, p)) if len(ok_latencies) else None
+    return report
+
+def get_load_report(report:Dict) -> str:
+    """Human readable report of run_load()"""
+    mode = f"{report['mode']}, {report['concurrency']} clients" + (f", target {report['target_qps']} requests/s" if report["target_qps"] is not None else "")
+    lines = [
+        f"{report['requests']} requests ({mode}) in {report['seconds']:.2f}s: {report['ok']} ok, {report['timeouts']} timeouts, {report['errors']} errors",
+        f"throughput: {report['throughput_qps'] or 0:.1f} requests/s",
+    ]
+    if report["ok"]:
+        lines.append(
+            "latency: " + ", ".join(f"p{p} {report[f'latency_p{p}_s']*1000:.1f}ms" for p in LOADGEN_PERCENTILES) +
+            f", mean {report['latency_mean_s']*1000:.1f}ms, max {report['latency_max_s']*1000:.1f}ms"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,291 @@
+"""Native binary columnar corpus format, for fast corpus reload
+
+A corpus is saved as a directory containing:
+- texts.bin: all documents texts concatenated, utf-8 encoded. Memory-mapped at load.
+- strings.bin: the string table, all distinct strings (names, wikidata ids, tags, origins...) utf-8 encoded and concatenated.
+- corpus.npz: per-document offsets in texts.bin and in the annotation columns, and the annotation columns
+  (start, end, wikidata id, grobid tag, origin, ...) as integer arrays, strings being indices in the string table (-1 for None).
+- meta.json: corpus name and format version.
+
+Documents texts and annotations are loaded lazily, on first access.
+"""
+from __future__ import annotations
+import json
+import mmap
+from os import path, makedirs
+from typing import Dict, Sequence
+
+import numpy as np
+
+from ..Annotation import Annotation
+from ..Corpus import Corpus
+from ..Document import Document
+
+
+NATIVE_FORMAT_VERSION = 1
+NATIVE_TEXTS_FILE = "texts.bin"
+NATIVE_STRINGS_FILE = "strings.bin"
+NATIVE_ARRAYS_FILE = "corpus.npz"
+NATIVE_META_FILE = "meta.json"
+
+NATIVE_ANNOTATION_STRING_COLUMNS = [
+    "wikidata_entity_id",
+    "grobid_tag",
+    "origin",
+    "wikipedia_page_id",
+    "wikipedia_page_title",
+    "mention",
+    "extra_fields"
+]
+
+
+class StringTableBuilder:
+    """Interns strings, giving each distinct string an index in the table"""
+    def __init__(self):
+        self.indices:Dict[str, int] = dict()
+        self.strings:Sequence[str] = []
+    def add(self, string):
+        if string is None:
+            return -1
+        index = self.indices.get(string)
+        if index is None:
+            index = len(self.strings)
+            self.indices[string] = index
+            self.strings.append(string)
+        return index
+    def to_bytes_and_offsets(self):
+        encoded = [s.encode("utf-8") for s in self.strings]
+        offsets = np.zeros(len(encoded)+1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return b"".join(encoded), offsets
+
+
+class StringTable:
+    """Read-only string table, strings are decoded on access"""
+    def __init__(self, strings_bytes, offsets):
+        self.strings_bytes = strings_bytes
+        self.offsets = offsets.tolist()
+        self.decoded:Dict[int, str] = dict()
+    def __getitem__(self, index):
+        if index<0:
+            return None
+        string = self.decoded.get(index)
+        if string is None:
+            string = self.strings_bytes[self.offsets[index]:self.offsets[index+1]].decode("utf-8")
+            self.decoded[index] = string
+        return string
+    def __len__(self):
+        return len(self.offsets)-1
+
+
+def _json_default(value):
+    """numpy scalars (e.g. wikipedia page ids read from dataframes) as python scalars"""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"inception_fishing.native: {type(value)} is not JSON serializable")
+
+def _encode_extra_fields(extra_fields):
+    """extra_fields as a json string, None if empty"""
+    if not extra_fields:
+        return None
+    return json.dumps(extra_fields, sort_keys=True, ensure_ascii=False, default=_json_default)
+
+def _encode_wikipedia_page_id(wikipedia_page_id):
+    """wikipedia page id as a json string, None if None
+
+    page ids are either str or int depending on their source, json keeps the type. numpy ids (from the wikipedia
+    titles and ids dataframes) become int, or float if not integral
+    """
+    if wikipedia_page_id is None:
+        return None
+    if isinstance(wikipedia_page_id, np.generic):
+        wikipedia_page_id = wikipedia_page_id.item()
+    if isinstance(wikipedia_page_id, float) and wikipedia_page_id.is_integer():
+        wikipedia_page_id = int(wikipedia_page_id)
+    return json.dumps(wikipedia_page_id)
+
+def _decode_extra_fields(extra_fields_string):
+    if extra_fields_string is None:
+        return dict()
+    return json.loads(extra_fields_string)
+
+
+# Annotation
+# ==============================================
+
+def annotations_to_columns(annotations:Sequence[Annotation], string_table:StringTableBuilder) -> Dict[str, Sequence[int]]:
+    """Returns the annotations as columns of integers, strings are replaced by their index in string_table"""
+    columns = {c: [] for c in ["start", "end"]+NATIVE_ANNOTATION_STRING_COLUMNS}
+    for a in annotations:
+        extra_fields = {k: v for k, v in a.extra_fields.items() if k!="origin"}
+        columns["start"].append(a.start)
+        columns["end"].append(a.end)
+        columns["wikidata_entity_id"].append(string_table.add(a.wikidata_entity_id))
+        columns["grobid_tag"].append(string_table.add(a.grobid_tag))
+        columns["origin"].append(string_table.add(a.extra_fields.get("origin")))
+        columns["wikipedia_page_id"].append(string_table.add(_encode_wikipedia_page_id(a.wikipedia_page_id)))
+        columns["wikipedia_page_title"].append(string_table.add(a.wikipedia_page_title))
+        columns["mention"].append(string_table.add(a.mention))
+        columns["extra_fields"].append(string_table.add(_encode_extra_fields(extra_fields)))
+    return columns
+
+def annotations_from_columns(columns:Dict[str, np.ndarray], string_table:StringTable, start, end) -> Sequence[Annotation]:
+    """Returns the annotations at rows [start, end[ of the columns"""
+    rows = zip(*[columns[c][start:end].tolist() for c in ["start", "end"]+NATIVE_ANNOTATION_STRING_COLUMNS])
+    annotations = []
+    for a_start, a_end, wikidata_id, grobid_tag, origin, wikipedia_page_id, wikipedia_page_title, mention, extra_fields in rows:
+        wikipedia_page_id = string_table[wikipedia_page_id]
+        extra_fields = _decode_extra_fields(string_table[extra_fields])
+        if origin>=0:
+            extra_fields["origin"] = string_table[origin]
+        annotations.append(Annotation(
+            a_start,
+            a_end,
+            string_table[wikidata_id],
+            json.loads(wikipedia_page_id) if wikipedia_page_id is not None else None,
+            string_table[wikipedia_page_title],
+            mention = string_table[mention],
+            grobid_tag = string_table[grobid_tag],
+            extra_fields = extra_fields
+        ))
+    return annotations
+
+# Documents
+# ==============================================
+
+class NativeCorpusReader:
+    """Holds the memory-mapped texts, string table and annotation columns of a native corpus directory
+
+    close() it (or use it as a context manager) once its documents are loaded, lazy documents read from it until then
+    """
+    def __init__(self, dir_path):
+        with open(path.join(dir_path, NATIVE_META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version")!=NATIVE_FORMAT_VERSION:
+            raise Exception(f"inception_fishing.native.NativeCorpusReader() unsupported native format version {self.meta.get('version')} in '{dir_path}', expected {NATIVE_FORMAT_VERSION}")
+        with np.load(path.join(dir_path, NATIVE_ARRAYS_FILE)) as arrays:
+            self.columns = {c: arrays[c] for c in ["start", "end"]+NATIVE_ANNOTATION_STRING_COLUMNS}
+            self.documents_text_offsets = arrays["documents_text_offsets"].tolist()
+            self.documents_annotations_offsets = arrays["documents_annotations_offsets"].tolist()
+            self.documents_names = arrays["documents_names"].tolist()
+            self.documents_extra_fields = arrays["documents_extra_fields"].tolist()
+            strings_offsets = arrays["strings_offsets"]
+        with open(path.join(dir_path, NATIVE_STRINGS_FILE), "rb") as f:
+            self.string_table = StringTable(f.read(), strings_offsets)
+        texts_size = path.getsize(path.join(dir_path, NATIVE_TEXTS_FILE))
+        # mmap refuses empty files, and keeps its own file descriptor: the file is closed once mapped
+        with open(path.join(dir_path, NATIVE_TEXTS_FILE), "rb") as texts_file:
+            self.texts = mmap.mmap(texts_file.fileno(), 0, access=mmap.ACCESS_READ) if texts_size>0 else b""
+    def close(self):
+        if isinstance(self.texts, mmap.mmap):
+            self.texts.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+    def __len__(self):
+        return len(self.documents_names)
+    def get_text(self, i):
+        return self.texts[self.documents_text_offsets[i]:self.documents_text_offsets[i+1]].decode("utf-8")
+    def get_annotations(self, i):
+        return annotations_from_columns(
+            self.columns,
+            self.string_table,
+            self.documents_annotations_offsets[i],
+            self.documents_annotations_offsets[i+1]
+        )
+    def get_document(self, i, lazy=True) -> Document:
+        name = self.string_table[self.documents_names[i]]
+        extra_fields = _decode_extra_fields(self.string_table[self.documents_extra_fields[i]])
+        if lazy:
+            return NativeDocument(name, self, i, extra_fields)
+        return Document(name, self.get_annotations(i), self.get_text(i), extra_fields)
+
+
+class NativeDocument(Document):
+    """Document whose text and annotations are read from a NativeCorpusReader on first access"""
+    def __init__(self, name, reader:NativeCorpusReader, index, extra_fields=None):
+        self._reader = reader
+        self._index = index
+        self._text = None
+        self._annotations = None
+        super().__init__(name, None, None, extra_fields)
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self._reader.get_text(self._index)
+        return self._text
+    @text.setter
+    def text(self, new_text):
+        self._text = new_text
+    @property
+    def annotations(self):
+        if self._annotations is None:
+            self._annotations = self._reader.get_annotations(self._index)
+        return self._annotations
+    @annotations.setter
+    def annotations(self, new_annotations):
+        self._annotations = new_annotations
+    @property
+    def is_loaded(self):
+        return (self._text is not None) and (self._annotations is not None)
+
+
+def document_to_native_columns(document:Document, string_table:StringTableBuilder):
+    """Returns the document's encoded text, name index, extra_fields index and annotations columns"""
+    return (
+        document.text.encode("utf-8"),
+        string_table.add(document.name),
+        string_table.add(_encode_extra_fields(document.extra_fields)),
+        annotations_to_columns(document.annotations, string_table)
+    )
+
+# Corpus
+# ==============================================
+
+def corpus_to_native(corpus:Corpus, dir_path):
+    """Saves the corpus in the native format in directory dir_path (created if needed)"""
+    makedirs(dir_path, exist_ok=True)
+    string_table = StringTableBuilder()
+    columns = {c: [] for c in ["start", "end"]+NATIVE_ANNOTATION_STRING_COLUMNS}
+    documents_text_offsets = [0]
+    documents_annotations_offsets = [0]
+    documents_names = []
+    documents_extra_fields = []
+    with open(path.join(dir_path, NATIVE_TEXTS_FILE), "wb") as texts_file:
+        for d in corpus.documents:
+            text_bytes, name_index, extra_fields_index, document_columns = document_to_native_columns(d, string_table)
+            texts_file.write(text_bytes)
+            documents_text_offsets.append(documents_text_offsets[-1]+len(text_bytes))
+            documents_annotations_offsets.append(documents_annotations_offsets[-1]+len(document_columns["start"]))
+            documents_names.append(name_index)
+            documents_extra_fields.append(extra_fields_index)
+            for c, values in document_columns.items():
+                columns[c].extend(values)
+    strings_bytes, strings_offsets = string_table.to_bytes_and_offsets()
+    with open(path.join(dir_path, NATIVE_STRINGS_FILE), "wb") as strings_file:
+        strings_file.write(strings_bytes)
+    np.savez(
+        path.join(dir_path, NATIVE_ARRAYS_FILE),
+        documents_text_offsets = np.array(documents_text_offsets, dtype=np.int64),
+        documents_annotations_offsets = np.array(documents_annotations_offsets, dtype=np.int64),
+        documents_names = np.array(documents_names, dtype=np.int32),
+        documents_extra_fields = np.array(documents_extra_fields, dtype=np.int32),
+        strings_offsets = strings_offsets,
+        start = np.array(columns["start"], dtype=np.int64),
+        end = np.array(columns["end"], dtype=np.int64),
+        **{c: np.array(columns[c], dtype=np.int32) for c in NATIVE_ANNOTATION_STRING_COLUMNS}
+    )
+    with open(path.join(dir_path, NATIVE_META_FILE), "w", encoding="utf-8") as meta_file:
+        json.dump({"version": NATIVE_FORMAT_VERSION, "name": corpus.name, "documents": len(documents_names)}, meta_file)
+
+def corpus_from_native(dir_path, lazy=True) -> Corpus:
+    """Loads a corpus saved by corpus_to_native()
+
+    lazy=True: documents texts and annotations are only read when accessed, the texts file staying open for them
+    """
+    reader = NativeCorpusReader(dir_path)
+    if lazy:
+        return Corpus(reader.meta["name"], [reader.get_document(i, True) for i in range(len(reader))])
+    with reader:
+        return Corpus(reader.meta["name"], [reader.get_document(i, False) for i in range(len(reader))])
@@ -0,0 +1,104 @@
+"""Local HTTP server replaying recorded entity-fishing responses (see transport.RecordingTransport), with configurable latencies
+
+It answers POSTs to <base url>/service/disambiguate like entity-fishing, so that clients, benchmarks and the load generator
+run offline: inception-fishing replay-server recordings.jsonl --port 8090 --latency lognormal:0.2,0.5
+
+Latency specifications (seconds):
+    recorded            the recorded latency of each response (default)
+    none                no added latency
+    constant:S
+    scaled:F            recorded latency times F
+    uniform:A,B
+    normal:MEAN,STD     clipped at 0
+    lognormal:MEDIAN,SIGMA
+    exponential:MEAN
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+import time
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from .transport import load_recordings, replay_response
+
+
+DEFAULT_REPLAY_PORT = 8090
+REPLAY_DISAMBIGUATE_PATH = "/service/disambiguate"
+
+LatencySampler = Callable[[Optional[float]], float]
+
+
+def latency_sampler(spec="recorded", seed=None) -> LatencySampler:
+    """Returns a function of the recorded latency (None for unrecorded requests) -> latency to wait, see the module docstring for spec"""
+    name, _, parameters = spec.partition(":")
+    values = [float(v) for v in parameters.split(",")] if parameters else []
+    rng = np.random.default_rng(seed)
+    lock = Lock()
+    def sample(draw):
+        with lock:
+            return max(float(draw()), 0.0)
+    samplers = {
+        "recorded": (0, lambda recorded: recorded or 0.0),
+        "none": (0, lambda recorded: 0.0),
+        "constant": (1, lambda recorded: values[0]),
+        "scaled": (1, lambda recorded: (recorded or 0.0)*values[0]),
+        "uniform": (2, lambda recorded: sample(lambda: rng.uniform(values[0], values[1]))),
+        "normal": (2, lambda recorded: sample(lambda: rng.normal(values[0], values[1]))),
+        "lognormal": (2, lambda recorded: sample(lambda: values[0]*np.exp(rng.normal(0, values[1])))),
+        "exponential": (1, lambda recorded: sample(lambda: rng.exponential(values[0]))),
+    }
+    if name not in samplers or len(values)!=samplers[name][0]:
+        raise Exception(f"inception_fishing.replay_server.latency_sampler(): invalid latency specification '{spec}', expected one of recorded, none, constant:S, scaled:F, uniform:A,B, normal:MEAN,STD, lognormal:MEDIAN,SIGMA, exponential:MEAN")
+    return samplers[name][1]
+
+
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.rstrip("/")!=REPLAY_DISAMBIGUATE_PATH:
+            status_code, content, record = 404, b"unknown path", None
+        else:
+            status_code, content, record = replay_response(self.server.recordings, body, self.server.unknown_empty)
+            time.sleep(self.server.latency(record["latency_s"] if record is not None else None))
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json" if status_code==200 else "text/plain")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+    def log_message(self, format, *args):
+        pass
+
+class ReplayServer(ThreadingHTTPServer):
+    """Threaded HTTP server of recordings (see transport.load_recordings()), one thread per connection
+
+    base_url: the entity_fishing_base_url of the clients
+    """
+    daemon_threads = True
+    def __init__(self, recordings:Dict[str, Dict], host="127.0.0.1", port=DEFAULT_REPLAY_PORT, latency="recorded", unknown_empty=False, seed=None):
+        super().__init__((host, port), ReplayRequestHandler)
+        self.recordings = recordings
+        self.latency = latency_sampler(latency, seed) if isinstance(latency, str) else latency
+        self.unknown_empty = unknown_empty
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+    def start(self):
+        """Serves in a background daemon thread, returns self"""
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def serve_replay(record_file, host="127.0.0.1", port=DEFAULT_REPLAY_PORT, latency="recorded", unknown_empty=False, seed=None):
+    """Serves the recordings of record_file until interrupted"""
+    server = ReplayServer(load_recordings(record_file), host, port, latency, unknown_empty, seed)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,81 @@
+"""Scheduling of batches of entity-fishing requests: longest-processing-time-first order and size-adaptive timeouts
+
+With a pool of workers taking documents in order, starting with the longest documents keeps a few long documents from
+being processed last, while all other workers are idle (LPT list scheduling).
+Timeouts are derived per request from a LatencyModel, fitted online to the observed response times, instead of a single
+timeout either too short for long documents or too long for hung requests.
+"""
+from threading import Lock
+from typing import Callable, List, Sequence
+
+import numpy as np
+
+
+# processing estimate of a document before any observation: characters equivalent to one input entity
+ENTITY_COST_CHARACTERS = 200
+
+
+def processing_estimate(text_length, n_entities):
+    """relative processing cost of a document, for longest-processing-time-first ordering"""
+    return text_length+ENTITY_COST_CHARACTERS*n_entities
+
+def lpt_order(items:Sequence, estimate:Callable) -> List:
+    """items sorted by decreasing estimate(item), longest-processing-time-first"""
+    return sorted(items, key=estimate, reverse=True)
+
+
+class LatencyModel:
+    """latency = intercept + a*text length + b*entities, least squares fitted online to the observed latencies
+
+    timeout(): timeout_factor*predicted latency + timeout_margin, within [min_timeout, max_timeout],
+    default_timeout until min_observations latencies were observed. Thread-safe.
+    Timed-out requests are right-censored observations: ignoring them would fit the model to the fast requests only,
+    observe_censored() observes them as censored_factor times the time waited.
+    """
+    def __init__(self, default_timeout=None, min_observations=5, timeout_factor=3.0, timeout_margin=5.0, min_timeout=5.0, max_timeout=600.0, censored_factor=1.5):
+        self.default_timeout = default_timeout
+        self.min_observations = min_observations
+        self.timeout_factor = timeout_factor
+        self.timeout_margin = timeout_margin
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.censored_factor = censored_factor
+        self.n_observations = 0
+        self._xtx = np.zeros((3, 3))
+        self._xty = np.zeros(3)
+        self._coefficients = None
+        self._lock = Lock()
+    @staticmethod
+    def _features(text_length, n_entities):
+        # thousands of characters, for a well conditioned fit
+        return np.array([1.0, text_length/1000, float(n_entities)])
+    def observe(self, text_length, n_entities, latency):
+        x = self._features(text_length, n_entities)
+        with self._lock:
+            self._xtx += np.outer(x, x)
+            self._xty += x*latency
+            self.n_observations += 1
+            self._coefficients = None
+    def observe_censored(self, text_length, n_entities, waited):
+        """observes a request that timed out after waited seconds, its latency being only known to exceed waited"""
+        self.observe(text_length, n_entities, self.censored_factor*waited)
+    def coefficients(self):
+        """(intercept, per thousand characters, per entity) in seconds, None before any observation"""
+        with self._lock:
+            if self.n_observations==0:
+                return None
+            if self._coefficients is None:
+                # slight ridge regularization: few or collinear observations
+                self._coefficients = np.linalg.solve(self._xtx+1e-6*np.eye(3), self._xty)
+            return self._coefficients
+    def predict(self, text_length, n_entities):
+        """predicted latency in seconds, None before any observation"""
+        coefficients = self.coefficients()
+        if coefficients is None:
+            return None
+        return max(float(self._features(text_length, n_entities)@coefficients), 0.0)
+    def timeout(self, text_length, n_entities):
+        if self.n_observations<self.min_observations:
+            return self.default_timeout
+        timeout = self.timeout_factor*self.predict(text_length, n_entities)+self.timeout_margin
+        return min(max(timeout, self.min_timeout), self.max_timeout)
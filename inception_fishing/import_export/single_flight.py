@@ -0,0 +1,128 @@
+"""Single-flight request coalescing with micro-batching
+
+Concurrent callers asking for overlapping keys share one in-flight fetch per key, and the keys pending
+from all callers are fetched together in batches of up to batch_size keys (e.g. the 50 ids per call of
+the wikidata and wikipedia APIs).
+There is no background worker: every caller waits window seconds for other callers' keys to gather, then
+fetches pending batches until its own keys are resolved.
+
+SingleFlightBatcher serves threads, AsyncSingleFlightBatcher serves the coroutines of one event loop.
+"""
+import asyncio
+from concurrent.futures import Future
+from threading import Lock
+import time
+from typing import Callable, Dict, Hashable, List, Sequence
+
+
+class SingleFlightBatcher:
+    """Coalesces the keys of concurrent get() calls into batched calls of fetch_batch
+
+    fetch_batch: function list of keys -> dict key->value, keys missing from the dict get the value None
+    batch_size: max number of keys (or of distinct batch_unit(key)) per fetch_batch call
+    batch_group: function key -> group, keys of a batch all share the same group (e.g. same API endpoint)
+    batch_unit: function key -> what batch_size counts, e.g. the wikidata id of (language, wikidata id) keys,
+        all languages of an id being fetched by one API call
+    window: seconds a caller waits for other callers' keys before fetching an incomplete batch
+    """
+    def __init__(self, fetch_batch:Callable[[List], Dict], batch_size=50, batch_group:Callable=None, window=0.01, batch_unit:Callable=None):
+        self.fetch_batch = fetch_batch
+        self.batch_size = batch_size
+        self.batch_group = batch_group
+        self.batch_unit = batch_unit
+        self.window = window
+        self._lock = Lock()
+        self._inflight:Dict[Hashable, Future] = dict()
+        self._pending:List = []
+
+    def _register(self, keys:Sequence, new_future):
+        """futures of keys, new ones for keys not yet in flight. Call with self._lock held."""
+        futures = dict()
+        for k in keys:
+            f = self._inflight.get(k)
+            if f is None:
+                f = new_future()
+                self._inflight[k] = f
+                self._pending.append(k)
+            futures[k] = f
+        return futures
+
+    def _pop_batch(self):
+        """next batch of pending keys, of the same group as the first pending key. Call with self._lock held."""
+        if self.batch_group is None and self.batch_unit is None:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            return batch
+        batch, rest = [], []
+        units = set()
+        group = self.batch_group(self._pending[0]) if (self.batch_group is not None and len(self._pending)>0) else None
+        for k in self._pending:
+            unit = self.batch_unit(k) if self.batch_unit is not None else k
+            if (self.batch_group is None or self.batch_group(k)==group) and (unit in units or len(units)<self.batch_size):
+                batch.append(k)
+                units.add(unit)
+            else:
+                rest.append(k)
+        self._pending = rest
+        return batch
+
+    def _resolve(self, batch, values:Dict=None, exception:BaseException=None):
+        with self._lock:
+            futures = [self._inflight.pop(k) for k in batch]
+        for k, f in zip(batch, futures):
+            if exception is not None:
+                f.set_exception(exception)
+            else:
+                f.set_result(values.get(k))
+
+    def get(self, keys:Sequence) -> Dict:
+        """Returns the dict key->value of keys, fetched with other callers' keys"""
+        with self._lock:
+            futures = self._register(keys, Future)
+            pending_count = len(self._pending)
+        if self.window>0 and 0<pending_count<self.batch_size:
+            time.sleep(self.window)
+        while True:
+            with self._lock:
+                batch = self._pop_batch()
+            if len(batch)==0:
+                break
+            try:
+                values = self.fetch_batch(batch)
+            except Exception as e:
+                self._resolve(batch, exception=e)
+            else:
+                self._resolve(batch, values)
+        # keys fetched by other callers
+        return {k: f.result() for k, f in futures.items()}
+
+
+class AsyncSingleFlightBatcher(SingleFlightBatcher):
+    """SingleFlightBatcher for the coroutines of one event loop, afetch_batch being a coroutine function"""
+    def __init__(self, afetch_batch:Callable, batch_size=50, batch_group:Callable=None, window=0.01, batch_unit:Callable=None):
+        super().__init__(afetch_batch, batch_size, batch_group, window, batch_unit)
+
+    async def get(self, keys:Sequence) -> Dict:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            futures = self._register(keys, loop.create_future)
+            pending_count = len(self._pending)
+        if self.window>0 and 0<pending_count<self.batch_size:
+            await asyncio.sleep(self.window)
+        fetches = []
+        while True:
+            with self._lock:
+                batch = self._pop_batch()
+            if len(batch)==0:
+                break
+            fetches.append(self._afetch_and_resolve(batch))
+        await asyncio.gather(*fetches)
+        return {k: await f for k, f in futures.items()}
+
+    async def _afetch_and_resolve(self, batch):
+        try:
+            values = await self.fetch_batch(batch)
+        except Exception as e:
+            self._resolve(batch, exception=e)
+        else:
+            self._resolve(batch, values)
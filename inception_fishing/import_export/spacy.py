@@ -6,6 +6,8 @@ from spacy.tokens import Doc, Token
 from ..Annotation import Annotation
 from ..Corpus import Corpus
 from ..Document import Document
+from ..utils import ANNOTATION_ORIGIN_SPACY_TOKEN
+from .spacy_cache import SpacyDocCache
 
 
 # Annotation
@@ -25,7 +27,8 @@ def token_to_annotation(token):
             token.idx,
             token.idx+len(token),
             extra_fields={
-                "type": "spacy_token"
+                "type": "spacy_token",
+                "origin": ANNOTATION_ORIGIN_SPACY_TOKEN
             }
         )
 
@@ -35,9 +38,12 @@ def is_annotation_token(annotation):
 # Documents
 # ==============================================
     
-def document_to_spacy_doc(document, spacy_nlp) -> Doc:
-    """Transforms the Document into a spacy doc, adds annotations to tokens."""
-    spacy_doc:Doc = spacy_nlp(document.text)
+def document_to_spacy_doc(document, spacy_nlp, spacy_cache:SpacyDocCache=None) -> Doc:
+    """Transforms the Document into a spacy doc, adds annotations to tokens.
+
+    spacy_cache: spacy_cache.SpacyDocCache the doc is taken from when the text was processed before, the annotations being added to the cached doc
+    """
+    spacy_doc:Doc = spacy_cache.get_doc(document.text, spacy_nlp) if spacy_cache is not None else spacy_nlp(document.text)
     #print(f"spacy.document_to_spacy_doc() for {document.name}")
     for t in spacy_doc:
         if not t.has_extension("wikidata_entity_id"):
@@ -53,7 +59,11 @@ def document_to_spacy_doc(document, spacy_nlp) -> Doc:
 
 def document_add_tokens_as_annotations(document, spacy_doc):
     tokens_as_annotations = [token_to_annotation(t) for t in spacy_doc]
-    document.annotations = document.annotations + tokens_as_annotations
+    document.add_annotations(tokens_as_annotations)
+
+def document_get_token_annotations(document):
+    """Returns the tokens added by document_add_tokens_as_annotations(), sorted by start"""
+    return document.get_layer(ANNOTATION_ORIGIN_SPACY_TOKEN)
 
 # Corpus
 # ==============================================
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""Persistent cache of processed spacy Docs, so that repeated exports and alignments skip the spacy pipeline
+
+Docs are serialized with DocBin (without user data: annotations are aligned on the cached Doc afterwards, see
+spacy.document_to_spacy_doc()), in <folder>/<model key>/<2 hex digits>/<text sha256>.spacy files, the model key
+hashing the language, name and version of the model, the spacy version and the enabled pipeline components.
+When the cache exceeds max_size_bytes, the least recently used files are removed, down to SPACY_CACHE_EVICTION_RATIO of it.
+
+    cache = SpacyDocCache("spacy-cache/")
+    spacy_doc = spacy.document_to_spacy_doc(document, nlp, cache)
+"""
+import hashlib
+import json
+import os
+from os import path
+import tempfile
+from threading import Lock
+from typing import List, Tuple
+
+import spacy
+from spacy.tokens import Doc, DocBin
+
+from ..instrumentation import timed, increment, COUNTER_CACHE_HITS, COUNTER_CACHE_MISSES
+
+
+SPACY_CACHE_VERSION = 1
+SPACY_CACHE_EXTENSION = ".spacy"
+DEFAULT_SPACY_CACHE_MAX_SIZE_BYTES = 1024**3
+SPACY_CACHE_EVICTION_RATIO = 0.9
+
+
+def spacy_model_key(spacy_nlp) -> str:
+    """hash of the model language, name and version, spacy version and enabled components of spacy_nlp"""
+    meta = spacy_nlp.meta
+    return hashlib.sha256(json.dumps([
+        SPACY_CACHE_VERSION, spacy.__version__,
+        meta.get("lang"), meta.get("name"), meta.get("version"),
+        spacy_nlp.pipe_names
+    ]).encode("utf-8")).hexdigest()[:16]
+
+def text_key(text) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class SpacyDocCache:
+    """Sharded on-disk cache of the spacy Docs of texts, by spacy model, bounded to max_size_bytes. Thread and process safe"""
+    def __init__(self, folder, max_size_bytes=DEFAULT_SPACY_CACHE_MAX_SIZE_BYTES):
+        self.folder = folder
+        self.max_size_bytes = max_size_bytes
+        # estimate of the cache size, rescanned on eviction: other processes may share the folder
+        self._size_bytes = None
+        self._lock = Lock()
+    def doc_path(self, text, spacy_nlp):
+        key = text_key(text)
+        return path.join(self.folder, spacy_model_key(spacy_nlp), key[:2], key+SPACY_CACHE_EXTENSION)
+    def _read(self, file_path, spacy_nlp):
+        try:
+            with open(file_path, "rb") as f:
+                data = f.read()
+            os.utime(file_path)
+            return next(iter(DocBin().from_bytes(data).get_docs(spacy_nlp.vocab)))
+        except (OSError, ValueError, StopIteration):
+            # missing, evicted meanwhile or truncated
+            return None
+    def _write(self, file_path, spacy_doc:Doc):
+        doc_bin = DocBin(store_user_data=False)
+        doc_bin.add(spacy_doc)
+        data = doc_bin.to_bytes()
+        os.makedirs(path.dirname(file_path), exist_ok=True)
+        # a temporary file of its own per writer, threads and processes caching the same text at once included
+        with tempfile.NamedTemporaryFile(dir=path.dirname(file_path), suffix=".tmp", delete=False) as f:
+            f.write(data)
+        os.replace(f.name, file_path)
+        with self._lock:
+            if self._size_bytes is None:
+                self._size_bytes = sum(size for _, _, size in self.entries())
+            else:
+                self._size_bytes += len(data)
+            if self._size_bytes>self.max_size_bytes:
+                self._size_bytes = self.evict(int(self.max_size_bytes*SPACY_CACHE_EVICTION_RATIO))
+    @timed()
+    def get_doc(self, text, spacy_nlp) -> Doc:
+        """spacy_nlp(text), from the cache if text was processed by the same model before"""
+        file_path = self.doc_path(text, spacy_nlp)
+        spacy_doc = self._read(file_path, spacy_nlp) if path.isfile(file_path) else None
+        if spacy_doc is not None:
+            increment(COUNTER_CACHE_HITS, stage="spacy_cache.get_doc")
+            return spacy_doc
+        increment(COUNTER_CACHE_MISSES, stage="spacy_cache.get_doc")
+        spacy_doc = spacy_nlp(text)
+        self._write(file_path, spacy_doc)
+        return spacy_doc
+    def entries(self) -> List[Tuple[str, float, int]]:
+        """(path, last use time, size in bytes) of the cached docs of all models"""
+        entries = []
+        for directory, _, file_names in os.walk(self.folder):
+            for file_name in file_names:
+                if file_name.endswith(SPACY_CACHE_EXTENSION):
+                    try:
+                        stat = os.stat(path.join(directory, file_name))
+                    except FileNotFoundError:
+                        continue
+                    entries.append((path.join(directory, file_name), stat.st_mtime, stat.st_size))
+        return entries
+    def evict(self, target_size_bytes) -> int:
+        """Removes the least recently used docs until the cache is at most target_size_bytes, returns its size"""
+        entries = sorted(self.entries(), key=lambda e: e[1])
+        size_bytes = sum(size for _, _, size in entries)
+        for file_path, _, size in entries:
+            if size_bytes<=target_size_bytes:
+                break
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            size_bytes -= size
+        return size_bytes
+    def clear(self):
+        self._size_bytes = self.evict(0)
@@ -0,0 +1,119 @@
+"""Transports of the entity-fishing requests: the seam between document_send_request() and the HTTP client
+
+A transport is a callable (url, body bytes, timeout) -> (status code, content bytes), raising requests.exceptions.Timeout on timeout.
+document_send_request() uses its transport argument, else the default transport (requests_transport, see set_default_transport()).
+
+RecordingTransport stores the request/response pairs going through another transport in a jsonl file (possibly compressed,
+see compressed_io), ReplayTransport and replay_server.ReplayServer answer them back without any entity-fishing service:
+
+    with RecordingTransport("recordings.jsonl.gz") as recorder:
+        entity_fishing.document_named_entity_linking(document, "fr", transport=recorder)
+    entity_fishing.document_named_entity_linking(document, "fr", transport=ReplayTransport(load_recordings("recordings.jsonl.gz")))
+"""
+import hashlib
+import json
+from threading import Lock
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import requests as r
+
+from .compressed_io import open_file
+
+
+Transport = Callable[[str, bytes, Optional[float]], Tuple[int, bytes]]
+
+REPLAY_NOT_FOUND_STATUS_CODE = 404
+
+
+def requests_transport(url, body:bytes, timeout=None) -> Tuple[int, bytes]:
+    """POSTs the json body to url with requests"""
+    response = r.post(url, data=body, headers={"Content-Type": "application/json"}, timeout=timeout)
+    return response.status_code, response.content
+
+_default_transport:Transport = requests_transport
+
+def set_default_transport(transport:Transport=None):
+    """Sets the transport of the requests sent without transport argument, requests_transport if None"""
+    global _default_transport
+    _default_transport = transport if transport is not None else requests_transport
+
+def get_default_transport() -> Transport:
+    return _default_transport
+
+def request_fingerprint(body:bytes) -> str:
+    """sha256 hex digest of a json request body, independent of its keys order and formatting"""
+    return hashlib.sha256(
+        json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+# Recording
+# ==============================================
+# a recordings file has one json line per request: fingerprint, url, request, status_code, response and latency_s
+
+class RecordingTransport:
+    """Transport recording the request/response pairs of transport (the default transport if None) to record_file, appending to it
+
+    timed-out requests aren't recorded. Close it (or use it as a context manager) to flush the file. Thread-safe.
+    """
+    def __init__(self, record_file, transport:Transport=None):
+        self.transport = transport
+        self._file = open_file(record_file, "a")
+        self._lock = Lock()
+    def __call__(self, url, body:bytes, timeout=None) -> Tuple[int, bytes]:
+        start = time.perf_counter()
+        status_code, content = (self.transport or get_default_transport())(url, body, timeout)
+        record = {
+            "fingerprint": request_fingerprint(body),
+            "url": url,
+            "request": body.decode("utf-8"),
+            "status_code": status_code,
+            "response": content.decode("utf-8", errors="replace"),
+            "latency_s": time.perf_counter()-start,
+        }
+        line = json.dumps(record, ensure_ascii=False)+"\n"
+        with self._lock:
+            self._file.write(line)
+        return status_code, content
+    def close(self):
+        with self._lock:
+            self._file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+
+def load_recordings(record_file) -> Dict[str, Dict]:
+    """fingerprint -> record of a recordings file, the last record of a request winning"""
+    recordings = dict()
+    with open_file(record_file, "r") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                recordings[record["fingerprint"]] = record
+    return recordings
+
+# Replay
+# ==============================================
+
+def replay_response(recordings:Dict[str, Dict], body:bytes, unknown_empty=False) -> Tuple[int, bytes, Optional[Dict]]:
+    """(status code, content, record) of the recorded response to body
+
+    requests without record get a 404, or with unknown_empty an entity-fishing response without entities (and record None)
+    """
+    record = recordings.get(request_fingerprint(body))
+    if record is not None:
+        return record["status_code"], record["response"].encode("utf-8"), record
+    if unknown_empty:
+        query = json.loads(body)
+        return 200, json.dumps({"text": query.get("text"), "language": query.get("language"), "entities": []}).encode("utf-8"), None
+    return REPLAY_NOT_FOUND_STATUS_CODE, b"no recorded response for this request", None
+
+class ReplayTransport:
+    """Transport answering the recorded responses, in process, without waiting (see replay_server for latencies)"""
+    def __init__(self, recordings:Dict[str, Dict], unknown_empty=False):
+        self.recordings = recordings
+        self.unknown_empty = unknown_empty
+    def __call__(self, url, body:bytes, timeout=None) -> Tuple[int, bytes]:
+        status_code, content, _ = replay_response(self.recordings, body, self.unknown_empty)
+        return status_code, content
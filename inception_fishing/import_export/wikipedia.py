@@ -5,8 +5,9 @@ from pandas import isnull
 from ..Annotation import Annotation
 from ..Corpus import Corpus
 from ..Document import Document
+from ..instrumentation import timed, increment, COUNTER_ANNOTATIONS_PROCESSED
 from ..utils import wikidata_entity_base_url
-from .get_wikipedia_page_titles_and_ids_from_wikidata_ids import get_wikipedia_page_titles_and_ids_from_wikidata_ids
+from .get_wikipedia_page_titles_and_ids_from_wikidata_ids import get_wikipedia_page_titles_and_ids_from_wikidata_ids, aget_wikipedia_page_titles_and_ids_from_wikidata_ids
 
 # Annotation
 # ==============================================
@@ -24,47 +25,76 @@ def annotation_set_page_title_and_id(annotation:Annotation, language, wikipedia_
         if annotation.wikipedia_page_title=="null" or isnull(annotation.wikipedia_page_title):
             annotation.wikipedia_page_title = None
         annotation.wikipedia_page_id = annotation_row.wikipedia_id.values[0]
-        if annotation.wikipedia_page_id=="null" or isnull(annotation.wikipedia_page_title):
+        if annotation.wikipedia_page_id=="null" or isnull(annotation.wikipedia_page_id):
             annotation.wikipedia_page_id = None
 
 
-def annotations_get_page_titles_and_ids(annotations:Sequence[Annotation], language):
-    """Gets annotations wikipedia page title and ids from their wikidata id"""
-    wikidata_ids = {
+def annotations_wikidata_ids(annotations:Sequence[Annotation]):
+    return {
         a.wikidata_entity_id
         for a in annotations
         if a.wikidata_entity_id is not None and a.wikidata_entity_id != "None" and \
             a.wikidata_entity_id != "" and a.wikidata_entity_id != "null"
     }
-    return get_wikipedia_page_titles_and_ids_from_wikidata_ids(wikidata_ids, [language])
 
+@timed()
+def annotations_get_page_titles_and_ids(annotations:Sequence[Annotation], language):
+    """Gets annotations wikipedia page title and ids from their wikidata id"""
+    return get_wikipedia_page_titles_and_ids_from_wikidata_ids(annotations_wikidata_ids(annotations), [language])
+
+@timed()
+async def aannotations_get_page_titles_and_ids(annotations:Sequence[Annotation], language, session=None):
+    """async version of annotations_get_page_titles_and_ids()"""
+    return await aget_wikipedia_page_titles_and_ids_from_wikidata_ids(annotations_wikidata_ids(annotations), [language], session=session)
+
+@timed()
 def annotations_set_page_titles_and_ids(annotations:Sequence[Annotation], language, wikipedia_page_titles_and_ids=None):
     if wikipedia_page_titles_and_ids is None:
         wikipedia_page_titles_and_ids = annotations_get_page_titles_and_ids(annotations, language)
+    increment(COUNTER_ANNOTATIONS_PROCESSED, len(annotations), stage="wikipedia.annotations_set_page_titles_and_ids")
     for a in annotations:
         annotation_set_page_title_and_id(a, language, wikipedia_page_titles_and_ids)
     return wikipedia_page_titles_and_ids
 
+@timed()
+async def aannotations_set_page_titles_and_ids(annotations:Sequence[Annotation], language, wikipedia_page_titles_and_ids=None, session=None):
+    """async version of annotations_set_page_titles_and_ids()"""
+    if wikipedia_page_titles_and_ids is None:
+        wikipedia_page_titles_and_ids = await aannotations_get_page_titles_and_ids(annotations, language, session)
+    return annotations_set_page_titles_and_ids(annotations, language, wikipedia_page_titles_and_ids)
+
 # Documents
 # ==============================================
 
 
             
+@timed()
 def document_get_annotations_page_titles_and_ids(document, language):
     return annotations_get_page_titles_and_ids([a for a in document.annotations], language)
+@timed()
 def document_set_annotations_page_titles_and_ids(document, language, wikipedia_page_titles_and_ids=None):
+    # annotations are modified in place: not the ones shared with a clone
+    document.materialize_annotations()
     return annotations_set_page_titles_and_ids([a for a in document.annotations], language, wikipedia_page_titles_and_ids)
+@timed()
+async def adocument_set_annotations_page_titles_and_ids(document, language, wikipedia_page_titles_and_ids=None, session=None):
+    document.materialize_annotations()
+    return await aannotations_set_page_titles_and_ids([a for a in document.annotations], language, wikipedia_page_titles_and_ids, session)
 
 # Corpus
 # ==============================================
 
 
+@timed()
 def corpus_get_annotations_page_titles_and_ids(corpus:Corpus, language):
     return annotations_get_page_titles_and_ids(
         [a for d in corpus.documents for a in d.annotations],
         language
     )
+@timed()
 def corpus_set_annotations_page_titles_and_ids(corpus:Corpus, language, wikipedia_page_titles_and_ids=None):
+    for d in corpus.documents:
+        d.materialize_annotations()
     return annotations_set_page_titles_and_ids(
         [a for d in corpus.documents for a in d.annotations],
         language,
@@ -0,0 +1,143 @@
+"""Offline import of wikidata id -> wikipedia title -> wikipedia page id mappings from dumps
+
+Fills the caches of get_wikipedia_page_titles_and_ids_from_wikidata_ids without network calls, the APIs then
+only being queried for the entities absent from the dumps:
+- wikipedia <lang>wiki-latest-page.sql.gz: (language, wikipedia_title, wikipedia_id) of main namespace pages
+- wikipedia <lang>wiki-latest-page_props.sql.gz: wikidata ids of pages, which with the page dump gives (language, wikidata_id, wikipedia_title)
+- wikidata latest-all.json.gz (or .bz2): (language, wikidata_id, wikipedia_title) from the entities sitelinks
+
+Dumps are streamed and decompressed line by line, rows being gathered into dataframes of chunk_size rows, each imported
+into the in-memory caches once parsed. The caches csv files are written once, at the end of an import.
+https://dumps.wikimedia.org/
+"""
+import json
+import re
+from typing import Dict, Iterator, Sequence, Set, Tuple
+
+import pandas as pd
+
+from ..instrumentation import timed
+from .compressed_io import open_file
+from .get_wikipedia_page_titles_and_ids_from_wikidata_ids import import_into_wikipedia_caches, save_wikipedia_caches
+
+
+DUMP_CHUNK_SIZE = 100000
+
+# start of the rows of INSERT INTO `page` VALUES (page_id,page_namespace,'page_title',...),(...
+PAGE_SQL_MAIN_NAMESPACE_ROW_REGEX = re.compile(r"\((\d+),0,'((?:[^'\\]|\\.)*)',")
+# rows of INSERT INTO `page_props` VALUES (pp_page,'pp_propname','pp_value',pp_sortkey),(...
+PAGE_PROPS_SQL_WIKIBASE_ITEM_ROW_REGEX = re.compile(r"\((\d+),'wikibase_item','(Q\d+)',")
+MYSQL_ESCAPE_REGEX = re.compile(r"\\(.)")
+MYSQL_ESCAPES = {"n": "\n", "r": "\r", "t": "\t", "0": "\0"}
+
+
+def open_dump(file_path):
+    """text stream of a dump, decompressed on the fly (.gz, .bz2, .xz, .zst), see compressed_io.open_file()"""
+    return open_file(file_path, errors="replace")
+
+def _mysql_unescape(value:str):
+    if "\\" not in value:
+        return value
+    return MYSQL_ESCAPE_REGEX.sub(lambda m: MYSQL_ESCAPES.get(m.group(1), m.group(1)), value)
+
+def _dataframes_in_chunks(rows:Iterator[Tuple], columns, chunk_size=DUMP_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk)>=chunk_size:
+            yield pd.DataFrame(chunk, columns=columns)
+            chunk = []
+    if len(chunk)>0:
+        yield pd.DataFrame(chunk, columns=columns)
+
+# Wikipedia SQL dumps
+# ==============================================
+
+def wikipedia_page_dump_rows(page_dump_path) -> Iterator[Tuple[int, str]]:
+    """(page id, title) of the main namespace pages (redirects included, as the API) of a page.sql dump"""
+    with open_dump(page_dump_path) as f:
+        for line in f:
+            if not line.startswith("INSERT INTO"):
+                continue
+            for m in PAGE_SQL_MAIN_NAMESPACE_ROW_REGEX.finditer(line):
+                yield int(m.group(1)), _mysql_unescape(m.group(2)).replace("_", " ")
+
+def wikipedia_page_props_dump_wikidata_ids(page_props_dump_path, wikidata_ids:Set[str]=None) -> Dict[int, str]:
+    """page id -> wikidata id of a page_props.sql dump, only for wikidata_ids if given"""
+    page_wikidata_ids = dict()
+    with open_dump(page_props_dump_path) as f:
+        for line in f:
+            if not line.startswith("INSERT INTO"):
+                continue
+            for m in PAGE_PROPS_SQL_WIKIBASE_ITEM_ROW_REGEX.finditer(line):
+                if wikidata_ids is None or m.group(2) in wikidata_ids:
+                    page_wikidata_ids[int(m.group(1))] = m.group(2)
+    return page_wikidata_ids
+
+@timed()
+def import_wikipedia_dumps(language, page_dump_path, page_props_dump_path=None, wikidata_ids:Sequence[str]=None, chunk_size=DUMP_CHUNK_SIZE, save=True):
+    """Imports the page titles and ids of a wikipedia page.sql dump into the caches
+
+    with page_props_dump_path, the wikidata ids -> titles of the pages are imported too.
+    wikidata_ids: only import the pages of these wikidata ids (requires page_props_dump_path)
+    returns the number of (title, page id) and (wikidata id, title) imported
+    """
+    if wikidata_ids is not None and page_props_dump_path is None:
+        raise Exception("wikipedia_dumps.import_wikipedia_dumps(): filtering by wikidata_ids requires page_props_dump_path")
+    page_wikidata_ids = None
+    if page_props_dump_path is not None:
+        page_wikidata_ids = wikipedia_page_props_dump_wikidata_ids(page_props_dump_path, set(wikidata_ids) if wikidata_ids is not None else None)
+    def page_rows():
+        for page_id, title in wikipedia_page_dump_rows(page_dump_path):
+            wikidata_id = page_wikidata_ids.get(page_id) if page_wikidata_ids is not None else None
+            if wikidata_id is None and wikidata_ids is not None:
+                continue
+            yield (language, wikidata_id, title, str(page_id))
+    n_pages, n_wikidata_ids = 0, 0
+    for dtf in _dataframes_in_chunks(page_rows(), ["language", "wikidata_id", "wikipedia_title", "wikipedia_id"], chunk_size):
+        dtf_lang_wdid_wptitle = dtf.loc[dtf.wikidata_id.notnull(), ["language", "wikidata_id", "wikipedia_title"]]
+        import_into_wikipedia_caches([dtf_lang_wdid_wptitle], [dtf[["language", "wikipedia_title", "wikipedia_id"]]], save=False)
+        n_pages += dtf.shape[0]
+        n_wikidata_ids += dtf_lang_wdid_wptitle.shape[0]
+    if save:
+        save_wikipedia_caches(page_titles=n_wikidata_ids>0, page_ids=n_pages>0)
+    return n_pages, n_wikidata_ids
+
+# Wikidata JSON dump
+# ==============================================
+
+def wikidata_dump_entities(wikidata_dump_path) -> Iterator[Dict]:
+    """entities of a wikidata JSON dump, a JSON array with one entity per line"""
+    with open_dump(wikidata_dump_path) as f:
+        for line in f:
+            line = line.strip().rstrip(",")
+            if line in ("[", "]", ""):
+                continue
+            yield json.loads(line)
+
+@timed()
+def import_wikidata_dump(wikidata_dump_path, languages:Sequence[str], wikidata_ids:Sequence[str]=None, chunk_size=DUMP_CHUNK_SIZE, save=True):
+    """Imports the wikipedia page titles in languages of the entities of a wikidata JSON dump into the page titles cache
+
+    wikidata_ids: only import these entities, their missing sitelinks in languages are then imported as negative entries
+    returns the number of (language, wikidata id) imported
+    """
+    wikidata_ids = set(wikidata_ids) if wikidata_ids is not None else None
+    def sitelinks_rows():
+        for entity in wikidata_dump_entities(wikidata_dump_path):
+            if wikidata_ids is not None and entity["id"] not in wikidata_ids:
+                continue
+            sitelinks = entity.get("sitelinks", {})
+            for language in languages:
+                sitelink = sitelinks.get(language+"wiki")
+                if sitelink is not None:
+                    yield (language, entity["id"], sitelink["title"])
+                elif wikidata_ids is not None:
+                    yield (language, entity["id"], None)
+    n_sitelinks = 0
+    for dtf_lang_wdid_wptitle in _dataframes_in_chunks(sitelinks_rows(), ["language", "wikidata_id", "wikipedia_title"], chunk_size):
+        import_into_wikipedia_caches([dtf_lang_wdid_wptitle], (), save=False)
+        n_sitelinks += dtf_lang_wdid_wptitle.shape[0]
+    if save and n_sitelinks>0:
+        save_wikipedia_caches(page_ids=False)
+    return n_sitelinks
@@ -0,0 +1,198 @@
+"""Lightweight instrumentation: per-stage timers and counters
+
+Disabled by default: timed functions then only check one global flag before calling the wrapped function.
+Once enabled, each call of a timed function or timer() block records its duration in the histogram of its stage,
+and increment() accumulates counters (bytes sent, entities returned, cache hits and misses, annotations processed...).
+
+    from inception_fishing import instrumentation
+    instrumentation.enable_instrumentation()
+    dhs_article.link_entities(article)
+    print(instrumentation.get_report())
+    instrumentation.export_json("timings.json")
+"""
+from __future__ import annotations
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from inspect import iscoroutinefunction
+import json
+from threading import Lock
+import time
+from typing import Dict, Sequence
+
+
+# histogram buckets upper bounds, in seconds
+DEFAULT_HISTOGRAM_BUCKETS = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120]
+
+COUNTER_BYTES_SENT = "bytes_sent"
+COUNTER_BYTES_RECEIVED = "bytes_received"
+COUNTER_ENTITIES_RETURNED = "entities_returned"
+COUNTER_CACHE_HITS = "cache_hits"
+COUNTER_CACHE_MISSES = "cache_misses"
+COUNTER_CACHE_STALE = "cache_stale"
+COUNTER_ANNOTATIONS_PROCESSED = "annotations_processed"
+COUNTER_API_REQUESTS = "api_requests"
+
+
+class StageStats:
+    """Duration statistics and histogram of one stage"""
+    def __init__(self, buckets:Sequence[float]=DEFAULT_HISTOGRAM_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0]*(len(buckets)+1) # last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+    def record(self, duration):
+        self.count += 1
+        self.total += duration
+        self.min = duration if (self.min is None or duration<self.min) else self.min
+        self.max = duration if (self.max is None or duration>self.max) else self.max
+        self.bucket_counts[bisect_left(self.buckets, duration)] += 1
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_s": self.total,
+            "mean_s": self.total/self.count if self.count>0 else None,
+            "min_s": self.min,
+            "max_s": self.max,
+            "histogram": {
+                **{str(b): c for b, c in zip(self.buckets, self.bucket_counts)},
+                "+Inf": self.bucket_counts[-1]
+            }
+        }
+
+
+INSTRUMENTATION_ENABLED = False
+STAGES:Dict[str, StageStats] = dict()
+COUNTERS:Dict[str, Dict[str, float]] = dict()
+_lock = Lock()
+
+def enable_instrumentation():
+    global INSTRUMENTATION_ENABLED
+    INSTRUMENTATION_ENABLED = True
+
+def disable_instrumentation():
+    global INSTRUMENTATION_ENABLED
+    INSTRUMENTATION_ENABLED = False
+
+def reset_instrumentation():
+    with _lock:
+        STAGES.clear()
+        COUNTERS.clear()
+
+def record_duration(stage, duration):
+    with _lock:
+        stats = STAGES.get(stage)
+        if stats is None:
+            stats = StageStats()
+            STAGES[stage] = stats
+        stats.record(duration)
+
+def increment(counter, value=1, stage=None):
+    """Adds value to counter, for the given stage (None: global counter). No-op when instrumentation is disabled."""
+    if not INSTRUMENTATION_ENABLED:
+        return
+    with _lock:
+        stage_counters = COUNTERS.setdefault(stage, dict())
+        stage_counters[counter] = stage_counters.get(counter, 0)+value
+
+@contextmanager
+def timer(stage):
+    """Context manager recording the duration of its block in stage"""
+    if not INSTRUMENTATION_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_duration(stage, time.perf_counter()-start)
+
+def timed(stage=None):
+    """Decorator recording the duration of each call of the decorated function (or coroutine function)
+
+    stage defaults to "<module>.<function name>", module being the last part of the module path
+    """
+    def decorator(f):
+        stage_name = stage if stage is not None else f"{f.__module__.split('.')[-1]}.{f.__name__}"
+        if iscoroutinefunction(f):
+            @wraps(f)
+            async def async_wrapper(*args, **kwargs):
+                if not INSTRUMENTATION_ENABLED:
+                    return await f(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await f(*args, **kwargs)
+                finally:
+                    record_duration(stage_name, time.perf_counter()-start)
+            return async_wrapper
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not INSTRUMENTATION_ENABLED:
+                return f(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                record_duration(stage_name, time.perf_counter()-start)
+        return wrapper
+    return decorator
+
+# Export
+# ==============================================
+
+def get_stats() -> Dict:
+    with _lock:
+        return {
+            "stages": {stage: stats.to_dict() for stage, stats in STAGES.items()},
+            "counters": {(stage if stage is not None else "global"): dict(c) for stage, c in COUNTERS.items()}
+        }
+
+def export_json(filepath=None):
+    """Returns the aggregated stages and counters as a json string, also written to filepath if given"""
+    json_stats = json.dumps(get_stats(), indent=2)
+    if filepath is not None:
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write(json_stats)
+    return json_stats
+
+def _prometheus_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def export_prometheus(prefix="inception_fishing", filepath=None):
+    """Returns the aggregated stages and counters in Prometheus text exposition format, also written to filepath if given"""
+    lines = [
+        f"# HELP {prefix}_stage_seconds duration of inception_fishing stages",
+        f"# TYPE {prefix}_stage_seconds histogram"
+    ]
+    with _lock:
+        for stage, stats in STAGES.items():
+            label = f'stage="{_prometheus_label(stage)}"'
+            cumulative = 0
+            for b, c in zip(stats.buckets, stats.bucket_counts):
+                cumulative += c
+                lines.append(f'{prefix}_stage_seconds_bucket{{{label},le="{b}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{{label},le="+Inf"}} {stats.count}')
+            lines.append(f"{prefix}_stage_seconds_sum{{{label}}} {stats.total}")
+            lines.append(f"{prefix}_stage_seconds_count{{{label}}} {stats.count}")
+        lines.append(f"# HELP {prefix}_events_total inception_fishing counters")
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for stage, counters in COUNTERS.items():
+            for counter, value in counters.items():
+                lines.append(f'{prefix}_events_total{{stage="{_prometheus_label(stage if stage is not None else "global")}",counter="{_prometheus_label(counter)}"}} {value}')
+    prometheus_text = "\n".join(lines)+"\n"
+    if filepath is not None:
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write(prometheus_text)
+    return prometheus_text
+
+def get_report():
+    """Human-readable per-stage timing report, slowest total first"""
+    stats = get_stats()
+    lines = [f"{'stage':<70} {'calls':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10}"]
+    for stage, s in sorted(stats["stages"].items(), key=lambda x: -x[1]["total_s"]):
+        lines.append(f"{stage:<70} {s['count']:>8} {s['total_s']:>10.3f} {s['mean_s']*1000:>10.2f} {s['max_s']*1000:>10.2f}")
+    for stage, counters in stats["counters"].items():
+        lines.append(f"{stage}: " + ", ".join(f"{k}={v}" for k, v in counters.items()))
+    return "\n".join(lines)
@@ -80,4 +80,6 @@ ANNOTATION_ORIGIN_DHS_ARTICLE_TITLE = "dhs_article_title"
 ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_BLOCK = "dhs_article_text_block"
 ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_LINK = "dhs_article_text_links"
 ANNOTATION_ORIGIN_ENTITY_FISHING = "entity_fishing"
-
+ANNOTATION_ORIGIN_SPACY_TOKEN = "spacy_token"
+ANNOTATION_ORIGIN_CLEF_HIPE = "clef_hipe"
+ANNOTATION_ORIGIN_GAZETTEER = "gazetteer"
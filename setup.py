@@ -12,9 +12,17 @@ setup(
         'requests>=2.22.0',
         'lxml>=4.5.0',
         'pandas>=1.3.3',
+        'numpy>=1.19.0',
         'spacy==3.2.0'
     ],
+    extras_require={
+        'async': ['aiohttp>=3.7'],
+        'zstd': ['zstandard>=0.15'],
+    },
     setup_requires=['wheel'],
+    entry_points={
+        'console_scripts': ['inception-fishing=inception_fishing.cli:main'],
+    },
     classifiers=[
         'Intended Audience :: Science/Research',
         'Programming Language :: Python :: 3.5',
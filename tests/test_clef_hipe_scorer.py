@@ -0,0 +1,59 @@
+import numpy as np
+
+from inception_fishing import Annotation, Document
+from inception_fishing.import_export import clef_hipe_scorer
+
+
+TSV = """TOKEN\tNE-COARSE-LIT\tNE-COARSE-METO\tNE-FINE-LIT\tNE-FINE-METO\tNE-FINE-COMP\tNE-NESTED\tNEL-LIT\tNEL-METO\tMISC
+# language = fr
+# newspaper = GDL
+# document_id = doc1
+# segment_iiif_link = iiif1a
+Lausanne\tB-loc\tO\tB-loc.adm.town\tO\tO\tO\tQ807\t_\t_
+# segment_iiif_link = iiif1b
+Suisse\tB-loc\tO\tB-loc.adm.nat\tO\tO\tO\tQ39\t_\t_
+# language = de
+# newspaper = NZZ
+# document_id = doc2
+# segment_iiif_link = iiif2a
+Zürich\tB-loc\tO\tB-loc.adm.town\tO\tO\tO\tQ72\t_\t_
+"""
+
+def test_segment_metadata_belongs_to_its_document(tmp_path):
+    file_path = tmp_path/"hipe.tsv"
+    file_path.write_text(TSV, encoding="utf-8")
+    documents = list(clef_hipe_scorer.documents_from_conllu_tsv(str(file_path)))
+    assert [d.name for d in documents]==["doc1", "doc2"]
+    assert documents[0].extra_fields["hipe_metadata"]=={"language": "fr", "newspaper": "GDL", "segment_iiif_link": ["iiif1a", "iiif1b"]}
+    assert documents[1].extra_fields["hipe_metadata"]=={"language": "de", "newspaper": "NZZ", "segment_iiif_link": ["iiif2a"]}
+    assert [a.wikidata_entity_id for a in documents[0].annotations]==["Q807", "Q39"]
+
+def test_iob_tags():
+    token_starts = np.array([0, 5, 10, 15, 20])
+    tags = clef_hipe_scorer.iob_tags(token_starts, np.array([5, 15]), np.array([14, 16]), ["loc", None])
+    assert tags.tolist()==["O", "B-loc", "I-loc", "O", "O"]
+    tags = clef_hipe_scorer.iob_tags(token_starts, np.array([0, 20]), np.array([4, 25]), ["Q1", "Q2"], default="-", iob_prefixes=False)
+    assert tags.tolist()==["Q1", "-", "-", "-", "Q2"]
+
+def test_hipe_columns_of_nested_annotations():
+    text = "Université de Lausanne en Suisse"
+    document = Document("doc", [
+        Annotation(0, 22, "Q658975", grobid_tag="INSTITUTION"),
+        Annotation(14, 22, "Q807", grobid_tag="LOCATION"),
+        Annotation(26, 32, "Q39", grobid_tag="LOCATION"),
+    ], text)
+    token_starts, _ = clef_hipe_scorer.FastTokenizer().tokens_offsets(text)
+    columns = clef_hipe_scorer.document_to_hipe_columns(document, token_starts)
+    assert columns["NE-COARSE-LIT"].tolist()==["B-org", "I-org", "I-org", "O", "B-loc"]
+    assert columns["NE-NESTED"].tolist()==["O", "O", "B-loc", "O", "O"]
+    assert columns["NEL-LIT"].tolist()==["Q658975", "Q658975", "Q658975", "-", "Q39"]
+    assert columns["NE-FINE-LIT"].tolist()==["O"]*5
+
+def test_conllu_tsv_columns_kwargs():
+    document = Document("doc", [Annotation(0, 8, "Q807", grobid_tag="LOCATION", wikipedia_page_id=42)], "Lausanne est en Suisse")
+    tsv = clef_hipe_scorer.document_to_conllu_tsv(
+        document, clef_hipe_scorer.FastTokenizer(),
+        tsv_columns={"NE-COARSE-LIT": "O", "NEL-LIT": "_"},
+        tsv_col_to_token_extension={"NEL-LIT": "wikipedia_page_id"}
+    )
+    assert tsv.splitlines()[-4:]==["Lausanne\tB-loc\t42", "est\tO\t_", "en\tO\t_", "Suisse\tO\t_"]
@@ -0,0 +1,72 @@
+import pytest
+
+from inception_fishing import Annotation, Corpus, Document
+
+
+def make_corpus(names=("a", "b", "c", "d", "e")):
+    return Corpus("corpus", [Document(name, [Annotation(0, 1, "Q1")], "text") for name in names])
+
+def test_get_first_document_of_a_name():
+    corpus = make_corpus(("a", "b", "a"))
+    assert corpus.get("a") is corpus.documents[0]
+    assert corpus.get("z") is None
+    assert corpus.get("z", "default")=="default"
+    assert "b" in corpus and "z" not in corpus
+
+def test_names_index_rebuilt_after_documents_change():
+    corpus = make_corpus(("a", "b"))
+    assert corpus.get("c") is None
+    corpus.documents.append(Document("c", [], "text"))
+    assert corpus.get("c") is corpus.documents[2]
+    corpus.documents = [Document("d", [], "text")]
+    assert corpus.get("a") is None
+    assert corpus.get("d") is corpus.documents[0]
+
+def test_shard():
+    corpus = make_corpus()
+    assert [[d.name for d in corpus.shard(2, i)] for i in range(2)]==[["a", "c", "e"], ["b", "d"]]
+    assert [d.name for d in corpus.shard(1, 0)]==["a", "b", "c", "d", "e"]
+    with pytest.raises(Exception):
+        list(corpus.shard(2, 2))
+
+def test_batches():
+    corpus = make_corpus()
+    assert [[d.name for d in batch] for batch in corpus.batches(2)]==[["a", "b"], ["c", "d"], ["e"]]
+    assert list(make_corpus(()).batches(2))==[]
+    with pytest.raises(Exception):
+        list(corpus.batches(0))
+
+def test_merge():
+    corpus = make_corpus(("a", "b"))
+    other = Corpus("other", [
+        Document("b", [Annotation(0, 1, "Q1"), Annotation(2, 4, "Q2")], "text"),
+        Document("c", [Annotation(0, 1, "Q3")], "text"),
+    ])
+    corpus.merge(other)
+    assert [a.wikidata_entity_id for a in corpus.get("b").annotations]==["Q1", "Q2"]
+    # added annotations are copies
+    assert corpus.get("b").annotations[1] is not other.documents[0].annotations[1]
+    assert corpus.get("c") is None
+    corpus.merge(other, skip_duplicates=False, add_missing_documents=True)
+    assert [a.wikidata_entity_id for a in corpus.get("b").annotations]==["Q1", "Q2", "Q1", "Q2"]
+    assert corpus.get("c") is not other.documents[1]
+    assert [a.wikidata_entity_id for a in corpus.get("c").annotations]==["Q3"]
+    assert len(other.documents[0].annotations)==2
+
+def test_merge_by_key_function():
+    corpus = make_corpus(("A",))
+    corpus.merge(Corpus("other", [Document("a", [Annotation(2, 4, "Q2")], "text")]), key=lambda d: d.name.lower())
+    assert [a.wikidata_entity_id for a in corpus.get("A").annotations]==["Q1", "Q2"]
+
+def test_merge_clones_only_appended_documents(monkeypatch):
+    clones = []
+    deepcopy = Document.__deepcopy__
+    def counting_deepcopy(self, memo=None):
+        clones.append(self.name)
+        return deepcopy(self, memo)
+    monkeypatch.setattr(Document, "__deepcopy__", counting_deepcopy)
+    other = make_corpus(("b", "y", "z"))
+    make_corpus(("a", "b")).merge(other)
+    assert clones==[]
+    make_corpus(("a", "b")).merge(other, add_missing_documents=True)
+    assert clones==["y", "z"]
@@ -0,0 +1,25 @@
+from types import SimpleNamespace
+
+from inception_fishing import Annotation, Document
+from inception_fishing.import_export import dhs_article as dhs
+from inception_fishing.utils import ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_BLOCK, ANNOTATION_ORIGIN_ENTITY_FISHING, ANNOTATION_ORIGIN_GAZETTEER
+
+
+def test_reintegrated_text_links_in_start_order(monkeypatch):
+    monkeypatch.setattr(dhs, "get_infos_from_wikidata_id", lambda wikidata_id: None)
+    text = "Lausanne est en Suisse\nZurich et Berne"
+    annotations = [
+        Annotation(0, 22, extra_fields={"origin": ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_BLOCK}),
+        Annotation(23, 38, extra_fields={"origin": ANNOTATION_ORIGIN_DHS_ARTICLE_TEXT_BLOCK}),
+        Annotation(33, 38, "Q70", extra_fields={"origin": ANNOTATION_ORIGIN_GAZETTEER}),
+        Annotation(16, 22, "Q39", extra_fields={"origin": ANNOTATION_ORIGIN_ENTITY_FISHING}),
+        Annotation(0, 8, "Q807", extra_fields={"origin": ANNOTATION_ORIGIN_GAZETTEER}),
+        Annotation(23, 29, "Q72", extra_fields={"origin": ANNOTATION_ORIGIN_ENTITY_FISHING}),
+    ]
+    document = Document("doc", annotations, text)
+    article = SimpleNamespace(language="fr", text_links=[[], []])
+    dhs.document_reintegrate_annotations_into_dhs_article(document, article)
+    assert [[(l["annotation"]["wikidata_entity_id"], l["start"], l["origin"]) for l in text_links] for text_links in article.text_links]==[
+        [("Q807", 0, ANNOTATION_ORIGIN_GAZETTEER), ("Q39", 16, ANNOTATION_ORIGIN_ENTITY_FISHING)],
+        [("Q72", 0, ANNOTATION_ORIGIN_ENTITY_FISHING), ("Q70", 10, ANNOTATION_ORIGIN_GAZETTEER)],
+    ]
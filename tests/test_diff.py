@@ -0,0 +1,61 @@
+from inception_fishing import Annotation, Corpus, Document
+from inception_fishing import diff
+
+
+def changes_summary(changes):
+    return [(change, (o.start, o.end) if o is not None else None, (n.start, n.end) if n is not None else None) for change, o, n in changes]
+
+def test_change_types():
+    old = [
+        Annotation(0, 8, "Q807", grobid_tag="LOC"),
+        Annotation(16, 22, "Q39", grobid_tag="LOC"),
+        Annotation(30, 36, "Q72", grobid_tag="LOC"),
+        Annotation(40, 45, "Q1", grobid_tag="PER"),
+        Annotation(50, 55, "Q2", grobid_tag="PER"),
+    ]
+    new = [
+        Annotation(0, 8, "Q807", grobid_tag="LOC"),
+        Annotation(16, 22, "Q70", grobid_tag="LOC"),
+        Annotation(30, 36, "Q72", grobid_tag="ORG"),
+        Annotation(40, 47, "Q1", grobid_tag="PER"),
+        Annotation(60, 65, "Q3", grobid_tag="PER"),
+    ]
+    assert changes_summary(diff.annotations_diff(old, new, include_unchanged=True))==[
+        (diff.DIFF_UNCHANGED, (0, 8), (0, 8)),
+        (diff.DIFF_RELINKED, (16, 22), (16, 22)),
+        (diff.DIFF_RETAGGED, (30, 36), (30, 36)),
+        (diff.DIFF_BOUNDARY_CHANGED, (40, 45), (40, 47)),
+        (diff.DIFF_REMOVED, (50, 55), None),
+        (diff.DIFF_ADDED, None, (60, 65)),
+    ]
+
+def test_nested_boundary_change_pairs_same_wikidata_id():
+    old = [Annotation(0, 100, "Q1"), Annotation(50, 55, "Q2")]
+    new = [Annotation(50, 56, "Q2")]
+    assert changes_summary(diff.annotations_diff(old, new))==[
+        (diff.DIFF_REMOVED, (0, 100), None),
+        (diff.DIFF_BOUNDARY_CHANGED, (50, 55), (50, 56)),
+    ]
+
+def test_boundary_change_pairs_largest_overlap():
+    old = [Annotation(0, 10, "Q1"), Annotation(8, 20, "Q1")]
+    new = [Annotation(9, 21, "Q1")]
+    assert changes_summary(diff.annotations_diff(old, new))==[
+        (diff.DIFF_REMOVED, (0, 10), None),
+        (diff.DIFF_BOUNDARY_CHANGED, (8, 20), (9, 21)),
+    ]
+
+def test_corpus_diff_and_dataframe():
+    text = "Lausanne est en Suisse"
+    old_corpus = Corpus("old", [Document("a", [Annotation(0, 8, "Q807")], text), Document("b", [Annotation(16, 22, "Q39")], text)])
+    new_corpus = Corpus("new", [Document("a", [Annotation(0, 8, "Q70")], text), Document("c", [Annotation(16, 22, "Q39")], text)])
+    diffs = diff.corpus_diff(old_corpus, new_corpus)
+    assert {name: [c for c, _, _ in changes] for name, changes in diffs.items()}=={
+        "a": [diff.DIFF_RELINKED], "b": [diff.DIFF_REMOVED], "c": [diff.DIFF_ADDED]
+    }
+    dtf = diff.diff_to_dataframe(diffs)
+    assert list(dtf.document)==["a", "b", "c"]
+    assert list(dtf.change)==[diff.DIFF_RELINKED, diff.DIFF_REMOVED, diff.DIFF_ADDED]
+    assert dtf.old_wikidata_entity_id.tolist()[:2]==["Q807", "Q39"]
+    assert dtf.old_wikidata_entity_id.isna().tolist()==[False, False, True]
+    assert dtf.new_start.isna().tolist()==[False, True, False]
@@ -0,0 +1,61 @@
+import pandas as pd
+
+from inception_fishing import Annotation, Document
+from inception_fishing.import_export import entity_fishing, wikipedia
+
+
+def make_document():
+    return Document("doc", [Annotation(0, 8, "Q807", extra_fields={"origin": "entity_fishing"})], "Lausanne est en Suisse")
+
+def test_clone_wikipedia_setter_leaves_original_unchanged():
+    original = make_document()
+    clone = original.__deepcopy__()
+    titles_and_ids = pd.DataFrame({"wikidata_id": ["Q807"], "language": ["fr"], "wikipedia_title": ["Lausanne"], "wikipedia_id": [42]})
+    wikipedia.document_set_annotations_page_titles_and_ids(clone, "fr", titles_and_ids)
+    assert clone.annotations[0].wikipedia_page_title=="Lausanne"
+    assert original.annotations[0].wikipedia_page_title is None
+    assert original.annotations[0].wikipedia_page_id is None
+
+def test_clone_augment_leaves_original_unchanged():
+    original = make_document()
+    clone = original.__deepcopy__()
+    entity_fishing.document_augment_from_json_response(clone, {"entities": [{"offsetStart": 16, "offsetEnd": 22, "rawName": "Suisse", "wikidataId": "Q39"}]})
+    assert len(clone.annotations)==2
+    assert len(original.annotations)==1
+    # appending doesn't copy the existing annotations
+    assert clone.annotations[0] is original.annotations[0]
+    assert "entity_fishing_response" not in original.extra_fields
+    clone.materialize_annotations()
+    clone.annotations[0].start = 1
+    assert original.annotations[0].start==0
+
+def test_clone_annotations_list_is_not_shared():
+    original = make_document()
+    assert original.layer_names==["entity_fishing"]
+    clone = original.__deepcopy__()
+    clone.annotations.append(Annotation(16, 22, "Q39", extra_fields={"origin": "entity_fishing"}))
+    assert len(original.annotations)==1
+    assert len(original.get_layer("entity_fishing"))==1
+    assert len(clone.get_layer("entity_fishing"))==2
+    del original.annotations[0]
+    assert len(clone.annotations)==2
+    assert original.layer_names==[]
+
+def test_layers_follow_in_place_modifications():
+    document = make_document()
+    assert document.layer_names==["entity_fishing"]
+    document.annotations[0] = Annotation(16, 22, "Q39", extra_fields={"origin": "gazetteer"})
+    document.invalidate_layers()
+    assert document.layer_names==["gazetteer"]
+    document.annotations[0].extra_fields["origin"] = "entity_fishing"
+    document.invalidate_layers()
+    assert [a.wikidata_entity_id for a in document.get_layer("entity_fishing")]==["Q39"]
+    assert document.get_layer("gazetteer")==[]
+
+def test_layers_of_clone_after_replace_span():
+    original = make_document()
+    original.add_annotations([Annotation(16, 22, "Q39", extra_fields={"origin": "gazetteer"})])
+    clone = original.__deepcopy__()
+    clone.replace_span(0, 8, "Lsn")
+    assert [(a.start, a.end) for a in clone.get_layer("gazetteer")]==[(11, 17)]
+    assert [(a.start, a.end) for a in original.get_layer("gazetteer")]==[(16, 22)]
@@ -0,0 +1,63 @@
+import json
+
+from requests.exceptions import Timeout
+
+from inception_fishing.Corpus import Corpus
+from inception_fishing.Document import Document
+from inception_fishing.import_export import entity_fishing
+from inception_fishing.import_export.scheduling import LatencyModel
+
+
+timeouts = []
+
+def slow_transport(url, body, timeout=None):
+    """entity-fishing answering without entities, timing out the "slow" texts unless given 10s or more, failing on "broken" texts"""
+    query = json.loads(body)
+    timeouts.append((query["text"], timeout))
+    if "slow" in query["text"] and (timeout is None or timeout<10):
+        raise Timeout()
+    if "broken" in query["text"]:
+        return 500, b"internal error"
+    return 200, json.dumps({"text": query["text"], "language": query["language"], "entities": []}).encode("utf-8")
+
+def test_latency_model_observes_censored_timeouts():
+    latency_model = LatencyModel(censored_factor=2.0)
+    latency_model.observe_censored(1000, 0, 3.0)
+    assert latency_model.n_observations==1
+    assert abs(latency_model.predict(1000, 0)-6.0)<1e-3
+
+def test_timed_out_documents_are_retried_and_reported():
+    corpus = Corpus("corpus", [Document("fast", [], "fast text"), Document("slow", [], "slow text")])
+    latency_model = LatencyModel(default_timeout=1, max_timeout=10)
+    report = entity_fishing.corpus_named_entity_linking(corpus, "fr", jobs=2, latency_model=latency_model, transport=slow_transport)
+    assert report["timed_out_documents"]==["slow"]
+    assert report["failed_documents"]==[]
+    assert all("entity_fishing_response" in d.extra_fields for d in corpus.documents)
+    assert latency_model.n_observations==3
+    assert "1 timed out" in entity_fishing.get_linking_report(report)
+
+def test_documents_timing_out_again_are_reported():
+    corpus = Corpus("corpus", [Document("slow", [], "slow text")])
+    latency_model = LatencyModel(default_timeout=1, max_timeout=5)
+    report = entity_fishing.corpus_named_entity_linking(corpus, "fr", jobs=1, latency_model=latency_model, transport=slow_transport)
+    assert report["failed_documents"]==["slow"]
+    assert "entity_fishing_response" not in corpus.documents[0].extra_fields
+    assert latency_model.n_observations==2
+
+def test_caller_timeout_caps_the_requests_and_the_retry():
+    timeouts.clear()
+    corpus = Corpus("corpus", [Document("slow", [], "slow text")])
+    latency_model = LatencyModel(default_timeout=1, max_timeout=600)
+    report = entity_fishing.corpus_named_entity_linking(corpus, "fr", jobs=1, latency_model=latency_model, transport=slow_transport, entity_fishing_timeout=0.5)
+    assert timeouts==[("slow text", 0.5), ("slow text", 0.5)]
+    assert report["retry_timeout_s"]==0.5
+    assert report["failed_documents"]==["slow"]
+
+def test_errors_are_reported_without_aborting_the_run():
+    corpus = Corpus("corpus", [Document("fast", [], "fast text"), Document("broken", [], "broken text")])
+    report = entity_fishing.corpus_named_entity_linking(corpus, "fr", jobs=2, transport=slow_transport)
+    assert list(report["errors"].keys())==["broken"]
+    assert report["timed_out_documents"]==[]
+    assert "entity_fishing_response" in corpus.documents[0].extra_fields
+    assert "entity_fishing_response" not in corpus.documents[1].extra_fields
+    assert "1 failed" in entity_fishing.get_linking_report(report)
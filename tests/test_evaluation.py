@@ -0,0 +1,32 @@
+from inception_fishing import Annotation, Corpus, Document, evaluation
+
+
+def corpus(annotations):
+    return Corpus("corpus", [Document("doc", annotations, "Lausanne est en Suisse, à côté du lac Léman")])
+
+def test_duplicated_predictions_are_false_positives():
+    gold = corpus([Annotation(0, 8, "Q807", grobid_tag="LOCATION")])
+    predicted = corpus([Annotation(0, 8, "Q807", grobid_tag="LOCATION"), Annotation(0, 8, "Q807", grobid_tag="LOCATION")])
+    scores = evaluation.evaluate_corpus(gold, predicted)["micro"]
+    for matching in (evaluation.MATCHING_STRICT, evaluation.MATCHING_FUZZY, evaluation.MATCHING_NEL):
+        assert scores[matching]["matched_predicted"]==1
+        assert scores[matching]["precision"]==0.5
+        assert scores[matching]["recall"]==1.0
+
+def test_fuzzy_matching_is_one_to_one():
+    # a single long prediction overlapping two gold annotations matches only one of them
+    gold = corpus([Annotation(0, 8, grobid_tag="LOCATION"), Annotation(16, 22, grobid_tag="LOCATION")])
+    predicted = corpus([Annotation(0, 22, grobid_tag="LOCATION")])
+    fuzzy = evaluation.evaluate_corpus(gold, predicted)["micro"][evaluation.MATCHING_FUZZY]
+    assert (fuzzy["matched_predicted"], fuzzy["matched_gold"])==(1, 1)
+    # [5, 22) overlaps both gold annotations, [2, 5) only the first one: the maximum matching pairs all of them
+    predicted = corpus([Annotation(2, 5, grobid_tag="LOCATION"), Annotation(5, 22, grobid_tag="LOCATION")])
+    fuzzy = evaluation.evaluate_corpus(gold, predicted)["micro"][evaluation.MATCHING_FUZZY]
+    assert (fuzzy["matched_predicted"], fuzzy["matched_gold"])==(2, 2)
+
+def test_strict_scores_per_tag():
+    gold = corpus([Annotation(0, 8, grobid_tag="LOCATION"), Annotation(16, 22, grobid_tag="LOCATION")])
+    predicted = corpus([Annotation(0, 8, grobid_tag="LOCATION"), Annotation(16, 22, grobid_tag="PERSON")])
+    scores = evaluation.evaluate_corpus(gold, predicted)
+    assert scores["tags"]["LOCATION"][evaluation.MATCHING_STRICT]["recall"]==0.5
+    assert scores["tags"]["PERSON"][evaluation.MATCHING_STRICT]["precision"]==0.0
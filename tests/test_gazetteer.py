@@ -0,0 +1,17 @@
+from inception_fishing.import_export import gazetteer
+
+
+CSV_HEADER = "item,dhsid,itemLabel,namefr,namede,nameit,nameen\n"
+
+def write_links(file_path, rows):
+    file_path.write_text(CSV_HEADER+"".join(",".join(r)+"\n" for r in rows), encoding="utf-8")
+    return str(file_path)
+
+def test_gazetteer_reads_only_its_links_file(tmp_path):
+    file_a = write_links(tmp_path/"a.csv", [("http://www.wikidata.org/entity/Q807", "001", "Lausanne", "Lausanne", "Lausanne", "Losanna", "Lausanne")])
+    file_b = write_links(tmp_path/"b.csv", [("http://www.wikidata.org/entity/Q72", "002", "Zurich", "Zurich", "Zürich", "Zurigo", "Zurich")])
+    gazetteer.load_gazetteer(file_a, cache_file=False)
+    labels_b = gazetteer.labels_from_wikidata_links(file_b)
+    assert labels_b=={"Zurich": ["Q72"], "Zürich": ["Q72"], "Zurigo": ["Q72"]}
+    gazetteer_b = gazetteer.load_gazetteer(file_b, cache_file=str(tmp_path/"b.pickle"))
+    assert gazetteer_b.matches("Lausanne et Zurich")==[(12, 18, ("Q72",))]
@@ -0,0 +1,48 @@
+from zipfile import ZipFile, ZIP_DEFLATED
+
+import pytest
+
+from inception_fishing.Annotation import Annotation
+from inception_fishing.Corpus import Corpus
+from inception_fishing.Document import Document
+from inception_fishing.import_export import inception
+
+
+def make_corpus():
+    return Corpus("corpus", [
+        Document(f"doc{i}.xmi", [Annotation(0, 8, "Q807", grobid_tag="LOC")], "Lausanne est en Suisse "*(i+1))
+        for i in range(5)
+    ])
+
+@pytest.mark.parametrize("jobs,deflated_supported", [(1, True), (2, True), (2, False)])
+def test_import_zip_entries(tmp_path, monkeypatch, jobs, deflated_supported):
+    monkeypatch.setattr(inception, "zip_write_deflated_supported", lambda: deflated_supported)
+    corpus = make_corpus()
+    zip_path = str(tmp_path/"import.zip")
+    assert inception.corpus_to_inception_import_zip(corpus, zip_path, jobs=jobs)==5
+    with ZipFile(zip_path) as zip_file:
+        assert zip_file.testzip() is None
+        assert zip_file.namelist()==[d.name for d in corpus.documents]
+        for d in corpus.documents:
+            assert zip_file.read(d.name).decode("utf-8")==inception.document_to_xml_string(d)
+
+def test_zip_write_deflated_unsupported(tmp_path, monkeypatch):
+    monkeypatch.setattr(inception, "zip_write_deflated_supported", lambda: False)
+    with ZipFile(str(tmp_path/"import.zip"), "w") as zip_file:
+        with pytest.raises(Exception):
+            inception.zip_write_deflated(zip_file, *inception.document_to_deflated_xml(make_corpus().documents[0]))
+
+@pytest.mark.parametrize("deflated_supported", [True, False])
+def test_cli_xmi_zip(tmp_path, monkeypatch, deflated_supported):
+    from inception_fishing import cli
+    monkeypatch.setattr(inception, "zip_write_deflated_supported", lambda: deflated_supported)
+    corpus = make_corpus()
+    for d in corpus.documents:
+        (tmp_path/"xmi"/d.name).mkdir(parents=True)
+        inception.document_to_xml_file(d, str(tmp_path/"xmi"/d.name), "u.xmi")
+    zip_path = str(tmp_path/"import.zip")
+    cli.main(["convert", "--from", "xmi-dir", str(tmp_path/"xmi"), "--user", "u", "--to", "xmi-zip", zip_path])
+    with ZipFile(zip_path) as zip_file:
+        assert zip_file.testzip() is None
+        assert zip_file.namelist()==[d.name for d in corpus.documents]
+        assert all(info.compress_type==ZIP_DEFLATED for info in zip_file.infolist())
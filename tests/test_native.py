@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from inception_fishing import Annotation, Corpus, Document
+from inception_fishing.import_export import native
+
+
+def make_corpus():
+    return Corpus("corpus", [
+        Document("d1", [
+            Annotation(0, 8, "Q807", np.int64(42), "Lausanne", mention="Lausanne", grobid_tag="LOCATION", extra_fields={"origin": "entity_fishing", "confidence_score": 0.5}),
+            Annotation(16, 22, "Q39", np.float64(7.0), mention="Suisse", extra_fields={"origin": "dhs_article_text_link"}),
+            Annotation(9, 12, None, "12", extra_fields={}),
+        ], "Lausanne est en Suisse, à côté du lac", {"entity_fishing_response": {"runtime": 12}}),
+        Document("empty", [], ""),
+    ])
+
+def annotation_tuple(a):
+    return (a.start, a.end, a.wikidata_entity_id, a.wikipedia_page_id, a.wikipedia_page_title, a.mention, a.grobid_tag, a.extra_fields)
+
+@pytest.mark.parametrize("lazy", [True, False])
+def test_native_round_trip(tmp_path, lazy):
+    corpus = make_corpus()
+    native.corpus_to_native(corpus, tmp_path)
+    loaded = native.corpus_from_native(tmp_path, lazy=lazy)
+    assert loaded.name==corpus.name
+    assert [d.name for d in loaded.documents]==[d.name for d in corpus.documents]
+    for d, loaded_d in zip(corpus.documents, loaded.documents):
+        assert loaded_d.text==d.text
+        assert loaded_d.extra_fields==d.extra_fields
+        assert [annotation_tuple(a) for a in loaded_d.annotations]==[annotation_tuple(a) for a in d.annotations]
+    page_ids = [a.wikipedia_page_id for a in loaded.documents[0].annotations]
+    assert page_ids==[42, 7, "12"]
+    assert [type(i) for i in page_ids]==[int, int, str]
+
+def test_native_reader_close(tmp_path):
+    native.corpus_to_native(make_corpus(), tmp_path)
+    with native.NativeCorpusReader(tmp_path) as reader:
+        assert reader.get_text(0).startswith("Lausanne")
+    assert reader.texts.closed
@@ -0,0 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import spacy
+
+from inception_fishing.import_export.spacy_cache import SpacyDocCache
+
+
+def test_threads_caching_the_same_text(tmp_path):
+    nlp = spacy.blank("fr")
+    cache = SpacyDocCache(str(tmp_path))
+    text = "Lausanne est en Suisse. "*200
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        docs = list(executor.map(lambda _: cache.get_doc(text, nlp), range(32)))
+    assert all(d.text==text for d in docs)
+    assert [os.path.basename(p) for p, _, _ in cache.entries()]==[os.path.basename(cache.doc_path(text, nlp))]
+    assert not [f for _, _, files in os.walk(tmp_path) for f in files if f.endswith(".tmp")]
+    assert cache.get_doc(text, nlp).text==text
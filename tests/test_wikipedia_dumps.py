@@ -0,0 +1,113 @@
+from os import path
+
+import pandas as pd
+import pytest
+
+from inception_fishing.import_export import get_wikipedia_page_titles_and_ids_from_wikidata_ids as wiki
+from inception_fishing.import_export import wikipedia_dumps
+
+
+FIXTURES_FOLDER = path.join(path.dirname(__file__), "fixtures")
+PAGE_DUMP = path.join(FIXTURES_FOLDER, "frwiki-page.sql.gz")
+PAGE_PROPS_DUMP = path.join(FIXTURES_FOLDER, "frwiki-page_props.sql.gz")
+WIKIDATA_DUMP = path.join(FIXTURES_FOLDER, "wikidata.json.gz")
+
+
+@pytest.fixture
+def empty_caches(tmp_path, monkeypatch):
+    """empty wikipedia caches, saved in tmp_path"""
+    monkeypatch.setattr(wiki, "DTF_LANG_WDID_WPTITLE", pd.DataFrame(columns=wiki.DTF_LANG_WDID_WPTITLE_COLUMNS))
+    monkeypatch.setattr(wiki, "DTF_LANG_WPTITLE_WPID", pd.DataFrame(columns=wiki.DTF_LANG_WPTITLE_WPID_COLUMNS))
+    monkeypatch.setattr(wiki, "DTF_LANG_WDID_WPTITLE_FILE", str(tmp_path/"wikidata_id_wikipedia_title.csv"))
+    monkeypatch.setattr(wiki, "DTF_LANG_WPTITLE_WPID_FILE", str(tmp_path/"wikipedia_title_and_id.csv"))
+    monkeypatch.setattr(wiki, "DTF_LANG_WDID_WPTITLE_WPID_FILE", str(tmp_path/"wikidata_id_wikipedia_title_and_id.csv"))
+
+def cached_rows(dtf, columns):
+    return sorted(tuple(None if pd.isnull(v) else v for v in row) for row in dtf[columns].itertuples(index=False))
+
+def test_page_dump_rows_main_namespace_unescaped():
+    assert list(wikipedia_dumps.wikipedia_page_dump_rows(PAGE_DUMP))==[(1, "Lausanne"), (3, "L'Isle"), (4, "Canton de Vaud")]
+
+def test_page_props_dump_wikidata_ids():
+    assert wikipedia_dumps.wikipedia_page_props_dump_wikidata_ids(PAGE_PROPS_DUMP)=={1: "Q807", 2: "Q99999", 3: "Q69", 4: "Q12771"}
+    assert wikipedia_dumps.wikipedia_page_props_dump_wikidata_ids(PAGE_PROPS_DUMP, {"Q69"})=={3: "Q69"}
+
+def test_import_wikipedia_dumps(empty_caches):
+    assert wikipedia_dumps.import_wikipedia_dumps("fr", PAGE_DUMP, PAGE_PROPS_DUMP, save=False)==(3, 3)
+    assert cached_rows(wiki.DTF_LANG_WPTITLE_WPID, ["language", "wikipedia_title", "wikipedia_id"])==[
+        ("fr", "Canton de Vaud", "4"), ("fr", "L'Isle", "3"), ("fr", "Lausanne", "1")
+    ]
+    assert cached_rows(wiki.DTF_LANG_WDID_WPTITLE, ["language", "wikidata_id", "wikipedia_title"])==[
+        ("fr", "Q12771", "Canton de Vaud"), ("fr", "Q69", "L'Isle"), ("fr", "Q807", "Lausanne")
+    ]
+
+def test_import_wikipedia_dumps_of_wikidata_ids(empty_caches):
+    assert wikipedia_dumps.import_wikipedia_dumps("fr", PAGE_DUMP, PAGE_PROPS_DUMP, wikidata_ids=["Q69"], save=False)==(1, 1)
+    assert cached_rows(wiki.DTF_LANG_WPTITLE_WPID, ["language", "wikipedia_title", "wikipedia_id"])==[("fr", "L'Isle", "3")]
+    with pytest.raises(Exception):
+        wikipedia_dumps.import_wikipedia_dumps("fr", PAGE_DUMP, wikidata_ids=["Q69"], save=False)
+
+def test_import_wikidata_dump_negative_sitelinks(empty_caches):
+    assert wikipedia_dumps.import_wikidata_dump(WIKIDATA_DUMP, ["fr"], save=False)==2
+    assert wikipedia_dumps.import_wikidata_dump(WIKIDATA_DUMP, ["fr", "de"], wikidata_ids=["Q69", "Q72"], save=False)==4
+    assert cached_rows(wiki.DTF_LANG_WDID_WPTITLE, ["language", "wikidata_id", "wikipedia_title"])==[
+        ("de", "Q69", None), ("de", "Q72", "Zürich"), ("fr", "Q69", "L'Isle"), ("fr", "Q72", None), ("fr", "Q807", "Lausanne")
+    ]
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+    def json(self):
+        return self.data
+
+def test_only_entities_absent_from_dumps_are_queried(empty_caches, monkeypatch):
+    wikipedia_dumps.import_wikipedia_dumps("fr", PAGE_DUMP, PAGE_PROPS_DUMP, save=False)
+    requests = []
+    def get(url, params):
+        requests.append((url, params))
+        if url==wiki.WIKIDATA_API_URL:
+            return FakeResponse({"entities": {"Q72": {"sitelinks": {"frwiki": {"title": "Zurich"}}}}})
+        return FakeResponse({"query": {"pages": {"72": {"title": "Zurich"}}}})
+    monkeypatch.setattr(wiki.r, "get", get)
+    dtf = wiki.get_wikipedia_page_titles_and_ids_from_wikidata_ids(["Q807", "Q69", "Q72"], ["fr"])
+    assert [(url, params.get("ids", params.get("titles"))) for url, params in requests]==[
+        (wiki.WIKIDATA_API_URL, "Q72"), (wiki._wikipedia_api_url("fr"), "Zurich")
+    ]
+    assert cached_rows(dtf, ["wikidata_id", "wikipedia_title", "wikipedia_id"])==[
+        ("Q69", "L'Isle", "3"), ("Q72", "Zurich", "72"), ("Q807", "Lausanne", "1")
+    ]
+
+def test_dumps_imported_chunk_by_chunk_and_saved_once(empty_caches, monkeypatch):
+    imported_chunks, saves = [], []
+    def import_into_wikipedia_caches(dtfs_lang_wdid_wptitle=(), dtfs_lang_wptitle_wpid=(), save=True):
+        imported_chunks.append([d.shape[0] for d in list(dtfs_lang_wdid_wptitle)+list(dtfs_lang_wptitle_wpid)])
+        assert not save
+        return wiki.import_into_wikipedia_caches(dtfs_lang_wdid_wptitle, dtfs_lang_wptitle_wpid, save)
+    monkeypatch.setattr(wikipedia_dumps, "import_into_wikipedia_caches", import_into_wikipedia_caches)
+    monkeypatch.setattr(wikipedia_dumps, "save_wikipedia_caches", lambda **kwargs: saves.append(kwargs))
+    assert wikipedia_dumps.import_wikipedia_dumps("fr", PAGE_DUMP, PAGE_PROPS_DUMP, chunk_size=1)==(3, 3)
+    assert imported_chunks==[[1, 1]]*3
+    assert wikipedia_dumps.import_wikidata_dump(WIKIDATA_DUMP, ["fr"], chunk_size=1)==2
+    assert len(imported_chunks)==5
+    assert saves==[{"page_titles": True, "page_ids": True}, {"page_ids": False}]
+    assert cached_rows(wiki.DTF_LANG_WDID_WPTITLE, ["language", "wikidata_id", "wikipedia_title"])==[
+        ("fr", "Q12771", "Canton de Vaud"), ("fr", "Q69", "L'Isle"), ("fr", "Q807", "Lausanne")
+    ]
+
+def test_dumps_import_saves_the_caches(empty_caches):
+    wikipedia_dumps.import_wikipedia_dumps("fr", PAGE_DUMP, PAGE_PROPS_DUMP)
+    assert cached_rows(pd.read_csv(wiki.DTF_LANG_WPTITLE_WPID_FILE, dtype=str), ["language", "wikipedia_title", "wikipedia_id"])==[
+        ("fr", "Canton de Vaud", "4"), ("fr", "L'Isle", "3"), ("fr", "Lausanne", "1")
+    ]
+    assert pd.read_csv(wiki.DTF_LANG_WDID_WPTITLE_FILE).shape[0]==3
+
+def test_titles_and_ids_saved_by_default(empty_caches):
+    wikipedia_dumps.import_wikipedia_dumps("fr", PAGE_DUMP, PAGE_PROPS_DUMP, save=False)
+    wiki.get_wikipedia_page_titles_and_ids_from_wikidata_ids(["Q807"], ["fr"], save=False)
+    assert not path.isfile(wiki.DTF_LANG_WDID_WPTITLE_WPID_FILE)
+    dtf = wiki.get_wikipedia_page_titles_and_ids_from_wikidata_ids(["Q807"], ["fr"])
+    assert cached_rows(dtf, ["wikidata_id", "wikipedia_title", "wikipedia_id"])==[("Q807", "Lausanne", "1")]
+    # all the cached entries, not only the requested ones
+    assert cached_rows(pd.read_csv(wiki.DTF_LANG_WDID_WPTITLE_WPID_FILE, dtype=str), ["wikidata_id", "wikipedia_title", "wikipedia_id"])==[
+        ("Q12771", "Canton de Vaud", "4"), ("Q69", "L'Isle", "3"), ("Q807", "Lausanne", "1")
+    ]